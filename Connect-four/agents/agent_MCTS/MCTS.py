@@ -1,80 +1,137 @@
 import numpy as np
-from typing import Optional
+from typing import Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
 import time
-from agents.common import BoardPiece, PlayerAction, SavedState, PLAYER1, PLAYER2, NO_PLAYER, GameState, HEIGHT, WIDTH
-from agents.common import connected_four, check_end_state, apply_player_action, find_columns
+from agents.common import BoardPiece, PlayerAction, SavedState, PLAYER1, PLAYER2, NO_PLAYER, HEIGHT, WIDTH
+from agents.common import apply_player_action, Position
+from agents.agent_MCTS.tree import TreeStore, ROOT, NODE_CAPACITY, distinct_moves_mask
+from agents.agent_MCTS.rollout import batch_rollout, random_policy, RolloutPolicy
+from agents.book import book_move
+from agents.tablebase import tablebase_move, TABLEBASE_SHARE
+from agents.instrumentation import report, profiling
+from agents.time_manager import Clock, TimeManager, move_budget, end_move
+from agents.kernels import jit_enabled
 
 PLAYER = NO_PLAYER
 OPPONENT = NO_PLAYER
-Timeout = 20
+MOVE_TIME = 5.0  # seconds searched per move when neither a time budget nor a time manager is given
+VIRTUAL_LOSS = 1  # losses added along a path while its rollout runs in tree-parallel mode
+ROLLOUTS_PER_LEAF = 32  # random games played at once from every selected leaf
+CLOCK_ROLLOUTS = 64  # rollouts played between two readings of the clock
 
 
-# Nodes of MCTS
-class Node:
-    # Data structure to keep track of our search
-    def __init__(self, move=None, parent=None, state=None, player=None):
-        self.state = state
-        self.parent = parent
-        self.move = move
-        self.player = player
-        self.untriedMoves = self.getMoves()
-        self.childNodes = []
-        self.wins = 0
-        self.visits = 0
+class MCTSStats:
+    """
+    Statistics of a search: the iterations run, the number of nodes of the
+    tree, the depth of the deepest node selected, the histogram of the rollout
+    lengths (rollout_lengths[n] rollouts ended after n moves) and the seconds
+    spent in every phase of the iterations.
+    """
 
-    def getMoves(self) -> np.ndarray:
-        """
-        returns an array of available moves
-        """
-        if check_end_state(self.state, self.player) == GameState.IS_WIN:
-            return np.array([])  # if terminal state, return empty an array
-        else:
-            return np.array(find_columns(self.state))
+    PHASES = ('select', 'expand', 'rollout', 'backprop')
+
+    def __init__(self, n_cells: int = HEIGHT * WIDTH):
+        self.iterations = 0
+        self.tree_size = 0
+        self.max_depth = 0
+        self.rollout_lengths = np.zeros(n_cells + 1, dtype=np.int64)
+        self.phase_seconds = dict.fromkeys(self.PHASES, 0.0)
 
-    def selection(self):
+    def merge(self, other: 'MCTSStats'):
         """
-        return child with largest UCT value
+        Adds the statistics of a search run in parallel with this one.
         """
-        bestScore = -10000000.0
-        bestChildren = None
+        self.iterations += other.iterations
+        self.tree_size += other.tree_size
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.rollout_lengths += other.rollout_lengths
+        for phase in self.PHASES:
+            self.phase_seconds[phase] += other.phase_seconds[phase]
 
-        for child in self.childNodes:
-            score = child.wins / child.visits + np.sqrt(2) * np.sqrt(
-                np.log(self.visits) / child.visits)
-            if score > bestScore:
-                bestChildren = child
-                bestScore = score
-        return bestChildren
+    def as_dict(self) -> dict:
+        n_rollouts = int(self.rollout_lengths.sum())
+        mean_length = float(self.rollout_lengths @ np.arange(self.rollout_lengths.size)) / max(n_rollouts, 1)
+        return {
+            'iterations': self.iterations,
+            'tree_size': self.tree_size,
+            'max_depth': self.max_depth,
+            'rollouts': n_rollouts,
+            'mean_rollout_length': mean_length,
+            'rollout_lengths': self.rollout_lengths.tolist(),
+            'phase_seconds': dict(self.phase_seconds),
+        }
 
-    def expand(self, action: PlayerAction):
-        """
-        return child when move is taken
-        """
-        opponent = PLAYER1
-        if self.player == PLAYER1:
-            opponent = PLAYER2
-        new_board, original_board = apply_player_action(
-            self.state.copy(), action, opponent)
-        child = Node(move=action, parent=self,
-                     state=new_board, player=opponent)
-        self.childNodes.append(child)
-        # remove move from current node
-        self.untriedMoves = np.setdiff1d(self.untriedMoves, action)
-
-        return child
-
-    def update(self, result: int):
+
+class MCTSState(SavedState):
+    """
+    Keeps the search tree between moves. The root of `tree` is the node reached
+    by the agent's last move on `board`, its children are the replies of the opponent.
+    """
+
+    def __init__(self, player: BoardPiece):
+        self.player = player
+        self.tree = None
+        self.board = None
+        self.stats = None  # statistics of the last move, see agents.instrumentation
+        self.time_manager = None
+
+    def find_root(self, board: np.ndarray) -> Optional[TreeStore]:
         """
-        Update the win and visits value of a node
+        Compacts the tree to the subtree matching `board` (the opponent's
+        reply, see TreeStore.compact) and hands it over, no longer keeping it,
+        or returns None if there is none. On a symmetric board only half of
+        the replies are in the tree, the others are found as the mirrored
+        subtree of their mirror.
         """
-        self.wins += result
-        self.visits += 1
+        if self.tree is None or board.shape != self.board.shape:
+            return None
+        changed = np.flatnonzero((board != self.board).any(axis=0))
+        if len(changed) != 1 or np.count_nonzero(board) != np.count_nonzero(self.board) + 1:
+            return None
+        mirrored = self.board.shape[1] - 1 - changed[0]
+        tree = self.tree
+        for child in tree.children(ROOT):
+            if tree.visits[child] == 0:
+                continue
+            if tree.move[child] == changed[0]:
+                tree.compact(child)
+            elif tree.move[child] == mirrored and np.array_equal(self.board, self.board[:, ::-1]):
+                tree.compact(child)
+                tree.mirror()
+            else:
+                continue
+            self.tree = self.board = None
+            return tree
+        return None
 
 
 # Monte Carlo Tree Search
 def generate_move_MCTS(board: np.ndarray, player: BoardPiece,
-                       saved_state: Optional[SavedState]) \
+                       saved_state: Optional[SavedState],
+                       n_workers: int = 1, seed: Optional[int] = None, tree_parallel: bool = False,
+                       node_capacity: int = NODE_CAPACITY, n_rollouts: int = ROLLOUTS_PER_LEAF,
+                       time_budget: Optional[float] = None, time_manager: Optional[TimeManager] = None,
+                       rave_equivalence: float = 0, rollout_policy: RolloutPolicy = random_policy) \
         -> object:
+    """
+    Plays the book move if `board` is in the opening book, the tablebase
+    move if it is in the endgame tablebase, or the forced move if there is one
+    (see Position.forced_move). Otherwise searches in a tree of at most
+    `node_capacity` nodes, playing `n_rollouts` random games at once from
+    every leaf, for `time_budget` seconds, or the budget given by the time
+    manager (see agents.time_manager.move_budget), or MOVE_TIME seconds. The
+    search stops early once the move cannot change (see decided). With a
+    positive `rave_equivalence` the selection uses RAVE (see TreeStore.selection).
+    The moves of the rollouts are chosen by `rollout_policy` (see
+    agents.agent_MCTS.rollout), it must be picklable to be sent to the workers.
+    With `n_workers` > 1 the search runs in a process pool: by default every
+    worker searches its own tree and the root statistics are merged (root
+    parallelism, the tree is not kept for the next move); with `tree_parallel`
+    the rollouts of one shared tree are run by the workers using virtual loss.
+    `seed` seeds the random generators of the workers.
+    The statistics of the move are reported to agents.instrumentation.
+    """
 
     global PLAYER
     global OPPONENT
@@ -85,76 +142,372 @@ def generate_move_MCTS(board: np.ndarray, player: BoardPiece,
     else:
         OPPONENT = PLAYER1
 
-    action = MCTS(board)
-    return PlayerAction(action), SavedState()
-
-
-def MCTS(board: np.ndarray) -> PlayerAction:
-
-    rootNode = Node(state=board, player=PLAYER)
-    itermax = 100000
-    start = time.time()
-    global Timeout
-    for i in range(itermax):
-
-        node = rootNode
-
-        #############
-        # selection #
-        #############
-        # keep going down the tree based on best UCT values until terminal or unexpanded node
-        while not np.any(node.untriedMoves) and node.childNodes != []:
-            node = node.selection()
-
-        #############
-        #  Expand   #
-        #############
-        if np.any(node.untriedMoves):
-            # Choose a random action from available moves
-            action = np.random.choice(node.untriedMoves)
-            node = node.expand(action)
-
-        #############
-        #  rollout  #
-        #############
-        board = node.state.copy()
-        win_game_flag = False
-        currentPlayer = node.player
-        while np.any(find_columns(board)) and not win_game_flag:
-            if currentPlayer == PLAYER2:
-                currentPlayer = PLAYER1
-            else:
-                currentPlayer = PLAYER2
-            action = np.random.choice(find_columns(board))
-            board, _ = apply_player_action(board, action, currentPlayer)
-            win_game_flag = connected_four(board, currentPlayer)
-
-        #################
-        # backpropagate #
-        #################
-        if win_game_flag:
-            if currentPlayer == PLAYER:
-                result = 1  # The player won
-            else:
-                result = -1  # The player lost against the opponent
-        else:
-            result = 0
-        while node is not None:
-            node.update(result)
-            node = node.parent
+    if not isinstance(saved_state, MCTSState) or saved_state.player != player:
+        saved_state = MCTSState(player)
+    start = time.perf_counter()
+    with profiling():
+        budget = move_budget(saved_state, board, time_budget, time_manager, MOVE_TIME)
+        action, source, stats = _generate_move(board, player, saved_state, budget, n_workers, seed, tree_parallel,
+                                               node_capacity, n_rollouts, rave_equivalence, rollout_policy)
+        end_move(saved_state)
+    saved_state.stats = {'source': source, 'seconds': time.perf_counter() - start}
+    if stats is not None:
+        saved_state.stats.update(stats.as_dict())
+    report('mcts', saved_state.stats)
+    return PlayerAction(action), saved_state
 
-        duration = time.time() - start
-        if duration > Timeout:
+
+def _generate_move(board: np.ndarray, player: BoardPiece, saved_state: MCTSState, budget: float,
+                   n_workers: int, seed: Optional[int], tree_parallel: bool, node_capacity: int,
+                   n_rollouts: int, rave_equivalence: float,
+                   rollout_policy: RolloutPolicy) -> Tuple[int, str, Optional[MCTSStats]]:
+    """
+    The move of generate_move_MCTS.
+    :return: the move, where it comes from ('book', 'tablebase', 'forced' or
+             'search') and the statistics of the search, if any
+    """
+    deadline = time.monotonic() + budget
+    action = book_move(board, player)
+    if action is not None:
+        saved_state.tree = None
+        return action, 'book', None
+    action = tablebase_move(board, player, TABLEBASE_SHARE * budget)
+    if action is not None:
+        saved_state.tree = None
+        return action, 'tablebase', None
+    budget = max(0.0, deadline - time.monotonic())  # the rest of the budget, after the tablebase
+    action = Position.from_board(board, player).forced_move()
+    if action is not None:
+        saved_state.tree = None
+        return action, 'forced', None
+    stats = MCTSStats(board.size)
+    if n_workers > 1 and not tree_parallel:
+        saved_state.tree = None
+        action = MCTS_root_parallel(board, n_workers, seed, node_capacity, n_rollouts, stats, budget,
+                                    rave_equivalence, rollout_policy)
+        return action, 'search', stats
+
+    tree = saved_state.find_root(board)
+    if tree is None:
+        tree = TreeStore(OPPONENT, distinct_moves_mask(board), node_capacity)
+    tree.rave_equivalence = rave_equivalence
+
+    if n_workers > 1:
+        action = MCTS_tree_parallel(board, n_workers, seed, tree, n_rollouts, stats, budget, rollout_policy)
+    else:
+        action = MCTS(board, tree, n_rollouts, Clock(budget, clock_stride(n_rollouts, rollout_policy)), stats,
+                      policy=rollout_policy)
+
+    # keep the subtree of the move played, the rest of the tree is freed
+    saved_state.tree = None
+    saved_state.board, _ = apply_player_action(board, action, player, True)
+    for child in tree.children(ROOT):
+        if tree.move[child] == action and tree.visits[child] > 0:
+            tree.compact(child)
+            saved_state.tree = tree
             break
+    return action, 'search', stats
+
+
+def tree_policy(tree: TreeStore, board: np.ndarray, stats: Optional[MCTSStats] = None) -> Tuple[list, np.ndarray]:
+    """
+    Selects a node by UCT from the root of `tree` and expands it if it has
+    untried moves and the tree is not full. `board` is the board of the root.
+    The time spent and the depth reached are added to `stats` if given.
+    :return: the path from the root to the selected node and its board
+    """
+    start = time.perf_counter()
+    node = ROOT
+    board = board.copy()
+
+    #############
+    # selection #
+    #############
+    # keep going down the tree based on best UCT values until terminal or unexpanded node
+    while tree.untried[node] == 0 and tree.n_children[node] > 0:
+        node = tree.selection(node)
+        apply_player_action(board, tree.move[node], BoardPiece(tree.player[node]))
+    selected = time.perf_counter()
+
+    #############
+    #  Expand   #
+    #############
+    if tree.untried[node] != 0 and not tree.is_full():
+        # Choose a random action from available moves
+        untried = [col for col in range(board.shape[1]) if tree.untried[node] >> col & 1]
+        node = tree.expand(node, board, np.random.choice(untried))
+    path = tree.path_to(node)
+    if stats is not None:
+        stats.phase_seconds['select'] += selected - start
+        stats.phase_seconds['expand'] += time.perf_counter() - selected
+        stats.max_depth = max(stats.max_depth, len(path) - 1)
+    return path, board
+
+
+def leaf_rollout(tree: TreeStore, node: int, board: np.ndarray, n_rollouts: int = 1,
+                 lengths: Optional[np.ndarray] = None, amaf: Optional[np.ndarray] = None,
+                 policy: RolloutPolicy = random_policy) -> np.ndarray:
+    """
+    Runs `n_rollouts` rollouts from `node` whose board is `board` with the
+    rollout policy `policy`, counting their lengths in `lengths` and the
+    columns played in `amaf` if given (see batch_rollout).
+    :return: the number of draws and of wins of each player, see batch_rollout
+    """
+    last_action = tree.move[node] if node != ROOT else None
+    return batch_rollout(board, BoardPiece(tree.player[node]), last_action, n_rollouts, lengths, amaf, policy)
+
+
+def new_amaf(tree: TreeStore, board: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Returns an empty array of rollout AMAF statistics if `tree` uses RAVE, otherwise None.
+    """
+    return np.zeros((2, 3, board.shape[1]), dtype=np.int64) if tree.rave_equivalence > 0 else None
+
+
+def backpropagate(tree: TreeStore, path: list, counts: np.ndarray, amaf: Optional[np.ndarray] = None):
+    """
+    Updates the nodes on `path` with the aggregated results of the rollouts,
+    and their children with the AMAF statistics `amaf` if given.
+    """
+    # The player won +1, the player lost against the opponent -1
+    result = counts[PLAYER] - counts[OPPONENT]
+    # every node counts wins for the player who moved into it
+    tree.update(path, result, PLAYER, counts.sum())
+    if amaf is not None:
+        tree.update_amaf(path, amaf, counts)
+
 
+def root_statistics(tree: TreeStore) -> list:
+    """
+    Returns (move, visits, wins, is_winning_move) for every visited child of the root.
+    """
+    return [(int(tree.move[child]), int(tree.visits[child]), int(tree.wins[child]), bool(tree.is_win[child]))
+            for child in tree.children(ROOT) if tree.visits[child] > 0]
+
+
+def select_move(statistics: list, board: Optional[np.ndarray] = None) -> PlayerAction:
+    """
+    Returns a winning move if there is one, otherwise the move with the best
+    win rate, from root statistics as returned by root_statistics. Without
+    statistics, as left by a search stopped before its first rollout came
+    back, returns the legal move of `board` nearest to the center, or -1
+    if `board` is not given.
+    """
     bestScore = -10000000.0
     selectedColumn = - 1
-    for child in rootNode.childNodes:
-        if connected_four(child.state, child.player):
-            return child.move
+    for move, visits, wins, is_winning_move in statistics:
+        if is_winning_move:
+            return move
         else:
-            score = child.wins / child.visits
+            score = wins / visits
             if score > bestScore:
-                selectedColumn = child.move
+                selectedColumn = move
                 bestScore = score
+    if selectedColumn < 0 and board is not None:
+        legal = np.flatnonzero(board[board.shape[0] - 1] == NO_PLAYER)
+        selectedColumn = int(legal[np.argmin(np.abs(legal - board.shape[1] // 2))])
     return selectedColumn
+
+
+def clock_stride(n_rollouts: int, policy: RolloutPolicy = random_policy) -> int:
+    """
+    Returns the iterations between two readings of the clock: about
+    CLOCK_ROLLOUTS rollouts when they run in the compiled kernel, otherwise
+    every iteration, a batch of NumPy rollouts taking milliseconds.
+    """
+    if not jit_enabled() or policy is not random_policy:
+        return 1
+    return max(1, CLOCK_ROLLOUTS // n_rollouts)
+
+
+def decided(tree: TreeStore, clock: Clock) -> bool:
+    """
+    Returns True if the move to play (see select_move) cannot change before
+    `clock` expires: it wins at once, or every move of the root has been
+    visited and the win rate of the move stays above the win rate of every
+    other move even if the rest of the search, at the rate seen so far, lost
+    all its visits of the move and won all its visits of the other move.
+    """
+    statistics = root_statistics(tree)
+    if not statistics:
+        return False
+    move = select_move(statistics)
+    if any(is_winning_move and child_move == move for child_move, _, _, is_winning_move in statistics):
+        return True
+    # a move not visited yet may get any win rate
+    if tree.untried[ROOT] != 0 or len(statistics) < len(tree.children(ROOT)) or clock.elapsed() <= 0:
+        return False
+    remaining_visits = tree.visits[ROOT] / clock.elapsed() * clock.remaining()
+    _, visits, wins, _ = next(child for child in statistics if child[0] == move)
+    worst = (wins - remaining_visits) / (visits + remaining_visits)
+    return all((other_wins + remaining_visits) / (other_visits + remaining_visits) < worst
+               for other_move, other_visits, other_wins, _ in statistics if other_move != move)
+
+
+def MCTS(board: np.ndarray, tree: Optional[TreeStore] = None, n_rollouts: int = ROLLOUTS_PER_LEAF,
+         clock: Optional[Clock] = None, stats: Optional[MCTSStats] = None,
+         max_iterations: Optional[int] = None, early_stop: bool = True,
+         policy: RolloutPolicy = random_policy) -> PlayerAction:
+    """
+    Searches `board` for the best move of PLAYER until `clock` expires
+    (MOVE_TIME seconds if not given) or after `max_iterations` iterations if
+    given, playing `n_rollouts` games from every leaf with the rollout policy `policy`. With `early_stop` the
+    search ends as soon as the move is decided (see decided). `tree`, if
+    given, is the tree of `board` (its root moved into by OPPONENT) from a
+    previous search and is searched further. The statistics of the search
+    are added to `stats` if given.
+    """
+    if tree is None:
+        tree = TreeStore(OPPONENT, distinct_moves_mask(board))
+    if clock is None:
+        clock = Clock(MOVE_TIME, clock_stride(n_rollouts, policy))
+    if stats is None:
+        stats = MCTSStats(board.size)
+    iterations = 0
+    while max_iterations is None or iterations < max_iterations:
+        path, leaf_board = tree_policy(tree, board, stats)
+        rollout_start = time.perf_counter()
+        amaf = new_amaf(tree, board)
+        counts = leaf_rollout(tree, path[-1], leaf_board, n_rollouts, stats.rollout_lengths, amaf, policy)
+        backprop_start = time.perf_counter()
+        backpropagate(tree, path, counts, amaf)
+        stats.phase_seconds['rollout'] += backprop_start - rollout_start
+        stats.phase_seconds['backprop'] += time.perf_counter() - backprop_start
+        stats.iterations += 1
+        iterations += 1
+
+        if clock.expired() or early_stop and clock.read() and decided(tree, clock):
+            break
+
+    stats.tree_size = tree.size
+    return select_move(root_statistics(tree), board)
+
+
+def _worker_seeds(n_workers: int, seed: Optional[int]) -> list:
+    return [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(n_workers)]
+
+
+def _init_worker(player: BoardPiece):
+    global PLAYER, OPPONENT
+    PLAYER = player
+    OPPONENT = PLAYER2 if player == PLAYER1 else PLAYER1
+
+
+_root_pool = None  # process pool of MCTS_root_parallel, kept between moves
+_root_pool_workers = 0
+
+
+def root_pool(n_workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the process pool of MCTS_root_parallel with `n_workers` workers,
+    created on first use and kept for the next moves, so that the workers
+    are started once.
+    """
+    global _root_pool, _root_pool_workers
+    if _root_pool is None or _root_pool_workers != n_workers:
+        if _root_pool is not None:
+            _root_pool.shutdown()
+        _root_pool = ProcessPoolExecutor(n_workers)
+        _root_pool_workers = n_workers
+    return _root_pool
+
+
+def _search_root(board: np.ndarray, player: BoardPiece, seed: int, node_capacity: int, n_rollouts: int,
+                 deadline: float, rave_equivalence: float, policy: RolloutPolicy) -> Tuple[list, MCTSStats]:
+    _init_worker(player)
+    np.random.seed(seed)
+    # the time taken to get the task to the worker is charged to the move
+    budget = max(0.0, deadline - time.monotonic())
+    tree = TreeStore(OPPONENT, distinct_moves_mask(board), node_capacity, rave_equivalence)
+    stats = MCTSStats(board.size)
+    MCTS(board, tree, n_rollouts, Clock(budget, clock_stride(n_rollouts, policy)), stats, policy=policy)
+    return root_statistics(tree), stats
+
+
+def MCTS_root_parallel(board: np.ndarray, n_workers: int, seed: Optional[int] = None,
+                       node_capacity: int = NODE_CAPACITY, n_rollouts: int = ROLLOUTS_PER_LEAF,
+                       stats: Optional[MCTSStats] = None, budget: float = MOVE_TIME,
+                       rave_equivalence: float = 0, policy: RolloutPolicy = random_policy) -> PlayerAction:
+    """
+    Runs an independent search of `board` in each of `n_workers` processes
+    of the pool kept between moves (see root_pool) until `budget` seconds
+    after the call, and picks the move from the summed visits and wins of
+    the root children. The statistics of all the searches are added to
+    `stats` if given.
+    """
+    deadline = time.monotonic() + budget
+    results = root_pool(n_workers).map(_search_root, [board] * n_workers, [PLAYER] * n_workers,
+                                       _worker_seeds(n_workers, seed), [node_capacity] * n_workers,
+                                       [n_rollouts] * n_workers, [deadline] * n_workers,
+                                       [rave_equivalence] * n_workers, [policy] * n_workers)
+    merged = {}
+    for statistics, worker_stats in results:
+        if stats is not None:
+            stats.merge(worker_stats)
+        for move, visits, wins, is_winning_move in statistics:
+            total_visits, total_wins, _ = merged.get(move, (0, 0, False))
+            merged[move] = (total_visits + visits, total_wins + wins, is_winning_move)
+    return select_move([(move, visits, wins, win) for move, (visits, wins, win) in merged.items()], board)
+
+
+def _seed_worker(player: BoardPiece, seeds):
+    _init_worker(player)
+    np.random.seed(seeds.get())
+
+
+def _rollout_statistics(board: np.ndarray, player: BoardPiece, last_action: Optional[PlayerAction],
+                        n_games: int, amaf: Optional[np.ndarray],
+                        policy: RolloutPolicy) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    lengths = np.zeros(board.size + 1, dtype=np.int64)
+    return batch_rollout(board, player, last_action, n_games, lengths, amaf, policy), lengths, amaf
+
+
+def MCTS_tree_parallel(board: np.ndarray, n_workers: int, seed: Optional[int] = None,
+                       tree: Optional[TreeStore] = None, n_rollouts: int = ROLLOUTS_PER_LEAF,
+                       stats: Optional[MCTSStats] = None, budget: float = MOVE_TIME,
+                       policy: RolloutPolicy = random_policy) -> PlayerAction:
+    """
+    Grows one tree in this process for `budget` seconds and runs up to
+    `n_workers` rollouts at a time in a process pool. While a rollout is
+    pending, VIRTUAL_LOSS losses are added along its path so that the next
+    selections explore other nodes.
+    The statistics of the search are added to `stats` if given, the rollout
+    time being the time spent waiting for the workers.
+    """
+    if tree is None:
+        tree = TreeStore(OPPONENT, distinct_moves_mask(board))
+    if stats is None:
+        stats = MCTSStats(board.size)
+    context = multiprocessing.get_context()
+    seeds = context.Queue()
+    for worker_seed in _worker_seeds(n_workers, seed):
+        seeds.put(worker_seed)
+
+    clock = Clock(budget)
+    with ProcessPoolExecutor(n_workers, mp_context=context, initializer=_seed_worker,
+                             initargs=(PLAYER, seeds)) as pool:
+        pending = {}
+        while pending or not clock.expired():
+            while len(pending) < n_workers and not clock.expired():
+                path, leaf_board = tree_policy(tree, board, stats)
+                node = path[-1]
+                tree.add_virtual_loss(path, VIRTUAL_LOSS)
+                last_action = tree.move[node] if node != ROOT else None
+                future = pool.submit(_rollout_statistics, leaf_board, BoardPiece(tree.player[node]), last_action,
+                                     n_rollouts, new_amaf(tree, board), policy)
+                pending[future] = path
+            wait_start = time.perf_counter()
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            backprop_start = time.perf_counter()
+            for future in done:
+                path = pending.pop(future)
+                counts, lengths, amaf = future.result()
+                tree.add_virtual_loss(path, -VIRTUAL_LOSS)
+                backpropagate(tree, path, counts, amaf)
+                stats.rollout_lengths += lengths
+                stats.iterations += 1
+            stats.phase_seconds['rollout'] += backprop_start - wait_start
+            stats.phase_seconds['backprop'] += time.perf_counter() - backprop_start
+
+    stats.tree_size = tree.size
+    return select_move(root_statistics(tree), board)
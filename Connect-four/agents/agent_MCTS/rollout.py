@@ -0,0 +1,220 @@
+import numpy as np
+from typing import Callable, Optional
+from agents.common import BoardPiece, PlayerAction, PLAYER1, PLAYER2, NO_PLAYER, CONNECT_N, WIDTH
+from agents.common import (connected_four, Position, winning_cells, BOTTOM_MASK, BOARD_MASK, COLUMN_BITS,
+                           COLUMN_MASK)
+from agents.kernels import random_rollouts, lines_through
+from agents.agent_minimax.minimax import heuristic_batch
+
+# bit offset of every column in a bitboard
+COLUMN_SHIFTS = np.arange(WIDTH, dtype=np.int64) * COLUMN_BITS
+EPSILON = 0.1  # probability of a random move of HeuristicPolicy
+
+
+def connected_through(boards: np.ndarray, rows: np.ndarray, cols: np.ndarray, player: BoardPiece) -> np.ndarray:
+    """
+    For a stack of boards (N, 6, 7) and one cell per board, returns which boards
+    have CONNECT_N pieces of `player` in a line through that cell.
+    """
+    return lines_through(boards, rows, cols, player, CONNECT_N)
+
+
+class RolloutGames:
+    """
+    The games of a batch_rollout, as seen by the rollout policies: the boards
+    (n_games, 6, 7), the number of pieces in every column (`heights`), the
+    bitboards of the pieces of every player (pieces[player], see Position),
+    the indices of the games still being played (`playing`) and the player
+    to move in them (`current`).
+    """
+
+    def __init__(self, board: np.ndarray, n_games: int, player_to_move: BoardPiece):
+        self.boards = np.repeat(board[None].astype(np.int8), n_games, axis=0)
+        self.heights = np.repeat(np.count_nonzero(board, axis=0)[None], n_games, axis=0)
+        position = Position.from_board(board)
+        self.pieces = np.zeros((3, n_games), dtype=np.int64)
+        self.pieces[PLAYER1], self.pieces[PLAYER2] = position.pieces
+        self.playing = np.arange(n_games)
+        self.current = player_to_move
+
+    def mask(self) -> np.ndarray:
+        """
+        Bitboards of all the pieces of the games being played.
+        """
+        return self.pieces[PLAYER1, self.playing] | self.pieces[PLAYER2, self.playing]
+
+    def play(self, cols: np.ndarray) -> np.ndarray:
+        """
+        Plays column cols[i] for `current` in the i-th game being played.
+        :return: the rows played
+        """
+        rows = self.heights[self.playing, cols]
+        self.boards[self.playing, rows, cols] = self.current
+        self.heights[self.playing, cols] += 1
+        self.pieces[self.current, self.playing] |= np.left_shift(1, COLUMN_SHIFTS[cols] + rows)
+        return rows
+
+
+# A rollout policy takes the games and the (games being played, columns)
+# mask of their legal moves, and returns the column to play in every game.
+RolloutPolicy = Callable[[RolloutGames, np.ndarray], np.ndarray]
+
+
+def random_choice(allowed: np.ndarray) -> np.ndarray:
+    """
+    Returns for every row of `allowed` one of its True columns, drawn uniformly.
+    """
+    return np.where(allowed, np.random.random(allowed.shape), -1.0).argmax(axis=1)
+
+
+def column_cells(cells: np.ndarray) -> np.ndarray:
+    """
+    Returns which columns of every bitboard in `cells` hold a set bit, shape (len(cells), WIDTH).
+    """
+    return (cells[:, None] >> COLUMN_SHIFTS) & COLUMN_MASK != 0
+
+
+def tactical_columns(games: RolloutGames, legal: np.ndarray) -> np.ndarray:
+    """
+    Returns the mask of the columns to choose from in every game: the
+    winning moves if there are any, otherwise the moves blocking an
+    immediate win of the opponent if there are any, otherwise the legal moves.
+    """
+    mask = games.mask()
+    playable = (mask + BOTTOM_MASK) & BOARD_MASK
+    own = games.pieces[games.current, games.playing]
+    opponent = games.pieces[PLAYER1 + PLAYER2 - games.current, games.playing]
+    wins = column_cells(winning_cells(own, mask) & playable)
+    blocks = column_cells(winning_cells(opponent, mask) & playable)
+    return np.where(wins.any(axis=1)[:, None], wins, np.where(blocks.any(axis=1)[:, None], blocks, legal))
+
+
+def random_policy(games: RolloutGames, legal: np.ndarray) -> np.ndarray:
+    """
+    Plays uniformly among the legal columns.
+    """
+    return random_choice(legal)
+
+
+def win_block_policy(games: RolloutGames, legal: np.ndarray) -> np.ndarray:
+    """
+    Wins if it can, blocks an immediate win of the opponent if it must,
+    otherwise plays uniformly among the legal columns.
+    """
+    return random_choice(tactical_columns(games, legal))
+
+
+class HeuristicPolicy:
+    """
+    Epsilon-greedy policy: wins or blocks like win_block_policy, otherwise
+    plays a random column with probability `epsilon` and the column with the
+    best minimax heuristic after it is played otherwise. It scores every
+    legal column of every game, so a move costs much more than with
+    win_block_policy.
+    """
+
+    def __init__(self, epsilon: float = EPSILON):
+        self.epsilon = epsilon
+
+    def __call__(self, games: RolloutGames, legal: np.ndarray) -> np.ndarray:
+        allowed = tactical_columns(games, legal)
+        cols = random_choice(allowed)
+        greedy = np.flatnonzero((allowed == legal).all(axis=1) & (np.random.random(len(cols)) >= self.epsilon))
+        if greedy.size == 0:
+            return cols
+        games_index = games.playing[greedy]
+        num_rows, num_columns = games.boards.shape[1:]
+        candidates = np.repeat(games.boards[games_index][:, None], num_columns, axis=1)
+        board_index, col_index = np.nonzero(legal[greedy])
+        rows = games.heights[games_index[board_index], col_index]
+        candidates[board_index, col_index, rows, col_index] = games.current
+        scores = heuristic_batch(candidates.reshape(-1, num_rows, num_columns), games.current)
+        # ties are broken at random, the scores being integers
+        scores = scores.reshape(greedy.size, num_columns) + np.random.random((greedy.size, num_columns))
+        cols[greedy] = np.where(legal[greedy], scores, -np.inf).argmax(axis=1)
+        return cols
+
+
+def batch_rollout(board: np.ndarray, player: BoardPiece, last_action: Optional[PlayerAction],
+                  n_games: int, lengths: Optional[np.ndarray] = None, amaf: Optional[np.ndarray] = None,
+                  policy: RolloutPolicy = random_policy) -> np.ndarray:
+    """
+    Plays `n_games` games at once from `board`, where `player` made the
+    last move, on an (n_games, 6, 7) stack of boards, the moves being chosen
+    by `policy` (by default uniformly among the non-full columns of every
+    game). The games of random_policy are played by the kernel
+    random_rollouts, compiled when the JIT is enabled (see agents.kernels),
+    from random numbers drawn beforehand, so both modes play the same games.
+    If `lengths` is given, lengths[n] is incremented for every game that
+    ended after n moves.
+    If `amaf`, shape (2, 3, columns), is given, amaf[0, p, col] is incremented
+    by the number of games in which player p played column `col` and
+    amaf[1, p, col] by the wins minus the losses of p in those games.
+    :return: number of games won by nobody (draws), PLAYER1 and PLAYER2,
+             indexed by NO_PLAYER, PLAYER1 and PLAYER2
+    """
+    counts = np.zeros(3, dtype=np.int64)
+    if last_action is not None and connected_four(board, player, last_action):
+        counts[player] = n_games
+        if lengths is not None:
+            lengths[0] += n_games
+        return counts
+
+    if policy is random_policy:
+        randoms = np.random.random((n_games, np.count_nonzero(board == NO_PLAYER)))
+        winners, game_lengths, played = random_rollouts(board.astype(np.int8), int(player), CONNECT_N, randoms)
+        counts += np.bincount(winners, minlength=3)
+        if lengths is not None:
+            np.add.at(lengths, game_lengths, 1)
+        if amaf is not None:
+            add_amaf(amaf, played, winners)
+        return counts
+
+    num_rows, num_columns = board.shape
+    games = RolloutGames(board, n_games, PLAYER1 if player == PLAYER2 else PLAYER2)
+    current = player
+    n_moves = 0
+    if amaf is not None:
+        played = np.zeros((n_games, 3, num_columns), dtype=np.bool_)
+        winners = np.full(n_games, NO_PLAYER, dtype=np.int8)
+    while games.playing.size > 0:
+        current = PLAYER1 if current == PLAYER2 else PLAYER2
+        legal = games.heights[games.playing] < num_rows
+        finished = ~legal.any(axis=1)
+        counts[NO_PLAYER] += np.count_nonzero(finished)
+        if lengths is not None:
+            lengths[n_moves] += np.count_nonzero(finished)
+        games.playing, legal = games.playing[~finished], legal[~finished]
+        if games.playing.size == 0:
+            break
+
+        games.current = current
+        cols = policy(games, legal)
+        rows = games.play(cols)
+        playing = games.playing
+        n_moves += 1
+
+        won = connected_through(games.boards[playing], rows, cols, current)
+        counts[current] += np.count_nonzero(won)
+        if lengths is not None:
+            lengths[n_moves] += np.count_nonzero(won)
+        if amaf is not None:
+            played[playing, current, cols] = True
+            winners[playing[won]] = current
+        games.playing = playing[~won]
+
+    if amaf is not None:
+        add_amaf(amaf, played, winners)
+    return counts
+
+
+def add_amaf(amaf: np.ndarray, played: np.ndarray, winners: np.ndarray):
+    """
+    Adds to `amaf` (see batch_rollout) the statistics of games with winners
+    `winners`, played[g, p, col] telling whether player p played column col
+    in game g.
+    """
+    for p in (PLAYER1, PLAYER2):
+        results = (winners == p).astype(np.int64) - (winners == (PLAYER1 + PLAYER2 - p))
+        amaf[0, p] += played[:, p].sum(axis=0)
+        amaf[1, p] += results @ played[:, p]
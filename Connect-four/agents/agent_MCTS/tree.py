@@ -0,0 +1,227 @@
+import numpy as np
+from agents.common import BoardPiece, PlayerAction, PLAYER1, PLAYER2, NO_PLAYER, WIDTH
+from agents.common import connected_four, apply_player_action
+
+NODE_CAPACITY = 1 << 20  # default number of nodes a TreeStore can hold
+ROOT = 0
+UCT_C = np.sqrt(2)
+# RAVE equivalence parameter k: the AMAF value of a child weighs
+# beta = sqrt(k / (3 * visits + k)) in its selection value, i.e. as much as
+# its own value after k / 3 visits. A tree with k = 0 does not use RAVE.
+RAVE_EQUIVALENCE = 300
+# the fields of a node, moved by compact
+NODE_FIELDS = ('visits', 'wins', 'move', 'player', 'untried', 'is_win', 'amaf_visits', 'amaf_wins')
+# the values of the fields of a free slot
+EMPTY_NODE = {'visits': 0, 'wins': 0, 'parent': -1, 'first_child': -1, 'n_children': 0, 'move': -1,
+              'player': 0, 'untried': 0, 'is_win': False, 'amaf_visits': 0, 'amaf_wins': 0}
+# MIRRORED_MASKS[mask] is the move mask `mask` with the columns mirrored left-right
+MIRRORED_MASKS = np.array([sum(1 << (WIDTH - 1 - col) for col in range(WIDTH) if mask >> col & 1)
+                           for mask in range(1 << WIDTH)], dtype=np.uint8)
+
+
+def legal_moves_mask(board: np.ndarray) -> int:
+    """
+    Returns the bit mask of the columns of `board` that are not full.
+    """
+    mask = 0
+    for col in np.flatnonzero(board[board.shape[0] - 1, :] == NO_PLAYER):
+        mask |= 1 << int(col)
+    return mask
+
+
+def distinct_moves_mask(board: np.ndarray) -> int:
+    """
+    Like legal_moves_mask, but only the left half of the moves of a board that
+    is its own mirror: the other half leads to the mirrored positions, so their
+    statistics are shared.
+    """
+    mask = legal_moves_mask(board)
+    if np.array_equal(board, board[:, ::-1]):
+        mask &= (1 << (WIDTH // 2 + 1)) - 1
+    return mask
+
+
+class TreeStore:
+    """
+    MCTS tree stored as parallel arrays (structure of arrays) with room for
+    `capacity` nodes. Node ROOT is the root. The children of a node are the
+    contiguous slots first_child[node] .. first_child[node] + n_children[node] - 1,
+    reserved for all its legal moves the first time it is expanded; `untried`
+    is the bit mask of the moves not expanded yet.
+
+    Boards are not stored: they are rebuilt by playing the moves on the path
+    from the root (see path_to). Every node counts wins for `player`, the
+    player who moved into it.
+
+    With a positive `rave_equivalence` the nodes also keep All-Moves-As-First
+    statistics (see update_amaf), blended into the selection values.
+    """
+
+    def __init__(self, player: BoardPiece, untried: int, capacity: int = NODE_CAPACITY,
+                 rave_equivalence: float = 0):
+        """
+        Creates a tree with only the root, moved into by `player` and with the
+        moves in the bit mask `untried` (see distinct_moves_mask).
+        """
+        self.capacity = capacity
+        self.rave_equivalence = rave_equivalence
+        self.visits = np.zeros(capacity, dtype=np.int32)
+        self.wins = np.zeros(capacity, dtype=np.int32)
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.first_child = np.full(capacity, -1, dtype=np.int32)
+        self.n_children = np.zeros(capacity, dtype=np.int8)
+        self.move = np.full(capacity, -1, dtype=np.int8)
+        self.player = np.zeros(capacity, dtype=np.int8)
+        self.untried = np.zeros(capacity, dtype=np.uint8)
+        self.is_win = np.zeros(capacity, dtype=np.bool_)  # the move into the node won the game
+        self.amaf_visits = np.zeros(capacity, dtype=np.int32)
+        self.amaf_wins = np.zeros(capacity, dtype=np.int32)
+        self.size = 1
+        self.player[ROOT] = player
+        self.untried[ROOT] = untried
+
+    def is_full(self) -> bool:
+        return self.size + WIDTH > self.capacity
+
+    def children(self, node: int) -> range:
+        first = self.first_child[node]
+        return range(first, first + self.n_children[node]) if first >= 0 else range(0)
+
+    def selection(self, node: int) -> int:
+        """
+        Returns the child of a fully expanded `node` with the largest UCT value,
+        its value being blended with its AMAF value in RAVE mode.
+        """
+        first = self.first_child[node]
+        last = first + self.n_children[node]
+        visits = self.visits[first:last]
+        values = self.wins[first:last] / visits
+        if self.rave_equivalence > 0:
+            amaf_visits = self.amaf_visits[first:last]
+            amaf_values = self.amaf_wins[first:last] / np.maximum(amaf_visits, 1)
+            beta = np.sqrt(self.rave_equivalence / (3 * visits + self.rave_equivalence))
+            values = (1 - beta) * values + beta * amaf_values
+        scores = values + UCT_C * np.sqrt(np.log(self.visits[node]) / visits)
+        return int(first + np.argmax(scores))
+
+    def expand(self, node: int, board: np.ndarray, action: PlayerAction) -> int:
+        """
+        Expands the untried move `action` of `node`, playing it on `board`
+        (the board of `node`) in place. The children slots are reserved on the
+        first expansion.
+        :return: the new child
+        """
+        if self.first_child[node] < 0:
+            moves = [col for col in range(WIDTH) if self.untried[node] >> col & 1]
+            first = self.size
+            self.size += len(moves)
+            self.first_child[node] = first
+            self.n_children[node] = len(moves)
+            self.move[first:first + len(moves)] = moves
+            self.parent[first:first + len(moves)] = node
+            self.player[first:first + len(moves)] = PLAYER2 if self.player[node] == PLAYER1 else PLAYER1
+        child = next(c for c in self.children(node) if self.move[c] == action)
+        self.untried[node] &= ~np.uint8(1 << int(action))
+
+        player = BoardPiece(self.player[child])
+        apply_player_action(board, action, player)
+        if connected_four(board, player, action):
+            self.is_win[child] = True
+        else:
+            self.untried[child] = distinct_moves_mask(board)
+        return child
+
+    def path_to(self, node: int) -> list:
+        """
+        Returns the nodes from the root to `node`.
+        """
+        path = [node]
+        while self.parent[node] >= 0:
+            node = self.parent[node]
+            path.append(node)
+        return path[::-1]
+
+    def update(self, path: list, result: int, player: BoardPiece, n_visits: int = 1):
+        """
+        Adds `n_visits` visits and `result` (the wins minus the losses of
+        `player`) to every node on `path`.
+        """
+        path = np.asarray(path)
+        self.visits[path] += n_visits
+        self.wins[path] += np.where(self.player[path] == player, result, -result).astype(np.int32)
+
+    def update_amaf(self, path: list, amaf: np.ndarray, counts: np.ndarray):
+        """
+        Adds the All-Moves-As-First statistics of the rollouts run from the
+        end of `path` to the children of the nodes on `path`: a child moved
+        into by player p with column m counts the rollouts in which p played
+        m after its parent, the moves on the path below the parent included,
+        with the wins minus the losses of p. `amaf` holds the statistics of
+        the rollout moves (see batch_rollout) and `counts` their results.
+        """
+        n_games = int(counts.sum())
+        path_moves = set()  # (player, column) of the path below the current node
+        for index in range(len(path) - 1, -1, -1):
+            if index + 1 < len(path):
+                below = path[index + 1]
+                path_moves.add((int(self.player[below]), int(self.move[below])))
+            for child in self.children(path[index]):
+                p, m = int(self.player[child]), int(self.move[child])
+                if (p, m) in path_moves:
+                    self.amaf_visits[child] += n_games
+                    self.amaf_wins[child] += counts[p] - counts[PLAYER1 + PLAYER2 - p]
+                else:
+                    self.amaf_visits[child] += amaf[0, p, m]
+                    self.amaf_wins[child] += amaf[1, p, m]
+
+    def add_virtual_loss(self, path: list, loss: int):
+        """
+        Counts `loss` lost visits on every node of `path` (negative to take them back).
+        """
+        path = np.asarray(path)
+        self.visits[path] += loss
+        self.wins[path] -= loss
+
+    def mirror(self):
+        """
+        Mirrors the tree left-right in place, making it the tree of the mirrored board.
+        """
+        moves = self.move[:self.size]
+        moves[moves >= 0] = WIDTH - 1 - moves[moves >= 0]
+        self.untried[:self.size] = MIRRORED_MASKS[self.untried[:self.size]]
+
+    def compact(self, node: int):
+        """
+        Makes `node` the root, keeping only its subtree: its nodes are
+        renumbered in breadth-first order into the first slots of the arrays
+        and the slots of the other nodes are cleared, so nothing is allocated
+        beyond the size of the subtree.
+        """
+        # the old slots of the subtree in breadth-first order, the children of a node staying contiguous
+        levels = [np.array([node])]
+        parents = [np.array([-1])]
+        first_children = []  # (new nodes, new slots of their first children) per level
+        frontier, new_frontier, size = levels[0], np.array([ROOT]), 1
+        while frontier.size:
+            expanded = self.first_child[frontier] >= 0
+            counts = self.n_children[frontier[expanded]].astype(np.int64)
+            starts = np.cumsum(counts) - counts
+            children = (np.repeat(self.first_child[frontier[expanded]], counts)
+                        + np.arange(counts.sum()) - np.repeat(starts, counts))
+            first_children.append((new_frontier[expanded], size + starts))
+            parents.append(np.repeat(new_frontier[expanded], counts))
+            levels.append(children)
+            frontier, new_frontier = children, size + np.arange(children.size)
+            size += children.size
+        old = np.concatenate(levels)
+        # the gathers are copied before being written, so the slots can be reused in place
+        for name in NODE_FIELDS + ('n_children',):
+            array = getattr(self, name)
+            array[:size] = array[old]
+        self.parent[:size] = np.concatenate(parents)
+        self.first_child[:size] = -1
+        for new, first in first_children:
+            self.first_child[new] = first
+        for name, empty in EMPTY_NODE.items():
+            getattr(self, name)[size:self.size] = empty
+        self.size = size
@@ -1,38 +1,287 @@
+import functools
 import numpy as np
 import math
-from typing import Optional, Tuple
-from agents.common import BoardPiece, PlayerAction, SavedState, PLAYER1, PLAYER2, NO_PLAYER, GameState, HEIGHT, WIDTH
-from agents.common import connected_four, check_end_state, apply_player_action
+import time
+from typing import Optional, Tuple, Callable, Sequence
+from agents.common import (BoardPiece, PlayerAction, SavedState, PLAYER1, PLAYER2, NO_PLAYER, HEIGHT, WIDTH,
+                           CONNECT_N, Position, mirror_move, GameConfig, DEFAULT_CONFIG, board_config,
+                           game_config)
+from agents.kernels import window_heuristic
+from agents.book import book_move
+from agents.tablebase import tablebase_move, TABLEBASE_SHARE
+from agents.instrumentation import report, profiling
+from agents.time_manager import TimeManager, move_budget, end_move
+from agents.agent_minimax.transposition import (TranspositionTable, TABLE_SIZE_LOG2,
+                                                EXACT, LOWER_BOUND, UPPER_BOUND)
+
+WIN_SCORE = 10000000
+DEPTH = 4  # search depth when no time budget is given
+CLOCK_STRIDE = 1024  # nodes searched between two looks at the clock
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the deadline has passed.
+    """
+    pass
+
+
+# A move ordering step takes the position, the running Search, the moves in
+# their current order and the best move stored in the transposition table
+# (or None), and returns the moves reordered.
+MoveOrdering = Callable[[Position, 'Search', list, Optional[int]], list]
+
+CENTER_DISTANCE = DEFAULT_CONFIG.center_distance
+
+
+def center_first(position: Position, search: 'Search', moves: list, tt_move: Optional[int]) -> list:
+    """
+    Orders the moves from the center column outwards.
+    """
+    return sorted(moves, key=position.config.center_distance.__getitem__)
+
+
+def history_first(position: Position, search: 'Search', moves: list, tt_move: Optional[int]) -> list:
+    """
+    Orders the moves by how often they caused a cutoff for the player to move.
+    """
+    history = search.history[position.side]
+    return sorted(moves, key=lambda col: -history[col])
+
+
+def killers_first(position: Position, search: 'Search', moves: list, tt_move: Optional[int]) -> list:
+    """
+    Moves the killer moves of the current ply to the front.
+    """
+    killers = [col for col in search.killers[len(position.moves)] if col in moves]
+    return killers + [col for col in moves if col not in killers]
+
+
+def tt_move_first(position: Position, search: 'Search', moves: list, tt_move: Optional[int]) -> list:
+    """
+    Moves the best move stored in the transposition table to the front.
+    """
+    if tt_move is not None and tt_move in moves:
+        return [tt_move] + [col for col in moves if col != tt_move]
+    return moves
+
+
+def pv_first(position: Position, search: 'Search', moves: list, tt_move: Optional[int]) -> list:
+    """
+    Moves the principal variation move of the previous iteration to the front
+    when `position` lies on that principal variation.
+    """
+    ply = len(position.moves)
+    if ply < len(search.pv) and position.moves == search.pv[:ply] and search.pv[ply] in moves:
+        return [search.pv[ply]] + [col for col in moves if col != search.pv[ply]]
+    return moves
+
+
+# steps are applied in order, so the last one has the highest priority
+DEFAULT_ORDERING = (center_first, history_first, killers_first, tt_move_first, pv_first)
+
+
+class Search:
+    """
+    State shared by all nodes of one search: the transposition table, the
+    deadline, the incremental leaf evaluator, the move ordering with its killer
+    moves and history table, and counters of the nodes visited, the leaves
+    evaluated and the cutoffs. The statistics (see stats) also report the
+    hits counted by the transposition table.
+    `config` is the config of the boards searched.
+    """
+
+    def __init__(self, table: Optional[TranspositionTable] = None, deadline: Optional[float] = None,
+                 ordering: Sequence[MoveOrdering] = DEFAULT_ORDERING, config: GameConfig = DEFAULT_CONFIG):
+        self.table = table
+        self.deadline = deadline
+        self.ordering = ordering
+        self.evaluator = None  # IncrementalHeuristic of the board being searched
+        self.pv = []
+        self.killers = [[] for _ in range(config.cells + 1)]  # two killer moves per ply
+        self.history = [[0] * config.width, [0] * config.width]  # history[side][column]
+        self.nodes = 0
+        self.leaf_evals = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0  # cutoffs caused by the first move searched
+        self.depth = 0  # deepest search completed
+
+    def check_clock(self):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % CLOCK_STRIDE == 0 and time.monotonic() > self.deadline:
+            raise SearchTimeout()
+
+    def record_cutoff(self, position: Position, column: int, move_index: int, depth: int):
+        """
+        Updates the counters, the killer moves and the history table after
+        `column` caused a cutoff in `position`.
+        """
+        self.cutoffs += 1
+        if move_index == 0:
+            self.first_move_cutoffs += 1
+        killers = self.killers[len(position.moves)]
+        if column not in killers:
+            killers.insert(0, column)
+            del killers[2:]
+        self.history[position.side][column] += depth * depth
+
+    def stats(self) -> dict:
+        return {
+            'nodes': self.nodes,
+            'leaf_evals': self.leaf_evals,
+            'cutoffs': self.cutoffs,
+            'first_move_cutoffs': self.first_move_cutoffs,
+            'tt_hits': self.table.hits if self.table is not None else 0,
+            'depth': self.depth,
+        }
+
+
+class MinimaxState(SavedState):
+    """
+    Keeps the transposition table of the agent between moves, so a search can
+    reuse the results of the previous one. `search` is the last Search run,
+    to look at its counters, and `stats` the statistics of the last move (see
+    agents.instrumentation).
+    """
+
+    def __init__(self, table_size_log2: int = TABLE_SIZE_LOG2, ordering: Sequence[MoveOrdering] = DEFAULT_ORDERING):
+        self.table = TranspositionTable(table_size_log2)
+        self.ordering = ordering
+        self.search = None
+        self.stats = None
+        self.time_manager = None
 
 
 def generate_move_minimax(
-        board: np.ndarray, player: BoardPiece, saved_state: Optional[SavedState]
+        board: np.ndarray, player: BoardPiece, saved_state: Optional[SavedState],
+        time_budget: Optional[float] = None, time_manager: Optional[TimeManager] = None,
+        config: Optional[GameConfig] = None
 ) -> Tuple[PlayerAction, Optional[SavedState]]:
-    alpha = -math.inf
-    beta = math.inf
-    depth = 4
+    """
+    Plays the book move if `board` is in the opening book, the tablebase
+    move if it is in the endgame tablebase (both for the standard game
+    only), or the forced move if there is one (see Position.forced_move).
+    Otherwise searches `board` to depth DEPTH, or, if `time_budget`
+    (seconds) is given or the agent has a time manager (see
+    agents.time_manager.move_budget), deepens one ply at a time until the
+    budget runs out and plays the best move of the last completed depth.
+    `config` is the game played, by default connect CONNECT_N on boards of
+    the dimensions of `board` (see GameConfig).
+    The statistics of the move are reported to agents.instrumentation.
+    """
+    if config is None:
+        config = board_config(board)
+    if not isinstance(saved_state, MinimaxState):
+        saved_state = MinimaxState()
+    start = time.perf_counter()
+    with profiling():
+        budget = move_budget(saved_state, board, time_budget, time_manager, None)
+        deadline = time.monotonic() + budget if budget is not None else None
+        action = None
+        if config is DEFAULT_CONFIG:
+            action = book_move(board, player)
+            source = 'book'
+            if action is None:
+                if budget is None:
+                    action = tablebase_move(board, player)
+                else:
+                    action = tablebase_move(board, player, TABLEBASE_SHARE * budget)
+                    budget = max(0.0, deadline - time.monotonic())  # the rest of the budget, after the tablebase
+                source = 'tablebase'
+        if action is None:
+            action = Position.from_board(board, player, config).forced_move()
+            source = 'forced'
+        if action is None:
+            source = 'search'
+            saved_state.table.new_search()
 
-    # Choose a valid, non-full column that maximizes score and return it as `action`
-    action = minimax(board, depth, alpha, beta, player, True)[0]
+            # Choose a valid, non-full column that maximizes score and return it as `action`
+            saved_state.search = Search(saved_state.table, ordering=saved_state.ordering, config=config)
+            if budget is None:
+                action = minimax(board, DEPTH, -math.inf, math.inf, player, True, search=saved_state.search,
+                                 config=config)[0]
+            else:
+                action = iterative_deepening(board, player, budget, search=saved_state.search, config=config)[0]
+        end_move(saved_state)
 
+    saved_state.stats = {'source': source, 'seconds': time.perf_counter() - start}
+    if source == 'search':
+        saved_state.stats.update(saved_state.search.stats())
+    report('minimax', saved_state.stats)
     return PlayerAction(action), saved_state
 
 
-def find_moves(board: np.ndarray) -> list:
+def iterative_deepening(board: np.ndarray, player: BoardPiece, time_budget: float,
+                        table: Optional[TranspositionTable] = None,
+                        search: Optional[Search] = None, config: Optional[GameConfig] = None) -> Tuple[int, int, int]:
     """
-    Find the all empty columns which equal to NO_PLAYER
-    gets board as an input
+    Runs minimax with depth 1, 2, ... until `time_budget` seconds have passed or
+    the game is searched to the end. Each iteration tries the principal variation
+    of the previous one first. If `search` is given, its table and ordering are
+    used instead of `table` and its counters are updated. `config` is the
+    game played, see generate_move_minimax.
+    :return: best column, its score and the last completed depth
     """
-    return np.argwhere(board[board.shape[0] - 1, :] == NO_PLAYER).flatten()
+    if config is None:
+        config = board_config(board)
+    deadline = time.monotonic() + time_budget
+    position = Position.from_board(board, player, config)
+    if search is None:
+        search = Search(table, config=config)
+    search.evaluator = IncrementalHeuristic(board, player, config)
+    max_depth = int(np.count_nonzero(board == NO_PLAYER))
+
+    action, score = _minimax(position, 1, -math.inf, math.inf, player, True, search)
+    completed_depth = search.depth = 1
+    search.deadline = deadline
+    for depth in range(2, max_depth + 1):
+        if abs(score) >= WIN_SCORE:  # the result is already known
+            break
+        search.pv = principal_variation(position, search.pv, action, search.table, depth)
+        try:
+            action, score = _minimax(position, depth, -math.inf, math.inf, player, True, search)
+        except SearchTimeout:
+            break
+        completed_depth = depth
+        search.depth = depth
+    return action, score, completed_depth
+
+
+def principal_variation(position: Position, pv: list, action: int, table: Optional[TranspositionTable],
+                        depth: int) -> list:
+    """
+    Returns the best line found so far starting with `action`: it is followed
+    through the best moves stored in `table`, or taken from the old `pv`.
+    """
+    line = [action]
+    position.play(action)
+    while len(line) < depth and not position.is_full():
+        key, mirrored = position.canonical_hash()
+        entry = table.lookup(key) if table is not None else None
+        if entry is not None and entry[3] >= 0:
+            move = mirror_move(entry[3], mirrored, position.config.width)
+        elif pv[:len(line)] == line and len(pv) > len(line):
+            move = pv[len(line)]
+        else:
+            break
+        if not position.can_play(move):
+            break
+        line.append(move)
+        position.play(move)
+    for _ in line:
+        position.undo()
+    return line
 
 
 def Score_func(score_four: list, player: BoardPiece) -> int:
     """
-    computing scores depend on different move
+    computing scores depend on different move, for a window of any length n
+    (the weights are those of n = 4)
     :return: computed score
     """
 
     score = 0
+    n = len(score_four)
 
     # check which player score to maximize and which player to block
     if player == PLAYER1:
@@ -40,117 +289,301 @@ def Score_func(score_four: list, player: BoardPiece) -> int:
     else:
         opponent_player = PLAYER1
 
-    # check if agent (player) is close to getting a win by placing 4 adjacent pieces
-    if score_four.count(player) == 4:
+    # check if agent (player) is close to getting a win by placing n adjacent pieces
+    if score_four.count(player) == n:
         score += 100
-    elif score_four.count(player) == 3 and score_four.count(NO_PLAYER) == 1:
+    elif score_four.count(player) == n - 1 and score_four.count(NO_PLAYER) == 1:
         score += 5
-    elif score_four.count(player) == 2 and score_four.count(NO_PLAYER) == 2:
+    elif score_four.count(player) == n - 2 and score_four.count(NO_PLAYER) == 2:
         score += 2
 
     # block opponent from getting a win
-    if score_four.count(opponent_player) == 3 and score_four.count(NO_PLAYER) == 1:
+    if score_four.count(opponent_player) == n - 1 and score_four.count(NO_PLAYER) == 1:
         score -= 4
 
     return score
 
 
-def heuristic(board: np.ndarray, player: BoardPiece) -> int:
+def window_indices(num_rows: int = HEIGHT, num_columns: int = WIDTH, n: int = CONNECT_N) -> np.ndarray:
+    """
+    Returns the flat board indices of every window of `n` adjacent cells in a row,
+    column or diagonal, shape (number of windows, n).
+    """
+    windows = []
+    for d_row, d_col in ((0, 1), (1, 0), (1, 1), (-1, 1)):  # horizontal, vertical, both diagonals
+        for row in range(num_rows):
+            for col in range(num_columns):
+                cells = [(row + i * d_row, col + i * d_col) for i in range(n)]
+                if all(0 <= r < num_rows and 0 <= c < num_columns for r, c in cells):
+                    windows.append([r * num_columns + c for r, c in cells])
+    return np.array(windows, dtype=np.intp)
+
+
+# A cell is coded 0 if empty, 1 if it holds the player and n + 1 if it holds
+# the opponent, n being the length of the windows, so the sum over a window
+# tells both piece counts apart.
+def cell_codes(n: int = CONNECT_N) -> np.ndarray:
+    """
+    Returns the codes of the cells, cell_codes(n)[player][piece] being the
+    code of `piece` seen by `player`.
+    """
+    return np.array([[0, 0, 0], [0, 1, n + 1], [0, n + 1, 1]], dtype=np.intp)
+
+
+def window_score_table(n: int = CONNECT_N) -> np.ndarray:
+    """
+    Returns the Score_func score of a window of `n` cells indexed by the sum of its cell codes.
+    """
+    opponent_code = n + 1
+    table = np.zeros(n * opponent_code + 1, dtype=np.int64)
+    for n_player in range(n + 1):
+        for n_opponent in range(n + 1 - n_player):
+            n_empty = n - n_player - n_opponent
+            window = [PLAYER1] * n_player + [PLAYER2] * n_opponent + [NO_PLAYER] * n_empty
+            table[n_player + n_opponent * opponent_code] = Score_func(window, PLAYER1)
+    return table
+
+
+class HeuristicTables:
+    """
+    The tables of the heuristic for the boards of a config: the flat indices
+    of all its windows (`windows`, e.g. (69, 4) for the standard game), the
+    cell codes (see cell_codes), the scores of the windows by the sum of
+    their codes (`window_scores`) and the windows containing every cell
+    (`cell_windows`, as lists for IncrementalHeuristic).
+    """
+
+    def __init__(self, config: GameConfig):
+        self.windows = window_indices(config.height, config.width, config.connect_n)
+        self.cell_codes = cell_codes(config.connect_n)
+        self.window_scores = window_score_table(config.connect_n)
+        self.cell_windows = [np.flatnonzero((self.windows == cell).any(axis=1)).tolist()
+                             for cell in range(config.cells)]
+        self.window_score_list = self.window_scores.tolist()
+
+
+@functools.lru_cache(maxsize=None)
+def heuristic_tables(config: GameConfig) -> HeuristicTables:
+    """
+    Returns the heuristic tables of `config`, built on first use.
+    """
+    return HeuristicTables(config)
+
+
+DEFAULT_TABLES = heuristic_tables(DEFAULT_CONFIG)
+WINDOWS = DEFAULT_TABLES.windows
+OPPONENT_CODE = CONNECT_N + 1
+CELL_CODES = DEFAULT_TABLES.cell_codes
+WINDOW_SCORES = DEFAULT_TABLES.window_scores
+CENTER_WEIGHT = 3
+
+
+def _tables(shape: tuple, config: Optional[GameConfig]) -> HeuristicTables:
+    if config is not None:
+        return heuristic_tables(config)
+    if shape == (HEIGHT, WIDTH):
+        return DEFAULT_TABLES
+    return heuristic_tables(game_config(shape[0], shape[1]))
+
+
+def heuristic(board: np.ndarray, player: BoardPiece, config: Optional[GameConfig] = None) -> int:
     '''
-	Calculates score considering 4 adjacent spots of the board in each row, column, and diagonal
-	(checks how many empty and filled spots there are in 4 adjacent spots in all directions)
-	:param board: current state of board
-	:param player: player who wants to maximize score
-	:return: score that can be achieve by playing open position
-	'''
-    num_rows = board.shape[0]
-    num_columns = board.shape[1]
+    Calculates score considering 4 adjacent spots of the board in each row, column, and diagonal
+    (checks how many empty and filled spots there are in 4 adjacent spots in all directions)
+    with the weights of Score_func, plus CENTER_WEIGHT per piece in the center column.
+    The windows are gathered at once through the windows of the heuristic
+    tables of `config` (see kernels.window_heuristic), by default those of
+    connect CONNECT_N on boards of the dimensions of `board`.
+    :param board: current state of board
+    :param player: player who wants to maximize score
+    :return: score that can be achieve by playing open position
+    '''
+    tables = _tables(board.shape, config)
+    score = window_heuristic(board, tables.cell_codes[int(player)], tables.windows, tables.window_scores)
+    score += CENTER_WEIGHT * np.count_nonzero(board[:, board.shape[1] // 2] == player)
+    return int(score)
 
-    score = 0
 
-    # Score center column
-    center_array = [int(i) for i in list(board[:, num_columns // 2])]
-    center_count = center_array.count(player)
-    score += center_count * 3
-
-    # first check horizontal
-    for row in range(num_rows):  # loop through every row
-        row = board[row, :]
-        # now loop through each column and check 4 adjacent spots
-        for col in range(num_columns - 3):  # only need to loop through first 4 cols, since adjacent_4 would touch (j+3)
-            score_four = list(row[col:col + 4])  # convert to list to apply count() lalter
-            # now count the number of pieces for each player
-            score += Score_func(score_four, player)
-
-    # vertical
-    for col in range(num_columns):
-        col = board[:, col]
-        for row in range(num_rows - 3):
-            score_four = list(col[row:row + 4])
-            score += Score_func(score_four, player)
-
-    # score positive sloped diagonal
-    for row in range(num_rows - 3):  # rows
-        for col in range(num_columns - 3):  # cols
-            score_four = [board[row + i, col + i] for i in range(4)]
-            score += Score_func(score_four, player)
-
-    # score negative diagonal
-    for row in range(num_rows - 3):  # rows
-        for col in range(num_columns - 3):  # cols
-            score_four = [board[row + 3 - i, col + i] for i in range(4)]  # col increases but row decreases
-            score += Score_func(score_four, player)
+def heuristic_batch(boards: np.ndarray, player: BoardPiece, config: Optional[GameConfig] = None) -> np.ndarray:
+    """
+    Scores a stack of boards of shape (N, 6, 7) like heuristic in one call.
+    :return: array of N scores
+    """
+    tables = _tables(boards.shape[1:], config)
+    codes = tables.cell_codes[int(player)][boards.reshape(boards.shape[0], -1).astype(np.intp)]
+    scores = tables.window_scores[codes[:, tables.windows].sum(axis=2)].sum(axis=1)
+    scores += CENTER_WEIGHT * np.count_nonzero(boards[:, :, boards.shape[2] // 2] == player, axis=1)
+    return scores
+
 
-    return score
+class IncrementalHeuristic:
+    """
+    Keeps the heuristic score of a board for `player` up to date while pieces
+    are played and taken back, by updating only the windows through the cell
+    that changed. `score` always equals heuristic(board, player, config).
+    """
+
+    def __init__(self, board: np.ndarray, player: BoardPiece, config: Optional[GameConfig] = None):
+        tables = _tables(board.shape, config)
+        self.player = player
+        self.width = board.shape[1]
+        self.center = self.width // 2
+        # cell_windows[row * width + col] lists the windows containing that cell
+        self.cell_windows = tables.cell_windows
+        self.window_scores = tables.window_score_list
+        self.codes = tables.cell_codes[int(player)].tolist()
+        cell_codes = tables.cell_codes[int(player)][board.ravel().astype(np.intp)]
+        self.window_codes = cell_codes[tables.windows].sum(axis=1).tolist()
+        self.score = heuristic(board, player, config)
+
+    def _update(self, row: int, col: int, code: int):
+        window_codes = self.window_codes
+        window_scores = self.window_scores
+        score = self.score
+        for window in self.cell_windows[row * self.width + col]:
+            score -= window_scores[window_codes[window]]
+            window_codes[window] += code
+            score += window_scores[window_codes[window]]
+        self.score = score
+
+    def play(self, row: int, col: int, piece: BoardPiece):
+        """
+        Accounts for `piece` placed at board[row, col].
+        """
+        self._update(row, col, self.codes[int(piece)])
+        if col == self.center and piece == self.player:
+            self.score += CENTER_WEIGHT
+
+    def undo(self, row: int, col: int, piece: BoardPiece):
+        """
+        Accounts for `piece` removed from board[row, col].
+        """
+        self._update(row, col, -self.codes[int(piece)])
+        if col == self.center and piece == self.player:
+            self.score -= CENTER_WEIGHT
+
+
+def minimax(board: np.ndarray, depth: int, alpha: int, beta: int, player: BoardPiece, maximizing_player: bool,
+            table: Optional[TranspositionTable] = None, search: Optional[Search] = None,
+            config: Optional[GameConfig] = None) -> Tuple[int, int]:
+    """
+    Alpha-beta minimax search of `board` from the point of view of `player`.
+    The search runs on a bitboard Position, results are cached in `table` if given.
+    If `search` is given, its table and move ordering are used instead and its
+    counters are updated. `config` is the game played, see generate_move_minimax.
+    :return: best column and its score
+    """
+    if config is None:
+        config = board_config(board)
+    opponent = PLAYER2 if player == PLAYER1 else PLAYER1
+    position = Position.from_board(board, player if maximizing_player else opponent, config)
+    if search is None:
+        search = Search(table, config=config)
+    search.evaluator = IncrementalHeuristic(board, player, config)
+    result = _minimax(position, depth, alpha, beta, player, maximizing_player, search)
+    search.depth = depth
+    return result
 
 
-def minimax(board: np.ndarray, depth: int, alpha: int, beta: int, player: BoardPiece, maximizing_player: bool) -> Tuple[
-    int, int]:
+def ordered_moves(position: Position, search: Search, tt_move: Optional[int] = None) -> list:
+    """
+    Returns the legal columns ordered by the steps of `search.ordering`.
+    """
+    moves = position.legal_moves()
+    for step in search.ordering:
+        moves = step(position, search, moves, tt_move)
+    return moves
+
+
+def _play(position: Position, search: Search, column: int):
+    search.evaluator.play(position.column_height(column), column, position.player)
+    position.play(column)
+
+
+def _undo(position: Position, search: Search):
+    column = position.undo()
+    search.evaluator.undo(position.column_height(column), column, position.player)
+
+
+def _minimax(position: Position, depth: int, alpha: int, beta: int, player: BoardPiece, maximizing_player: bool,
+             search: Search) -> Tuple[int, int]:
+    search.check_clock()
+    table = search.table
+
     # check which player is the agent so that we don't max/min for wrong player
     if player == PLAYER1:
         opponent = PLAYER2
     else:
         opponent = PLAYER1
 
-    # check NO_PLAYER columns
-    finding_moves = find_moves(board)
+    # check if we're at a leaf/terminal node
+    if position.is_win(player):  # agent won
+        return None, WIN_SCORE
+    if position.is_win(opponent):  # opponent won
+        return None, -WIN_SCORE
+    if position.is_full():  # must be a draw
+        return None, 0
 
     # check if depth is 0
     if depth == 0:
-        score = heuristic(board, player)
-        return None, score
+        search.leaf_evals += 1
+        return None, search.evaluator.score
 
-    # check if we're at a leaf/terminal node
-    if check_end_state(board, player) != GameState.STILL_PLAYING:
-        if connected_four(board, player):  # agent won
-            return None, 10000000
-        if connected_four(board, opponent):  # opponent won
-            return None, -10000000
-        else:  # must be a draw
-            return None, 0
+    # check if this position was already searched deep enough
+    alpha_orig, beta_orig = alpha, beta
+    tt_move = None
+    if table is not None:
+        # a position and its mirror share their entry, the moves are stored for the canonical one
+        key, mirrored = position.canonical_hash()
+        entry = table.lookup(key)
+        if entry is not None and entry[3] >= 0:
+            tt_move = mirror_move(entry[3], mirrored, position.config.width)
+        if entry is not None and entry[0] >= depth:
+            _, entry_score, entry_flag, _ = entry
+            entry_move = tt_move
+            if entry_flag == EXACT:
+                return entry_move, entry_score
+            if entry_flag == LOWER_BOUND:
+                alpha = max(alpha, entry_score)
+            else:
+                beta = min(beta, entry_score)
+            if alpha >= beta:
+                return entry_move, entry_score
 
     if maximizing_player:  # get max score for agent
         score = -math.inf
-        for column in finding_moves:
-            board, board_copy = apply_player_action(board, column, player, True)
-            next_score = minimax(board_copy, depth - 1, alpha, beta, player, False)[1]
+        for index, column in enumerate(ordered_moves(position, search, tt_move)):
+            _play(position, search, column)
+            next_score = _minimax(position, depth - 1, alpha, beta, player, False, search)[1]
+            _undo(position, search)
             if next_score > score:
                 score = next_score
                 action_column = column
             alpha = max(alpha, score)
             if alpha >= beta:
+                search.record_cutoff(position, column, index, depth)
                 break
-        return action_column, score
 
     else:
         score = math.inf
-        for column in finding_moves:
-            board, action_board = apply_player_action(board, column, opponent, True)
-            next_score = minimax(action_board, depth - 1, alpha, beta, player, True)[1]
+        for index, column in enumerate(ordered_moves(position, search, tt_move)):
+            _play(position, search, column)
+            next_score = _minimax(position, depth - 1, alpha, beta, player, True, search)[1]
+            _undo(position, search)
             if next_score < score:
                 score = next_score
                 action_column = column
             beta = min(beta, score)  # get min score for opponent
             if alpha >= beta:
+                search.record_cutoff(position, column, index, depth)
                 break
-        return action_column, score
+
+    if table is not None:
+        if score <= alpha_orig:
+            flag = UPPER_BOUND
+        elif score >= beta_orig:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        table.store(key, depth, score, flag, mirror_move(action_column, mirrored, position.config.width))
+    return action_column, score
@@ -0,0 +1,66 @@
+import numpy as np
+from typing import Optional, Tuple
+
+# bound type of a stored score
+EXACT = 0
+LOWER_BOUND = 1  # the search failed high, the real score is >= the stored one
+UPPER_BOUND = 2  # the search failed low, the real score is <= the stored one
+
+TABLE_SIZE_LOG2 = 18
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table of search results indexed by the Zobrist hash of a
+    position (minimax uses Position.canonical_hash, so that a position and its
+    mirror share a slot). Every field lives in its own numpy array so the
+    memory used is bounded by the number of slots.
+
+    A slot is overwritten when it is empty, holds the same position, was written
+    during an older search (see new_search) or holds a shallower result.
+    """
+
+    def __init__(self, size_log2: int = TABLE_SIZE_LOG2):
+        self.size = 1 << size_log2
+        self.keys = np.zeros(self.size, dtype=np.int64)
+        self.depths = np.full(self.size, -1, dtype=np.int16)  # -1 marks an empty slot
+        self.scores = np.zeros(self.size, dtype=np.int32)
+        self.flags = np.zeros(self.size, dtype=np.int8)
+        self.moves = np.full(self.size, -1, dtype=np.int8)
+        self.generations = np.zeros(self.size, dtype=np.int16)
+        self.generation = 0
+        self.hits = 0  # lookups that found their position since the last new_search
+
+    def new_search(self):
+        """
+        Marks the entries of previous searches as replaceable. They are still
+        returned by lookup until they are overwritten. Resets the hit counter.
+        """
+        self.generation = (self.generation + 1) % np.iinfo(np.int16).max
+        self.hits = 0
+
+    def lookup(self, key: int) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Returns (depth, score, flag, move) stored for `key` or None.
+        """
+        index = key & (self.size - 1)
+        if self.depths[index] < 0 or int(self.keys[index]) != key:
+            return None
+        self.hits += 1
+        return int(self.depths[index]), int(self.scores[index]), int(self.flags[index]), int(self.moves[index])
+
+    def store(self, key: int, depth: int, score: int, flag: int, move: int):
+        index = key & (self.size - 1)
+        if (self.depths[index] >= 0 and int(self.keys[index]) != key
+                and self.generations[index] == self.generation and self.depths[index] > depth):
+            return
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.scores[index] = score
+        self.flags[index] = flag
+        self.moves[index] = move
+        self.generations[index] = self.generation
+
+    def clear(self):
+        self.depths[:] = -1
+        self.hits = 0
@@ -1,5 +1,5 @@
 import numpy as np
-from agents.common import BoardPiece, SavedState, PlayerAction
+from agents.common import BoardPiece, SavedState, PlayerAction, find_columns
 from typing import Optional, Tuple
 
 
@@ -7,9 +7,7 @@ def generate_move_random(
     board: np.ndarray, player: BoardPiece, saved_state: Optional[SavedState]
 ) -> Tuple[PlayerAction, Optional[SavedState]]:
     # Choose a valid, non-full column randomly and return it as `action`
-    action = np.random.choice(
-        np.argwhere(board[0, :] == 0).flatten()
-    )
+    action = np.random.choice(find_columns(board))
     return action, saved_state
 
 
@@ -0,0 +1,253 @@
+import numpy as np
+import time
+from typing import Optional, Tuple
+from agents.common import (BoardPiece, PlayerAction, SavedState, HEIGHT, WIDTH, COLUMN_BITS, COLUMN_MASK,
+                           Position, winning_cells, mirror_key, mirror_move)
+from agents.agent_minimax.minimax import SearchTimeout, CLOCK_STRIDE, iterative_deepening
+from agents.book import book_move
+from agents.time_manager import TimeManager, move_budget, end_move
+from agents.agent_minimax.transposition import TranspositionTable, TABLE_SIZE_LOG2, LOWER_BOUND, UPPER_BOUND
+
+CELLS = WIDTH * HEIGHT
+# A score is given for the player to move: a win with the player's k-th
+# remaining piece scores (CELLS + 1 - n) // 2 where n is the number of pieces
+# on the board before the winning move, so faster wins score higher; a loss
+# is the negated score of the opponent's win and a draw scores 0. No player
+# wins before their fourth piece, which bounds the scores of every position.
+MIN_SCORE = -(CELLS // 2) + 3
+MAX_SCORE = (CELLS + 1) // 2 - 3
+TIME_BUDGET = 10.0  # seconds searched per move by generate_move_solver without a time manager
+FALLBACK_SHARE = 0.2  # share of the budget of a move kept for the minimax search of an unsolved position
+# multiplier spreading the keys over the table, odd so that it is a bijection modulo 2 ** 63
+KEY_MULTIPLIER = 0x9E3779B97F4A7C15 & ((1 << 63) - 1)
+CENTER_ORDER = sorted(range(WIDTH), key=lambda col: abs(col - WIDTH // 2))
+
+
+class SolverState(SavedState):
+    """
+    Keeps the transposition table of the solver between moves, solved
+    positions stay valid for the rest of the game.
+    """
+
+    def __init__(self, table_size_log2: int = TABLE_SIZE_LOG2):
+        self.table = TranspositionTable(table_size_log2)
+        self.solver = None
+        self.time_manager = None
+
+
+def generate_move_solver(
+        board: np.ndarray, player: BoardPiece, saved_state: Optional[SavedState],
+        time_budget: Optional[float] = None, time_manager: Optional[TimeManager] = None
+) -> Tuple[PlayerAction, Optional[SavedState]]:
+    """
+    Plays the book move if `board` is in the opening book, or the forced move
+    if there is one (see Position.forced_move). Otherwise plays the move with
+    the best exact score if `board` can be solved within `time_budget`
+    seconds, or the budget given by the time manager (see
+    agents.time_manager.move_budget), or TIME_BUDGET seconds, less the
+    FALLBACK_SHARE of it. Otherwise plays the best move proven so far, or
+    when none is, the move of an iterative deepening minimax in the rest of
+    the budget.
+    """
+    if not isinstance(saved_state, SolverState):
+        saved_state = SolverState()
+    budget = move_budget(saved_state, board, time_budget, time_manager, TIME_BUDGET)
+    position = Position.from_board(board, player)
+    action = book_move(board, player)
+    if action is None:
+        action = position.forced_move()
+    if action is None:
+        saved_state.table.new_search()
+        deadline = time.monotonic() + budget
+        saved_state.solver = Solver(saved_state.table, deadline - FALLBACK_SHARE * budget)
+        action, lower, upper = saved_state.solver.solve(position)
+        if action is None:
+            action = iterative_deepening(board, player, max(0.0, deadline - time.monotonic()))[0]
+    end_move(saved_state)
+    return PlayerAction(action), saved_state
+
+
+def solve(board: np.ndarray, player: BoardPiece, time_budget: Optional[float] = None,
+          table: Optional[TranspositionTable] = None) -> Tuple[int, int]:
+    """
+    Returns the best move of `player` on `board` and its exact score.
+    :raise SearchTimeout: if `board` could not be solved within `time_budget` seconds
+    """
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+    action, lower, upper = Solver(table, deadline).solve(Position.from_board(board, player))
+    if lower != upper:
+        raise SearchTimeout()
+    return action, lower
+
+
+def win_distance(score: int, n_moves: int) -> Optional[int]:
+    """
+    Returns the number of plies until the game is won (`score` > 0) or lost
+    (`score` < 0) with perfect play, from a position with `n_moves` pieces and
+    score `score` (see MIN_SCORE). None for a draw.
+    """
+    if score == 0:
+        return None
+    # the winning move is the (CELLS + 2 - 2 * |score|)-th or the one before, whichever the winner plays
+    last_ply = CELLS + 2 - 2 * abs(score)
+    winner_parity = (n_moves + 1) % 2 if score > 0 else n_moves % 2
+    if last_ply % 2 != winner_parity:
+        last_ply -= 1
+    return last_ply - n_moves
+
+
+class Solver:
+    """
+    Exact negamax search with alpha-beta pruning. Only moves that do not let the
+    opponent win at once are searched, ordered by the number of winning cells
+    they create. Positions are stored in `table` under the key of the position
+    or of its mirror, whichever is smaller, and only the left half of the moves
+    of a symmetric position is searched.
+    """
+
+    def __init__(self, table: Optional[TranspositionTable] = None, deadline: Optional[float] = None):
+        self.table = table if table is not None else TranspositionTable()
+        self.deadline = deadline
+        self.nodes = 0
+        self.root_move = None  # move causing the last cutoff at the root
+
+    def check_clock(self):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % CLOCK_STRIDE == 0 and time.monotonic() > self.deadline:
+            raise SearchTimeout()
+
+    def solve(self, position: Position) -> Tuple[Optional[int], int, int]:
+        """
+        Narrows the score of `position` with null-window searches until it is
+        exact or the deadline has passed.
+        :return: a move scoring at least `lower` (None if no better move than
+                 the worst case is known yet), and `lower` and `upper`, the
+                 bounds of the score of `position`
+        """
+        n_moves = bin(position.mask).count('1')
+        for col in CENTER_ORDER:
+            if position.can_play(col) and position.is_winning_move(col):
+                score = (CELLS + 1 - n_moves) // 2
+                return col, score, score
+
+        self.root_move = None
+        best_move = None
+        worst = max(MIN_SCORE, -((CELLS - n_moves) // 2))
+        lower, upper = worst, min(MAX_SCORE, (CELLS + 1 - n_moves) // 2)
+        try:
+            while lower < upper:
+                # probe around zero first: finding the winner is cheaper than the win distance
+                middle = lower + (upper - lower) // 2
+                if middle <= 0 and int(lower / 2) < middle:
+                    middle = int(lower / 2)
+                elif middle >= 0 and int(upper / 2) > middle:
+                    middle = int(upper / 2)
+                self.root_move = None
+                score = self._negamax(position, middle, middle + 1, n_moves, n_moves)
+                if score <= middle:
+                    upper = score
+                else:
+                    lower = score
+                    best_move = self.root_move
+        except SearchTimeout:
+            pass
+        if best_move is None and (lower > worst or lower == upper):
+            # every move that does not lose at once is as good as proven
+            safe = self._non_losing_moves(position)
+            best_move = next((col for col in CENTER_ORDER if safe & (COLUMN_MASK << col * COLUMN_BITS)),
+                             next((col for col in CENTER_ORDER if position.can_play(col)), None))
+        return best_move, lower, upper
+
+    def analyze(self, position: Position) -> dict:
+        """
+        Returns the exact score of every legal move of `position`, for the
+        player to move.
+        """
+        n_moves = bin(position.mask).count('1')
+        scores = {}
+        for col in position.legal_moves():
+            if position.is_winning_move(col):
+                scores[col] = (CELLS + 1 - n_moves) // 2
+                continue
+            position.play(col)
+            try:
+                _, lower, upper = self.solve(position)
+            finally:
+                position.undo()
+            if lower != upper:
+                raise SearchTimeout()
+            scores[col] = -lower
+        return scores
+
+    def _non_losing_moves(self, position: Position) -> int:
+        """
+        Returns the bit mask of the moves that do not let the opponent win on
+        the next move, the immediate wins of the player to move excepted.
+        """
+        mask = position.mask
+        possible = position.legal_mask()
+        opponent_wins = winning_cells(position.pieces[position.side ^ 1], mask)
+        forced = possible & opponent_wins
+        if forced:
+            if forced & (forced - 1):  # two threats, the game is lost
+                return 0
+            possible = forced
+        return possible & ~(opponent_wins >> 1)  # never play below a winning cell of the opponent
+
+    def _negamax(self, position: Position, alpha: int, beta: int, n_moves: int, root_moves: int) -> int:
+        """
+        Returns the score of `position`, which has `n_moves` pieces and no
+        immediate win for the player to move, if it lies in (alpha, beta); a
+        score <= alpha is an upper bound and a score >= beta a lower bound.
+        """
+        self.check_clock()
+        possible = self._non_losing_moves(position)
+        if possible == 0:
+            return -((CELLS - n_moves) // 2)
+        if n_moves >= CELLS - 2:  # neither player can win any more
+            return 0
+
+        # the opponent does not win on the next move
+        alpha = max(alpha, -((CELLS - 2 - n_moves) // 2))
+        if alpha >= beta:
+            return alpha
+        # the player to move does not win on this move
+        beta = min(beta, (CELLS - 1 - n_moves) // 2)
+        key = position.key()
+        mirrored = mirror_key(key)
+        entry_key = (min(key, mirrored) * KEY_MULTIPLIER) & ((1 << 63) - 1)
+        entry = self.table.lookup(entry_key) if n_moves != root_moves else None  # the root must find its move
+        if entry is not None:
+            _, score, flag, _ = entry
+            if flag == LOWER_BOUND:
+                alpha = max(alpha, score)
+            elif flag == UPPER_BOUND:
+                beta = min(beta, score)
+        if alpha >= beta:
+            return alpha
+
+        moves = []
+        pieces = position.pieces[position.side]
+        for col in CENTER_ORDER:
+            if key == mirrored and col > WIDTH // 2:  # same scores as the mirrored moves
+                continue
+            move = possible & (COLUMN_MASK << col * COLUMN_BITS)
+            if move:
+                moves.append((bin(winning_cells(pieces | move, position.mask)).count('1'), col))
+        moves.sort(key=lambda move: -move[0])  # stable, the center first among equals
+
+        depth = CELLS - n_moves
+        for _, col in moves:
+            position.play(col)
+            try:
+                score = -self._negamax(position, -beta, -alpha, n_moves + 1, root_moves)
+            finally:
+                position.undo()
+            if score >= beta:
+                if n_moves == root_moves:
+                    self.root_move = col
+                self.table.store(entry_key, depth, score, LOWER_BOUND, mirror_move(col, mirrored < key))
+                return score
+            alpha = max(alpha, score)
+        self.table.store(entry_key, depth, alpha, UPPER_BOUND, -1)
+        return alpha
@@ -0,0 +1,187 @@
+"""
+Opening book: the best move and its score for every position of the first
+plies, computed once and stored in a binary file.
+
+The file holds a header (MAGIC, version, number of entries) followed by three
+arrays in little-endian order: the sorted canonical keys of the positions
+(see Position.canonical_key, uint64), their scores (int32) and their best
+moves (int8) in the canonical position, so that a position and its mirror
+share one entry.
+Books are opened with mmap and searched by binary search on the keys, so
+opening one costs nothing and the pages are shared between processes.
+
+The agents consult the default book (see book_move) before searching. It is
+read from DEFAULT_BOOK_PATH, or from the path in the environment variable
+CONNECT4_BOOK, and can be replaced with set_book. Build one with
+
+    python -m agents.book --ply 6 --depth 8 opening_book.bin
+"""
+import argparse
+import math
+import mmap
+import os
+import struct
+import time
+import numpy as np
+from typing import Callable, Optional, Tuple
+from agents.common import BoardPiece, Position, mirror_move
+
+MAGIC = b'C4BK'
+VERSION = 1
+HEADER = struct.Struct('<4sIQ')  # magic, version, number of entries
+BOOK_ENV_VARIABLE = 'CONNECT4_BOOK'
+DEFAULT_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening_book.bin')
+
+# An evaluator returns the best move of the player to move in a position and its score.
+Evaluator = Callable[[Position], Optional[Tuple[int, int]]]
+
+
+class OpeningBook:
+    """
+    Read-only view of a book file, see the module docstring.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f'{path} is not an opening book of version {VERSION}')
+        offset = HEADER.size
+        self.keys = np.frombuffer(self._mmap, dtype='<u8', count=count, offset=offset)
+        offset += 8 * count
+        self.scores = np.frombuffer(self._mmap, dtype='<i4', count=count, offset=offset)
+        offset += 4 * count
+        self.moves = np.frombuffer(self._mmap, dtype='i1', count=count, offset=offset)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, position: Position) -> Optional[Tuple[int, int]]:
+        """
+        Returns the best move and its score for `position`, or None if it is
+        not in the book.
+        """
+        key, mirrored = position.canonical_key()
+        key = np.uint64(key)
+        index = int(np.searchsorted(self.keys, key))
+        if index == len(self.keys) or self.keys[index] != key:
+            return None
+        return mirror_move(int(self.moves[index]), mirrored), int(self.scores[index])
+
+
+def write_book(path: str, entries: dict):
+    """
+    Writes a book file from a dict of canonical key: (best move, score), the
+    moves being those of the canonical positions.
+    """
+    keys = np.array(sorted(entries), dtype='<u8')
+    scores = np.array([entries[key][1] for key in keys.tolist()], dtype='<i4')
+    moves = np.array([entries[key][0] for key in keys.tolist()], dtype='i1')
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(keys)))
+        file.write(keys.tobytes())
+        file.write(scores.tobytes())
+        file.write(moves.tobytes())
+
+
+def minimax_evaluator(depth: int) -> Evaluator:
+    """
+    Evaluates positions with a depth `depth` minimax search.
+    """
+    from agents.agent_minimax.minimax import minimax
+
+    def evaluate(position: Position) -> Tuple[int, int]:
+        action, score = minimax(position.to_board(), depth, -math.inf, math.inf, position.player, True)
+        return action, int(score)
+    return evaluate
+
+
+def solver_evaluator(time_budget: float) -> Evaluator:
+    """
+    Evaluates positions with the exact solver, skipping the positions it
+    cannot solve within `time_budget` seconds.
+    """
+    from agents.agent_solver.solver import Solver
+
+    def evaluate(position: Position) -> Optional[Tuple[int, int]]:
+        action, lower, upper = Solver(deadline=time.monotonic() + time_budget).solve(position.copy())
+        return (action, lower) if lower == upper else None
+    return evaluate
+
+
+def build_book(max_ply: int, evaluate: Evaluator) -> dict:
+    """
+    Evaluates every position reachable in less than `max_ply` moves from the
+    empty board and in which the game is not over, one of each pair of
+    mirrored positions.
+    :return: a dict of canonical key: (best move, score), see write_book
+    """
+    entries = {}
+    layer = {Position().key(): Position()}
+    for ply in range(max_ply):
+        next_layer = {}
+        for key, position in layer.items():
+            result = evaluate(position)
+            if result is not None:
+                move, score = result
+                entries[key] = mirror_move(move, position.canonical_key()[1]), score
+            for col in position.legal_moves():
+                if position.is_winning_move(col):
+                    continue
+                child = position.copy()
+                child.play(col)
+                next_layer.setdefault(child.canonical_key()[0], child)
+        layer = next_layer
+    return entries
+
+
+_default_book = None
+_default_book_loaded = False
+
+
+def set_book(book: Optional[OpeningBook]):
+    """
+    Replaces the book consulted by book_move, None disables it.
+    """
+    global _default_book, _default_book_loaded
+    _default_book = book
+    _default_book_loaded = True
+
+
+def default_book() -> Optional[OpeningBook]:
+    """
+    Returns the book consulted by book_move, opening it on first use.
+    """
+    global _default_book_loaded
+    if not _default_book_loaded:
+        path = os.environ.get(BOOK_ENV_VARIABLE, DEFAULT_BOOK_PATH)
+        set_book(OpeningBook(path) if os.path.exists(path) else None)
+    return _default_book
+
+
+def book_move(board: np.ndarray, player: BoardPiece) -> Optional[int]:
+    """
+    Returns the book move of `player` on `board`, or None if the position is
+    not in the default book or there is no book.
+    """
+    book = default_book()
+    if book is None:
+        return None
+    entry = book.lookup(Position.from_board(board, player))
+    return entry[0] if entry is not None else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds an opening book.')
+    parser.add_argument('output', nargs='?', default=DEFAULT_BOOK_PATH)
+    parser.add_argument('--ply', type=int, default=6, help='positions of less than PLY moves are stored')
+    parser.add_argument('--depth', type=int, default=8, help='minimax search depth')
+    parser.add_argument('--solver', type=float, metavar='SECONDS',
+                        help='solve the positions with this time budget each instead of minimax')
+    args = parser.parse_args()
+    evaluator = solver_evaluator(args.solver) if args.solver else minimax_evaluator(args.depth)
+    book_entries = build_book(args.ply, evaluator)
+    write_book(args.output, book_entries)
+    print(f'{len(book_entries)} positions written to {args.output}')
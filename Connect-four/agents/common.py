@@ -1,17 +1,10 @@
+import functools
 from enum import Enum
 from typing import Optional
 from typing import Callable, Tuple
 import numpy as np
 from scipy.signal.sigtools import _convolve2d
-from numba import njit
-
-
-
-disable_jit = True
-if disable_jit:
-    import os
-    os.environ['NUMBA_DISABLE_JIT'] = '1'
-
+from agents.kernels import drop_row, legal_columns, connected_at
 
 BoardPiece = np.int8  # The data type (dtype) of the board
 NO_PLAYER = BoardPiece(0)  # board[i, j] == NO_PLAYER, the position is empty
@@ -39,13 +32,14 @@ class GameState(Enum):
     STILL_PLAYING = 0
 
 
-def initialize_game_state() -> np.ndarray:
+def initialize_game_state(config: Optional['GameConfig'] = None) -> np.ndarray:
     """
-    Returns an ndarray, shape (6, 7) and data type (dtype) BoardPiece, initialized to 0 (NO_PLAYER).
+    Returns an ndarray, shape (6, 7) (or the dimensions of `config`) and data type (dtype) BoardPiece,
+    initialized to 0 (NO_PLAYER).
     """
-    legal_players = ["X", "O"]
-    board = [[] for x in range(WIDTH)]
-    return np.full((HEIGHT, WIDTH), NO_PLAYER)
+    if config is None:
+        return np.full((HEIGHT, WIDTH), NO_PLAYER)
+    return np.full((config.height, config.width), NO_PLAYER)
 
 
 def pretty_print_board(board: np.ndarray) -> str:
@@ -64,7 +58,8 @@ def pretty_print_board(board: np.ndarray) -> str:
     |0 1 2 3 4 5 6 |
     """
 
-    new_board = "|==============|\n"
+    border = "|" + "==" * board.shape[1] + "|\n"
+    new_board = border
 
     for row in board:
         new_board += "|"
@@ -76,8 +71,8 @@ def pretty_print_board(board: np.ndarray) -> str:
             elif position == PLAYER2:
                 new_board += "O "
         new_board += "|\n"
-    new_board += "|==============|\n"
-    new_board += "|0 1 2 3 4 5 6 |\n"
+    new_board += border
+    new_board += "|" + "".join(f"{col} " for col in range(board.shape[1])) + "|\n"
     return new_board
 
 
@@ -88,9 +83,12 @@ def string_to_board(pp_board: str) -> np.ndarray:
     board state as a string.
     """
     lines = pp_board.split("\n")
-    game_state = np.zeros((HEIGHT, WIDTH))
-    for ind, row in enumerate(lines[1:WIDTH]):
-        build_row = np.zeros(WIDTH)
+    # the rows are between two borders two characters per column wide
+    width = (len(lines[0]) - 2) // 2
+    height = lines.index(lines[0], 1) - 1
+    game_state = np.zeros((height, width))
+    for ind, row in enumerate(lines[1:height + 1]):
+        build_row = np.zeros(width)
         for ind2, char in enumerate(row[:-1]):
             if char == '' and ind2 % 2 == 1:
                 build_row[int((ind2 - 1) / 2)] = NO_PLAYER
@@ -104,7 +102,7 @@ def string_to_board(pp_board: str) -> np.ndarray:
 
 def check_valid_action(board: np.ndarray, action: np.int8) -> bool:
 
-    return board[5, action] == NO_PLAYER
+    return board[board.shape[0] - 1, action] == NO_PLAYER
 
 
 def apply_player_action(board: np.ndarray, action: np.int8,
@@ -128,60 +126,478 @@ def apply_player_action(board: np.ndarray, action: np.int8,
         else:
             copied_board = board
 
-        for row in range(HEIGHT):
-            if copied_board[row, action] == NO_PLAYER:
-                copied_board[row, action] = player
-                break
+        copied_board[drop_row(copied_board, action), action] = player
     else:
         raise Exception('Cannot place player in that particular position')
 
     return copied_board, board
 
 
-col_kernel = np.ones((CONNECT_N, 1), dtype=BoardPiece)
-row_kernel = np.ones((1, CONNECT_N), dtype=BoardPiece)
-dia_l_kernel = np.diag(np.ones(CONNECT_N, dtype=BoardPiece))
-dia_r_kernel = np.array(np.diag(np.ones(CONNECT_N, dtype=BoardPiece))[::-1, :])
-
-
 def connected_four(
-    board: np.ndarray, player: BoardPiece, _last_action: Optional[PlayerAction] = None
+    board: np.ndarray, player: BoardPiece, last_action: Optional[PlayerAction] = None,
+    config: Optional['GameConfig'] = None,
 ) -> bool:
+    """
+    Returns True if `player` has CONNECT_N pieces (`config.connect_n` if
+    given) in a line on `board`.
+
+    If `last_action` is given, only the lines through the top piece of that column
+    are checked, which is enough when the column holds the last piece played.
+    """
+    if last_action is not None:
+        connect_n = CONNECT_N if config is None else config.connect_n
+        return _connected_through_last_action(board, player, last_action, connect_n)
+    if config is None:
+        config = board_config(board)
+
     board = board.copy()
 
     other_player = BoardPiece(player % 2 + 1)
     board[board == other_player] = NO_PLAYER
     board[board == player] = BoardPiece(1)
 
-    for kernel in (col_kernel, row_kernel, dia_l_kernel, dia_r_kernel):
+    for kernel in config.line_kernels:
         result = _convolve2d(board, kernel, 1, 0, 0, BoardPiece(0))
-        if np.any(result == CONNECT_N):
+        if np.any(result == config.connect_n):
             return True
     return False
 
 
+def _connected_through_last_action(board: np.ndarray, player: BoardPiece, last_action: PlayerAction,
+                                   connect_n: int) -> bool:
+    """
+    Counts the pieces of `player` on the four lines through the top piece of
+    column `last_action`.
+    """
+    col = int(last_action)
+    rows = np.flatnonzero(board[:, col])
+    if rows.size == 0:
+        return False
+    row = rows[-1]
+    if board[row, col] != player:
+        return False
+    return connected_at(board, int(row), col, int(player), connect_n)
+
+
 def check_end_state(
     board: np.ndarray, player: BoardPiece, last_action: Optional[PlayerAction] = None,
+    config: Optional['GameConfig'] = None,
 ) -> GameState:
     """
     Returns the current game state for the current `player`, i.e. has their last
     action won (GameState.IS_WIN) or drawn (GameState.IS_DRAW) the game,
     or is play still on-going (GameState.STILL_PLAYING)?
+    Passing `last_action` restricts the win check to the lines through that move.
+    `config` gives the number of pieces in a line to win, see connected_four.
     """
-    if connected_four(board, player):
+    if connected_four(board, player, last_action, config):
         return GameState.IS_WIN
-    elif np.count_nonzero(board) == HEIGHT*WIDTH:
+    elif np.count_nonzero(board) == board.size:
         return GameState.IS_DRAW
     else:
         return GameState.STILL_PLAYING
 
 
+# Bitboard layout: column-major with HEIGHT + 1 bits per column, bit
+# col * (HEIGHT + 1) + row holds board[row, col]. The extra (sentinel) bit on top
+# of every column stays empty so that shifting never wraps a line into the
+# next column.
+class GameConfig:
+    """
+    The dimensions of a game, `height` rows, `width` columns and `connect_n`
+    pieces in a line to win, with the tables derived from them: the bitboard
+    layout, the Zobrist keys, the cells mirrored left-right, the distance of
+    every column to the center and the kernels of connected_four. `has_line`
+    and `winning_cells` are bitboard_has_four and winning_cells for the
+    config. Get configs with game_config, which builds every one once; the
+    module constants are those of DEFAULT_CONFIG, the standard 6x7 connect
+    four, whose functions are the specialized ones of this module.
+    Boards of a config with width * (height + 1) > 63 (e.g. 9x9) do not fit
+    in the int64 bitboards of the batched rollouts (see `fits_int64`).
+    """
+
+    def __init__(self, height: int = HEIGHT, width: int = WIDTH, connect_n: int = CONNECT_N):
+        if height < 1 or width < 1 or not 2 <= connect_n <= max(height, width):
+            raise ValueError(f'no game of connect {connect_n} on {height}x{width} boards')
+        self.height = height
+        self.width = width
+        self.connect_n = connect_n
+        self.cells = height * width
+        self.column_bits = height + 1
+        self.bottom_mask = sum(1 << (col * self.column_bits) for col in range(width))
+        self.board_mask = self.bottom_mask * ((1 << height) - 1)
+        self.column_mask = (1 << self.column_bits) - 1
+        # shifts for vertical, horizontal and both diagonal directions
+        self.line_shifts = (1, self.column_bits, self.column_bits - 1, self.column_bits + 1)
+        self.fits_int64 = width * self.column_bits <= 63
+        # zobrist_keys[player - 1][bit], drawn from a fixed seed so that
+        # hashes are the same in every process
+        self.zobrist_keys = np.random.default_rng(4).integers(
+            0, 2 ** 63, size=(2, width * self.column_bits), dtype=np.int64
+        ).tolist()
+        # mirror_bits[bit] is the bit of the cell mirrored left-right
+        self.mirror_bits = [(width - 1 - bit // self.column_bits) * self.column_bits + bit % self.column_bits
+                            for bit in range(width * self.column_bits)]
+        self.center_distance = [abs(col - width // 2) for col in range(width)]
+        # column, row and both diagonals
+        diagonal = np.diag(np.ones(connect_n, dtype=BoardPiece))
+        self.line_kernels = (np.ones((connect_n, 1), dtype=BoardPiece), np.ones((1, connect_n), dtype=BoardPiece),
+                             diagonal, np.array(diagonal[::-1, :]))
+        if (height, width, connect_n) == (HEIGHT, WIDTH, CONNECT_N):
+            self.has_line, self.winning_cells = bitboard_has_four, winning_cells
+        else:
+            self.has_line = functools.partial(bitboard_has_line, config=self)
+            self.winning_cells = functools.partial(line_winning_cells, config=self)
+
+    def __repr__(self) -> str:
+        return f'GameConfig({self.height}, {self.width}, {self.connect_n})'
+
+
+_configs = {}  # (height, width, connect_n): GameConfig
+
+
+def game_config(height: int = HEIGHT, width: int = WIDTH, connect_n: int = CONNECT_N) -> GameConfig:
+    """
+    Returns the GameConfig of the given dimensions, built on first use, so
+    that there is one config of every dimensions.
+    """
+    key = (int(height), int(width), int(connect_n))
+    config = _configs.get(key)
+    if config is None:
+        config = _configs[key] = GameConfig(*key)
+    return config
+
+
+def board_config(board: np.ndarray, connect_n: int = CONNECT_N) -> GameConfig:
+    """
+    Returns the config of the dimensions of `board`.
+    """
+    return game_config(board.shape[0], board.shape[1], connect_n)
+
+
+def bitboard_has_four(bitboard: int) -> bool:
+    """
+    Returns True if the pieces in `bitboard` contain CONNECT_N in a line.
+    """
+    for shift in LINE_SHIFTS:
+        pairs = bitboard & (bitboard >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+
+def bitboards_have_four(bitboards: np.ndarray) -> np.ndarray:
+    """
+    bitboard_has_four of every bitboard of an int64 array.
+    """
+    found = np.zeros(bitboards.shape, dtype=np.bool_)
+    for shift in LINE_SHIFTS:
+        pairs = bitboards & (bitboards >> shift)
+        found |= pairs & (pairs >> (2 * shift)) != 0
+    return found
+
+
+def winning_cells(bitboard: int, mask: int) -> int:
+    """
+    Returns the bit mask of the empty cells (not in `mask`) that would complete
+    CONNECT_N in a line for the pieces in `bitboard`, playable or not.
+    """
+    # vertical
+    cells = (bitboard << 1) & (bitboard << 2) & (bitboard << 3)
+    for shift in LINE_SHIFTS[1:]:
+        # two pieces on one side and one or two on the other
+        pair = (bitboard << shift) & (bitboard << 2 * shift)
+        cells |= pair & (bitboard << 3 * shift)
+        cells |= pair & (bitboard >> shift)
+        pair = (bitboard >> shift) & (bitboard >> 2 * shift)
+        cells |= pair & (bitboard << shift)
+        cells |= pair & (bitboard >> 3 * shift)
+    return cells & (BOARD_MASK ^ mask)
+
+
+def bitboard_has_line(bitboard: int, config: GameConfig) -> bool:
+    """
+    bitboard_has_four for the layout and `connect_n` of `config`.
+    """
+    for shift in config.line_shifts:
+        # cells starting a line of `length` pieces, doubling the length while it can
+        line, length = bitboard, 1
+        while length < config.connect_n:
+            step = min(length, config.connect_n - length)
+            line &= line >> (step * shift)
+            length += step
+        if line:
+            return True
+    return False
+
+
+def line_winning_cells(bitboard: int, mask: int, config: GameConfig) -> int:
+    """
+    winning_cells for the layout and `connect_n` of `config`.
+    """
+    cells = 0
+    for shift in config.line_shifts:
+        # the empty cell at every place of the line
+        for gap in range(config.connect_n):
+            line = config.board_mask
+            for place in range(config.connect_n):
+                offset = (place - gap) * shift
+                if offset > 0:
+                    line &= bitboard >> offset
+                elif offset < 0:
+                    line &= bitboard << -offset
+            cells |= line
+    return cells & (config.board_mask ^ mask)
+
+
+def mirror_key(key: int, config: Optional[GameConfig] = None) -> int:
+    """
+    Returns the left-right mirror of a key (see Position.key) or bitboard.
+    """
+    if config is None:
+        config = DEFAULT_CONFIG
+    mirrored = 0
+    for col in range(config.width):
+        mirrored |= (((key >> (col * config.column_bits)) & config.column_mask)
+                     << ((config.width - 1 - col) * config.column_bits))
+    return mirrored
+
+
+def mirror_move(action: PlayerAction, mirrored: bool, width: int = WIDTH) -> PlayerAction:
+    """
+    Maps a move between a position and its mirror when `mirrored` is True,
+    e.g. the move stored under a canonical key (see Position.canonical_key)
+    back to the position it was looked up for.
+    """
+    return PlayerAction(width - 1 - action) if mirrored else action
+
+
+DEFAULT_CONFIG = game_config()
+COLUMN_BITS = DEFAULT_CONFIG.column_bits
+BOTTOM_MASK = DEFAULT_CONFIG.bottom_mask
+BOARD_MASK = DEFAULT_CONFIG.board_mask
+LINE_SHIFTS = DEFAULT_CONFIG.line_shifts
+ZOBRIST_KEYS = DEFAULT_CONFIG.zobrist_keys
+COLUMN_MASK = DEFAULT_CONFIG.column_mask
+MIRROR_BITS = DEFAULT_CONFIG.mirror_bits
+
+
+def canonical_key(board: np.ndarray, player: Optional[BoardPiece] = None) -> Tuple[int, bool]:
+    """
+    Returns the canonical key of `board` and whether it is the key of the
+    mirrored board, see Position.canonical_key.
+    """
+    return Position.from_board(board, player).canonical_key()
+
+
+class Position:
+    """
+    Compact bitboard representation of a board: one bit mask per player plus
+    the next free bit of every column. Playing, undoing, listing legal moves
+    and testing for a win are all O(1) (or O(WIDTH) for the lists of columns).
+    `hash` is the Zobrist hash of the pieces and `mirror_hash` the one of the
+    left-right mirrored pieces, both are updated on play and undo.
+    `config` gives the dimensions of the game and the bitboard layout, see GameConfig.
+
+    Boards are expected to follow gravity, i.e. no holes below a piece.
+    """
+    __slots__ = ('pieces', 'heights', 'moves', 'side', 'hash', 'mirror_hash', 'config')
+
+    def __init__(self, player: BoardPiece = PLAYER1, config: Optional[GameConfig] = None):
+        if config is None:
+            config = DEFAULT_CONFIG
+        self.config = config
+        self.pieces = [0, 0]  # pieces[player - 1] is the mask of `player`
+        self.heights = [col * config.column_bits for col in range(config.width)]  # next free bit per column
+        self.moves = []  # columns played since construction, for undo
+        self.side = int(player) - 1  # index of the player to move
+        self.hash = 0
+        self.mirror_hash = 0
+
+    @classmethod
+    def from_board(cls, board: np.ndarray, player: Optional[BoardPiece] = None,
+                   config: Optional[GameConfig] = None) -> 'Position':
+        """
+        Builds a Position from an ndarray board. `player` is the player to move,
+        if omitted it is inferred from the number of pieces of each player.
+        `config` defaults to the config of the dimensions of `board`, connect CONNECT_N.
+        """
+        if config is None:
+            config = board_config(board)
+        position = cls(config=config)
+        column_bits, zobrist_keys, mirror_bits = config.column_bits, config.zobrist_keys, config.mirror_bits
+        for col in range(config.width):
+            for row in range(config.height):
+                if board[row, col] == NO_PLAYER:
+                    continue
+                index = int(board[row, col]) - 1
+                bit = col * column_bits + row
+                position.pieces[index] |= 1 << bit
+                position.hash ^= zobrist_keys[index][bit]
+                position.mirror_hash ^= zobrist_keys[index][mirror_bits[bit]]
+                position.heights[col] = bit + 1
+        if player is None:
+            n_player1 = np.count_nonzero(board == PLAYER1)
+            n_player2 = np.count_nonzero(board == PLAYER2)
+            player = PLAYER2 if n_player1 > n_player2 else PLAYER1
+        position.side = int(player) - 1
+        return position
+
+    def to_board(self) -> np.ndarray:
+        """
+        Returns the position as an ndarray board, see initialize_game_state.
+        """
+        config = self.config
+        board = initialize_game_state(config)
+        for col in range(config.width):
+            for row in range(config.height):
+                bit = 1 << (col * config.column_bits + row)
+                if self.pieces[0] & bit:
+                    board[row, col] = PLAYER1
+                elif self.pieces[1] & bit:
+                    board[row, col] = PLAYER2
+        return board
+
+    def copy(self) -> 'Position':
+        position = Position.__new__(Position)
+        position.pieces = self.pieces.copy()
+        position.heights = self.heights.copy()
+        position.moves = self.moves.copy()
+        position.side = self.side
+        position.hash = self.hash
+        position.mirror_hash = self.mirror_hash
+        position.config = self.config
+        return position
+
+    @property
+    def player(self) -> BoardPiece:
+        """
+        The player to move.
+        """
+        return BoardPiece(self.side + 1)
+
+    @property
+    def mask(self) -> int:
+        """
+        Bit mask of all occupied cells.
+        """
+        return self.pieces[0] | self.pieces[1]
+
+    def key(self) -> int:
+        """
+        Unique key of the position: the pieces of the player to move plus the
+        mask of all pieces and the bottom row, so that every column holds its
+        pieces under a single 1 bit. It fits in WIDTH * COLUMN_BITS bits.
+        """
+        return self.pieces[self.side] + self.mask + self.config.bottom_mask
+
+    def canonical_key(self) -> Tuple[int, bool]:
+        """
+        Returns the smaller of the keys of the position and of its mirror, and
+        True if it is the mirror's. A position and its mirror have the same
+        canonical key; map moves with mirror_move.
+        """
+        key = self.key()
+        mirrored = mirror_key(key, self.config)
+        return (mirrored, True) if mirrored < key else (key, False)
+
+    def canonical_hash(self) -> Tuple[int, bool]:
+        """
+        Like canonical_key, for the Zobrist hashes.
+        """
+        if self.mirror_hash < self.hash:
+            return self.mirror_hash, True
+        return self.hash, False
+
+    def is_symmetric(self) -> bool:
+        return (self.pieces[0] == mirror_key(self.pieces[0], self.config)
+                and self.pieces[1] == mirror_key(self.pieces[1], self.config))
+
+    def legal_mask(self) -> int:
+        """
+        Bit mask with the next free cell of every non-full column set.
+        """
+        return (self.mask + self.config.bottom_mask) & self.config.board_mask
+
+    def column_height(self, action: PlayerAction) -> int:
+        """
+        Number of pieces in column `action`, i.e. the row the next piece lands in.
+        """
+        return self.heights[action] - action * self.config.column_bits
+
+    def can_play(self, action: PlayerAction) -> bool:
+        return self.heights[action] < action * self.config.column_bits + self.config.height
+
+    def legal_moves(self) -> list:
+        """
+        Returns the list of columns that are not full, like find_columns.
+        """
+        column_bits, height = self.config.column_bits, self.config.height
+        return [col for col, next_bit in enumerate(self.heights) if next_bit < col * column_bits + height]
+
+    def play(self, action: PlayerAction):
+        """
+        Drops a piece of the player to move in column `action`.
+        The column must not be full, see can_play.
+        """
+        zobrist_keys = self.config.zobrist_keys[self.side]
+        bit = self.heights[action]
+        self.pieces[self.side] |= 1 << bit
+        self.hash ^= zobrist_keys[bit]
+        self.mirror_hash ^= zobrist_keys[self.config.mirror_bits[bit]]
+        self.heights[action] = bit + 1
+        self.moves.append(action)
+        self.side ^= 1
+
+    def undo(self) -> PlayerAction:
+        """
+        Takes back the last move made with play and returns its column.
+        """
+        action = self.moves.pop()
+        self.side ^= 1
+        bit = self.heights[action] - 1
+        self.heights[action] = bit
+        self.pieces[self.side] ^= 1 << bit
+        zobrist_keys = self.config.zobrist_keys[self.side]
+        self.hash ^= zobrist_keys[bit]
+        self.mirror_hash ^= zobrist_keys[self.config.mirror_bits[bit]]
+        return action
+
+    def is_win(self, player: BoardPiece) -> bool:
+        """
+        Returns True if `player` has CONNECT_N pieces in a line.
+        """
+        return self.config.has_line(self.pieces[int(player) - 1])
+
+    def is_winning_move(self, action: PlayerAction) -> bool:
+        """
+        Returns True if the player to move wins by playing column `action`.
+        """
+        return self.config.has_line(self.pieces[self.side] | (1 << self.heights[action]))
+
+    def is_full(self) -> bool:
+        return self.mask == self.config.board_mask
+
+    def forced_move(self) -> Optional[PlayerAction]:
+        """
+        Returns the move that needs no search: the only legal move, a winning
+        move, or the only cell where the opponent would win next. None if
+        there is none.
+        """
+        moves = self.legal_moves()
+        if len(moves) == 1:
+            return moves[0]
+        for col in moves:
+            if self.is_winning_move(col):
+                return col
+        threats = self.config.winning_cells(self.pieces[self.side ^ 1], self.mask) & self.legal_mask()
+        if threats and not threats & (threats - 1):
+            return (threats.bit_length() - 1) // self.config.column_bits
+        return None
+
+
 def find_columns(board: np.ndarray) -> list:
     """
     returns a list of column index numbers.
     """
-    col_list = []
-    for col in range(WIDTH):
-        if board[5, col] == NO_PLAYER:
-            col_list.append(col)
-    return col_list
+    return legal_columns(board).tolist()
@@ -0,0 +1,100 @@
+"""
+Search statistics and profiling of the agents.
+
+The minimax and MCTS agents collect statistics of every move they generate (a
+dict, see Search.stats and MCTSStats.as_dict), keep those of the last move in
+their saved state as `stats` and pass them to report, which hands them to the
+callback set with set_stats_callback, if any.
+
+Moves generated under `profiling` run under cProfile when a profile path is
+set, with set_profile_path or the environment variable CONNECT4_PROFILE. The
+profile accumulates over the moves and is written to that path after each
+one; read it with
+
+    python -m pstats profile.out
+"""
+import cProfile
+import os
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+PROFILE_ENV_VARIABLE = 'CONNECT4_PROFILE'
+
+# called with the name of the agent and the statistics of its move
+StatsCallback = Callable[[str, dict], None]
+
+_stats_callback = None
+_profile_path = os.environ.get(PROFILE_ENV_VARIABLE) or None
+_profiler = None
+_profiling_depth = 0  # nested profiling blocks, only the outermost one enables the profiler
+
+
+def set_stats_callback(callback: Optional[StatsCallback]):
+    """
+    Sets the function called with the statistics of every move, None for none.
+    """
+    global _stats_callback
+    _stats_callback = callback
+
+
+def report(agent: str, stats: dict):
+    """
+    Passes the statistics of a move of `agent` to the stats callback.
+    """
+    if _stats_callback is not None:
+        _stats_callback(agent, stats)
+
+
+def set_profile_path(path: Optional[str]):
+    """
+    Enables profiling, the profile being written to `path`, or disables it if
+    `path` is None. The profile collected so far is discarded.
+    """
+    global _profile_path, _profiler
+    _profile_path = path
+    _profiler = None
+
+
+def profiling_enabled() -> bool:
+    return _profile_path is not None
+
+
+@contextmanager
+def profiling():
+    """
+    Profiles the block with cProfile if profiling is enabled.
+    """
+    global _profiler, _profiling_depth
+    if _profile_path is None or _profiling_depth > 0:
+        _profiling_depth += 1
+        try:
+            yield
+        finally:
+            _profiling_depth -= 1
+        return
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+    _profiling_depth += 1
+    _profiler.enable()
+    try:
+        yield
+    finally:
+        _profiler.disable()
+        _profiling_depth -= 1
+        _profiler.dump_stats(_profile_path)
+
+
+def format_stats(agent: str, stats: dict) -> str:
+    """
+    Returns the statistics of a move on one line, histograms left out.
+    """
+    fields = []
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            fields.extend(f'{key}.{name} {item:.3f}' if isinstance(item, float) else f'{key}.{name} {item}'
+                          for name, item in value.items())
+        elif isinstance(value, float):
+            fields.append(f'{key} {value:.3f}')
+        elif not isinstance(value, (list, tuple)):
+            fields.append(f'{key} {value}')
+    return f'{agent}: ' + ', '.join(fields)
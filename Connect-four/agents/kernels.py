@@ -0,0 +1,274 @@
+"""
+Hot loops of the agents written as Numba-compilable kernels.
+
+Compilation is opt-in: set the environment variable CONNECT4_JIT=1 before
+starting, or call set_jit(True). Without it (or without numba installed) every
+kernel runs its Python fallback, which gives the same results. Compiled code
+is cached on disk (numba's cache=True), and precompile() compiles or loads all
+kernels up front so that the first move is not slowed down.
+"""
+import os
+import types
+import numpy as np
+from typing import Callable, Optional
+
+try:
+    import numba
+except ImportError:  # numba is optional
+    numba = None
+
+JIT_ENV_VARIABLE = 'CONNECT4_JIT'
+_jit_enabled = numba is not None and os.environ.get(JIT_ENV_VARIABLE, '0') == '1'
+
+
+def jit_enabled() -> bool:
+    return _jit_enabled
+
+
+def set_jit(enabled: bool):
+    """
+    Switches between the compiled kernels and their Python fallbacks.
+    """
+    global _jit_enabled
+    if enabled and numba is None:
+        raise ImportError('numba is needed to compile the kernels')
+    _jit_enabled = enabled
+
+
+class Kernel:
+    """
+    A function with a Numba-compilable `source` and a Python `fallback`
+    (the source itself when not given), called depending on jit_enabled.
+    Kernels called inside a source are replaced by their compiled version
+    when it is compiled.
+    """
+
+    def __init__(self, source: Callable, fallback: Optional[Callable] = None):
+        self.source = source
+        self.fallback = fallback if fallback is not None else source
+        self._compiled = None
+        self.__name__ = source.__name__
+        self.__doc__ = source.__doc__
+
+    def compiled(self) -> Callable:
+        if self._compiled is None:
+            function_globals = dict(self.source.__globals__)
+            for name in self.source.__code__.co_names:
+                value = function_globals.get(name)
+                if isinstance(value, Kernel) and value is not self:
+                    function_globals[name] = value.compiled()
+            function = types.FunctionType(self.source.__code__, function_globals, self.source.__name__,
+                                          self.source.__defaults__)
+            function.__qualname__ = self.source.__qualname__
+            function.__module__ = self.source.__module__
+            self._compiled = numba.njit(cache=True)(function)
+        return self._compiled
+
+    def __call__(self, *args):
+        if _jit_enabled:
+            return self.compiled()(*args)
+        return self.fallback(*args)
+
+
+def kernel(fallback: Optional[Callable] = None) -> Callable[[Callable], Kernel]:
+    """
+    Decorator turning a function into a Kernel with the given fallback.
+    """
+    def decorate(source: Callable) -> Kernel:
+        return Kernel(source, fallback)
+    return decorate
+
+
+@kernel()
+def drop_row(board: np.ndarray, action: int) -> int:
+    """
+    Returns the row where a piece dropped in column `action` lands, -1 if the column is full.
+    """
+    for row in range(board.shape[0]):
+        if board[row, action] == 0:
+            return row
+    return -1
+
+
+def _legal_columns(board: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(board[board.shape[0] - 1, :] == 0)
+
+
+@kernel(_legal_columns)
+def legal_columns(board: np.ndarray) -> np.ndarray:
+    """
+    Returns the columns of `board` that are not full.
+    """
+    top = board.shape[0] - 1
+    columns = np.empty(board.shape[1], dtype=np.int64)
+    n = 0
+    for col in range(board.shape[1]):
+        if board[top, col] == 0:
+            columns[n] = col
+            n += 1
+    return columns[:n]
+
+
+@kernel()
+def connected_at(board: np.ndarray, row: int, col: int, player: int, n: int) -> bool:
+    """
+    Returns True if `player` has `n` pieces in a line through board[row, col].
+    """
+    num_rows, num_columns = board.shape
+    for d_row, d_col in ((1, 0), (0, 1), (1, 1), (1, -1)):
+        count = 1
+        for sign in (1, -1):
+            r, c = row + sign * d_row, col + sign * d_col
+            while 0 <= r < num_rows and 0 <= c < num_columns and board[r, c] == player:
+                count += 1
+                r, c = r + sign * d_row, c + sign * d_col
+        if count >= n:
+            return True
+    return False
+
+
+def _window_heuristic(board: np.ndarray, codes: np.ndarray, windows: np.ndarray, window_scores: np.ndarray) -> int:
+    cell_codes = codes[board.ravel().astype(np.intp)]
+    return int(window_scores[cell_codes[windows].sum(axis=1)].sum())
+
+
+@kernel(_window_heuristic)
+def window_heuristic(board: np.ndarray, codes: np.ndarray, windows: np.ndarray, window_scores: np.ndarray) -> int:
+    """
+    Sums window_scores over the sum of the codes of the cells of every window,
+    `codes[piece]` being the code of a cell holding `piece`.
+    """
+    flat = board.ravel()
+    score = 0
+    for window in range(windows.shape[0]):
+        total = 0
+        for i in range(windows.shape[1]):
+            total += codes[int(flat[windows[window, i]])]
+        score += window_scores[total]
+    return score
+
+
+@kernel()
+def random_rollout(board: np.ndarray, player: int, last_row: int, last_col: int, n: int,
+                   randoms: np.ndarray) -> int:
+    """
+    Plays random moves on `board` (in place), where `player` made the last move
+    at (last_row, last_col) (last_row -1 if unknown), until the game ends.
+    The i-th move is drawn from the non-full columns with randoms[i] in [0, 1).
+    :return: the winner, or 0 for a draw
+    """
+    if last_row >= 0 and connected_at(board, last_row, last_col, player, n):
+        return player
+    current = player
+    for i in range(randoms.shape[0]):
+        columns = legal_columns(board)
+        if columns.shape[0] == 0:
+            return 0
+        current = 3 - current
+        col = columns[int(randoms[i] * columns.shape[0])]
+        row = drop_row(board, col)
+        board[row, col] = current
+        if connected_at(board, row, col, current, n):
+            return current
+    return 0
+
+
+def lines_through(boards: np.ndarray, rows: np.ndarray, cols: np.ndarray, player: int, n: int) -> np.ndarray:
+    """
+    For a stack of boards and one cell per board, returns which boards have
+    `n` pieces of `player` in a line through that cell.
+    """
+    n_boards, num_rows, num_columns = boards.shape
+    games = np.arange(n_boards)[:, None]
+    offsets = np.arange(-(n - 1), n)
+    won = np.zeros(n_boards, dtype=np.bool_)
+    for d_row, d_col in ((1, 0), (0, 1), (1, 1), (1, -1)):
+        line_rows = rows[:, None] + d_row * offsets
+        line_cols = cols[:, None] + d_col * offsets
+        inside = (line_rows >= 0) & (line_rows < num_rows) & (line_cols >= 0) & (line_cols < num_columns)
+        line = inside & (boards[games, np.clip(line_rows, 0, num_rows - 1),
+                                np.clip(line_cols, 0, num_columns - 1)] == player)
+        for start in range(n):
+            won |= line[:, start:start + n].all(axis=1)
+    return won
+
+
+def _random_rollouts(board: np.ndarray, player: int, n: int, randoms: np.ndarray):
+    n_games = randoms.shape[0]
+    num_rows, num_columns = board.shape
+    boards = np.repeat(board[None], n_games, axis=0)
+    heights = np.repeat(np.count_nonzero(board, axis=0)[None], n_games, axis=0)
+    winners = np.zeros(n_games, dtype=np.int8)
+    lengths = np.zeros(n_games, dtype=np.int64)
+    played = np.zeros((n_games, 3, num_columns), dtype=np.bool_)
+    playing = np.arange(n_games)
+    current = player
+    for i in range(randoms.shape[1]):
+        legal = heights[playing] < num_rows
+        n_legal = legal.sum(axis=1)
+        playing, legal, n_legal = playing[n_legal > 0], legal[n_legal > 0], n_legal[n_legal > 0]
+        if playing.size == 0:
+            break
+        current = 3 - current
+        # the k-th non-full column, as columns[k] in the kernel
+        k = (randoms[playing, i] * n_legal).astype(np.int64)
+        cols = (np.cumsum(legal, axis=1) > k[:, None]).argmax(axis=1)
+        rows = heights[playing, cols]
+        boards[playing, rows, cols] = current
+        heights[playing, cols] += 1
+        lengths[playing] = i + 1
+        played[playing, current, cols] = True
+        won = lines_through(boards[playing], rows, cols, current, n)
+        winners[playing[won]] = current
+        playing = playing[~won]
+    return winners, lengths, played
+
+
+@kernel(_random_rollouts)
+def random_rollouts(board: np.ndarray, player: int, n: int, randoms: np.ndarray):
+    """
+    Plays len(randoms) games of random moves from `board` (not modified),
+    where `player` made the last move, until they end. The i-th move of game
+    g is drawn from the non-full columns with randoms[g, i] in [0, 1), as in
+    random_rollout; randoms has a column per empty cell of `board`.
+    :return: the winner of every game (0 for a draw), its number of moves, and
+             played[g, p, col], whether player p played column col in game g
+    """
+    n_games = randoms.shape[0]
+    winners = np.zeros(n_games, dtype=np.int8)
+    lengths = np.zeros(n_games, dtype=np.int64)
+    played = np.zeros((n_games, 3, board.shape[1]), dtype=np.bool_)
+    for game in range(n_games):
+        game_board = board.copy()
+        current = player
+        for i in range(randoms.shape[1]):
+            columns = legal_columns(game_board)
+            if columns.shape[0] == 0:
+                break
+            current = 3 - current
+            col = columns[int(randoms[game, i] * columns.shape[0])]
+            row = drop_row(game_board, col)
+            game_board[row, col] = current
+            lengths[game] = i + 1
+            played[game, current, col] = True
+            if connected_at(game_board, row, col, current, n):
+                winners[game] = current
+                break
+    return winners, lengths, played
+
+
+def precompile():
+    """
+    Compiles (or loads from the cache) every kernel for int8 boards when the
+    JIT is enabled.
+    """
+    if not _jit_enabled:
+        return
+    board = np.zeros((6, 7), dtype=np.int8)
+    drop_row(board, 0)
+    legal_columns(board)
+    connected_at(board, 0, 0, 1, 4)
+    window_heuristic(board, np.zeros(3, dtype=np.intp), np.zeros((1, 4), dtype=np.intp),
+                     np.zeros(21, dtype=np.int64))
+    random_rollout(board, 1, -1, 0, 4, np.zeros(0))
+    random_rollouts(board, 1, 4, np.zeros((1, 0)))
@@ -0,0 +1,246 @@
+"""
+Game records: a compact binary file of complete games, written append-only
+and read with mmap.
+
+The file holds a header (MAGIC, version) followed by the records. A record
+is a RECORD struct (result, number of moves, length of the metadata), the
+moves packed 3 bits each, least significant bit first (MOVE_BITS, an
+illegal move being stored as ILLEGAL_MOVE), and the metadata, a JSON object
+in UTF-8 (empty for none). The result is the player who won, NO_PLAYER for a
+draw.
+
+The offsets of the records are appended to an index file next to it (see
+index_path), little-endian uint64. Readers open both files with mmap, so
+millions of games can be iterated or accessed at random without reading them
+into memory. A writer interrupted by a crash may leave a cut record or an
+index that does not match the records: the next writer truncates the cut
+record and rebuilds the index by scanning the records (see build_index), and
+readers rebuild an index that is missing or points past the records.
+"""
+import json
+import mmap
+import os
+import struct
+import numpy as np
+from typing import Iterator, Optional, Tuple
+from agents.common import BoardPiece
+
+MAGIC = b'C4GR'
+VERSION = 1
+HEADER = struct.Struct('<4sI')  # magic, version
+RECORD = struct.Struct('<bBH')  # result, number of moves, bytes of metadata
+MOVE_BITS = 3
+ILLEGAL_MOVE = (1 << MOVE_BITS) - 1
+BIT_VALUES = 1 << np.arange(MOVE_BITS)
+
+
+def index_path(path: str) -> str:
+    return path + '.idx'
+
+
+def pack_moves(moves: np.ndarray) -> bytes:
+    """
+    Packs columns 0 to 6 (or -1 for an illegal move) MOVE_BITS bits each.
+    """
+    codes = np.where(np.asarray(moves) < 0, ILLEGAL_MOVE, moves).astype(np.uint8)
+    return np.packbits((codes[:, None] & BIT_VALUES) != 0, bitorder='little').tobytes()
+
+
+def unpack_moves(data, n_moves: int, offset: int = 0) -> np.ndarray:
+    """
+    Unpacks `n_moves` moves packed by pack_moves from `data` at `offset`.
+    """
+    packed = np.frombuffer(data, dtype=np.uint8, count=packed_size(n_moves), offset=offset)
+    bits = np.unpackbits(packed, count=MOVE_BITS * n_moves, bitorder='little').reshape(n_moves, MOVE_BITS)
+    moves = (bits @ BIT_VALUES).astype(np.int8)
+    moves[moves == ILLEGAL_MOVE] = -1
+    return moves
+
+
+def packed_size(n_moves: int) -> int:
+    return (MOVE_BITS * n_moves + 7) // 8
+
+
+class RecordWriter:
+    """
+    Appends games to a record file, creating it if needed, and their offsets
+    to its index. Use it as a context manager or call close.
+    """
+
+    def __init__(self, path: str):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            _repair(path)
+        self._file = open(path, 'ab')
+        self._index = open(index_path(path), 'ab')
+        if new:
+            self._file.write(HEADER.pack(MAGIC, VERSION))
+            self._index.truncate(0)
+
+    def append(self, moves, result: BoardPiece, metadata: Optional[dict] = None):
+        """
+        Appends one game: its moves, the player who won (NO_PLAYER for a draw)
+        and a dict of metadata that JSON can encode.
+        """
+        moves = np.asarray(moves, dtype=np.int8)
+        encoded = json.dumps(metadata, separators=(',', ':')).encode() if metadata else b''
+        # packed first, so that a game that cannot be stored leaves the files unchanged
+        record = RECORD.pack(result, len(moves), len(encoded)) + pack_moves(moves) + encoded
+        offset = self._file.tell()
+        self._file.write(record)
+        self._index.write(np.array([offset], dtype='<u8').tobytes())
+
+    def append_games(self, moves: np.ndarray, lengths: np.ndarray, results: np.ndarray):
+        """
+        Appends games without metadata from an array of moves, a row per game
+        (see selfplay.play_batch), their number of moves and results.
+        """
+        n_games, max_moves = moves.shape
+        played = np.arange(max_moves) < lengths[:, None]
+        codes = np.where(played, np.where(moves < 0, ILLEGAL_MOVE, moves), 0).astype(np.uint8)
+        bits = ((codes[:, :, None] & BIT_VALUES) != 0).reshape(n_games, max_moves * MOVE_BITS)
+        packed = np.packbits(bits, axis=1, bitorder='little')
+        # the records side by side, the bytes past the end of every one masked out
+        headers = np.zeros(n_games, dtype=[('result', 'i1'), ('n_moves', 'u1'), ('n_metadata', '<u2')])
+        headers['result'], headers['n_moves'] = results, lengths
+        rows = np.concatenate((headers.view(np.uint8).reshape(n_games, RECORD.size), packed), axis=1)
+        sizes = RECORD.size + (MOVE_BITS * lengths + 7) // 8
+        offsets = self._file.tell() + np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        self._index.write(offsets.astype('<u8').tobytes())
+        self._file.write(rows[np.arange(rows.shape[1]) < sizes[:, None]].tobytes())
+
+    def flush(self):
+        self._file.flush()
+        self._index.flush()
+
+    def close(self):
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self) -> 'RecordWriter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _record_end(data, offset: int) -> Optional[int]:
+    """
+    Returns the end of the record at `offset` in `data`, None if it is cut.
+    """
+    if offset + RECORD.size > len(data):
+        return None
+    _, n_moves, n_metadata = RECORD.unpack_from(data, offset)
+    end = offset + RECORD.size + packed_size(n_moves) + n_metadata
+    return end if end <= len(data) else None
+
+
+def _repair(path: str):
+    """
+    Checks the header of the record file `path` and makes it and its index
+    end with the last complete record, as an interrupted writer may leave them.
+    """
+    with open(path, 'r+b') as file:
+        data = mmap.mmap(file.fileno(), 0)
+        try:
+            magic, version = HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'{path} is not a game record file of version {VERSION}')
+            offsets = np.zeros(0, dtype='<u8')
+            if os.path.exists(index_path(path)):
+                with open(index_path(path), 'rb') as index:
+                    raw = index.read()
+                # an offset cut by a crash is dropped, the records are then checked against the others
+                offsets = np.frombuffer(raw[:len(raw) - len(raw) % 8], dtype='<u8')
+            end = HEADER.size if len(offsets) == 0 else _record_end(data, int(offsets[-1]))
+            if end != len(data):
+                offsets = build_index(path)
+                end = HEADER.size if len(offsets) == 0 else _record_end(data, int(offsets[-1]))
+        finally:
+            data.close()
+        file.truncate(end)
+    with open(index_path(path), 'wb') as index:
+        index.write(offsets.tobytes())
+
+
+def build_index(path: str) -> np.ndarray:
+    """
+    Returns the offsets of the complete records of the file `path`, found by
+    scanning it.
+    """
+    offsets = []
+    with open(path, 'rb') as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        offset = HEADER.size
+        end = _record_end(data, offset)
+        while end is not None:
+            offsets.append(offset)
+            offset, end = end, _record_end(data, end)
+    finally:
+        data.close()
+    return np.array(offsets, dtype='<u8')
+
+
+class GameRecords:
+    """
+    Read-only view of a record file, see the module docstring. Games are
+    (moves, result, metadata) tuples, the metadata being None if there is none.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f'{path} is not a game record file of version {VERSION}')
+        self._index_mmap = None
+        if os.path.exists(index_path(path)) and os.path.getsize(index_path(path)) > 0:
+            with open(index_path(path), 'rb') as file:
+                self._index_mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.offsets = np.frombuffer(self._index_mmap, dtype='<u8', count=len(self._index_mmap) // 8)
+        else:
+            self.offsets = build_index(path)
+        if len(self.offsets) > 0 and _record_end(self._mmap, int(self.offsets[-1])) is None:
+            # the index points past the records, left by an interrupted writer
+            self.offsets = build_index(path)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, index: int) -> Tuple[np.ndarray, BoardPiece, Optional[dict]]:
+        offset = int(self.offsets[index])
+        result, n_moves, n_metadata = RECORD.unpack_from(self._mmap, offset)
+        offset += RECORD.size
+        moves = unpack_moves(self._mmap, n_moves, offset)
+        offset += packed_size(n_moves)
+        metadata = json.loads(self._mmap[offset:offset + n_metadata]) if n_metadata else None
+        return moves, BoardPiece(result), metadata
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, BoardPiece, Optional[dict]]]:
+        return (self[index] for index in range(len(self)))
+
+    def results(self) -> np.ndarray:
+        """
+        Returns the results of all the games.
+        """
+        return np.frombuffer(self._mmap, dtype=np.int8)[self.offsets.astype(np.int64)]
+
+    def lengths(self) -> np.ndarray:
+        """
+        Returns the number of moves of all the games.
+        """
+        return np.frombuffer(self._mmap, dtype=np.uint8)[self.offsets.astype(np.int64) + 1].astype(np.int64)
+
+    def close(self):
+        self.offsets = None
+        self._mmap.close()
+        if self._index_mmap is not None:
+            self._index_mmap.close()
+
+    def __enter__(self) -> 'GameRecords':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,187 @@
+"""
+Endgame tablebase: exact scores (see agents.agent_solver.solver.MIN_SCORE) and
+best moves of the positions with at most `max_empty` empty cells.
+
+Positions are looked up in a file in the opening book format (see
+agents.book), then in a cache of the positions solved last; positions in
+neither are solved on the spot within the time given, which is usually enough
+this late in the game, and added to the cache, the least recently used
+positions leaving it once it holds `cache_size`. A tablebase file can be
+generated from seed positions, or from a cache filled during play with
+Tablebase.save.
+
+The minimax and MCTS agents play the tablebase move once the board has at
+most `max_empty` empty cells, if the tablebase answers within TABLEBASE_SHARE
+of the budget of the move (see tablebase_move). The default tablebase solves
+positions on demand and reads the file at DEFAULT_TABLEBASE_PATH, or at the
+path in the environment variable CONNECT4_TABLEBASE, if there is one;
+set_tablebase replaces it. Generate a file with
+
+    python -m agents.tablebase --empty 10 --seeds 200 tablebase.bin
+"""
+import argparse
+import os
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+from agents.common import BoardPiece, HEIGHT, WIDTH, Position, mirror_move
+from agents.book import OpeningBook, write_book
+
+CELLS = WIDTH * HEIGHT
+TABLEBASE_EMPTY_CELLS = 12  # default largest number of empty cells of a tablebase position
+TABLEBASE_CACHE_SIZE = 1 << 16  # default number of solved positions kept by a tablebase
+TABLEBASE_SHARE = 0.5  # share of the budget of a move the agents let the tablebase spend solving
+TABLEBASE_TIME = 1.0  # seconds tablebase_move may spend solving a position when no budget is given
+TABLEBASE_ENV_VARIABLE = 'CONNECT4_TABLEBASE'
+DEFAULT_TABLEBASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebase.bin')
+
+
+class Tablebase:
+    """
+    Exact results of the positions with at most `max_empty` empty cells, read
+    from the file at `path` if given, or solved on demand and kept in a cache
+    of the `cache_size` positions used last (None for no limit).
+    """
+
+    def __init__(self, path: Optional[str] = None, max_empty: int = TABLEBASE_EMPTY_CELLS,
+                 cache_size: Optional[int] = TABLEBASE_CACHE_SIZE):
+        self.max_empty = max_empty
+        self.file = OpeningBook(path) if path is not None else None
+        self.cache_size = cache_size
+        # canonical key: (best move in the canonical position, score), the least recently used first
+        self.cache = OrderedDict()
+        self.table = None  # transposition table of the solver, shared by all lookups
+
+    def covers(self, position: Position) -> bool:
+        return CELLS - bin(position.mask).count('1') <= self.max_empty
+
+    def lookup(self, position: Position, time_budget: Optional[float] = None) -> Optional[Tuple[int, int]]:
+        """
+        Returns the best move and the exact score of `position` for the player
+        to move, or None if it has more than `max_empty` empty cells, is full,
+        or could not be solved within `time_budget` seconds (None for no limit).
+        """
+        if not self.covers(position) or position.is_full():
+            return None
+        if self.file is not None:
+            entry = self.file.lookup(position)
+            if entry is not None:
+                return entry
+        key, mirrored = position.canonical_key()
+        if key not in self.cache:
+            from agents.agent_solver.solver import Solver
+            from agents.agent_minimax.transposition import TranspositionTable
+
+            if self.table is None:
+                self.table = TranspositionTable()
+            deadline = time.monotonic() + time_budget if time_budget is not None else None
+            move, score, upper = Solver(self.table, deadline).solve(position.copy())
+            if score != upper:
+                return None
+            self.cache[key] = mirror_move(move, mirrored), score
+            if self.cache_size is not None and len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        self.cache.move_to_end(key)
+        move, score = self.cache[key]
+        return mirror_move(move, mirrored), score
+
+    def save(self, path: str):
+        """
+        Writes the positions of the file and of the cache to a tablebase file at `path`.
+        """
+        entries = dict(self.cache)
+        if self.file is not None:
+            entries.update(zip(self.file.keys.tolist(), zip(self.file.moves.tolist(), self.file.scores.tolist())))
+        write_book(path, entries)
+
+
+def build_tablebase(seeds: Iterable[Position], max_empty: int) -> Tablebase:
+    """
+    Solves every position reachable from the `seeds` with at most `max_empty`
+    empty cells and in which the game is not over. Seeds with more empty cells
+    are searched until they have `max_empty`, which is only affordable a few
+    moves above it.
+    """
+    tablebase = Tablebase(max_empty=max_empty, cache_size=None)
+    stack = [seed.copy() for seed in seeds]
+    while stack:
+        position = stack.pop()
+        if tablebase.covers(position):
+            if position.canonical_key()[0] in tablebase.cache or tablebase.lookup(position) is None:
+                continue
+        for col in position.legal_moves():
+            if position.is_winning_move(col):
+                continue
+            child = position.copy()
+            child.play(col)
+            stack.append(child)
+    return tablebase
+
+
+def random_seeds(n_seeds: int, max_empty: int, seed: Optional[int] = None) -> list:
+    """
+    Returns `n_seeds` positions with `max_empty` empty cells reached by random
+    moves that do not end the game.
+    """
+    rng = np.random.default_rng(seed)
+    seeds = []
+    while len(seeds) < n_seeds:
+        position = Position()
+        for _ in range(CELLS - max_empty):
+            moves = [col for col in position.legal_moves() if not position.is_winning_move(col)]
+            if not moves:
+                break
+            position.play(int(rng.choice(moves)))
+        else:
+            seeds.append(position)
+    return seeds
+
+
+_default_tablebase = None
+_default_tablebase_loaded = False
+
+
+def set_tablebase(tablebase: Optional[Tablebase]):
+    """
+    Replaces the tablebase consulted by tablebase_move, None disables it.
+    """
+    global _default_tablebase, _default_tablebase_loaded
+    _default_tablebase = tablebase
+    _default_tablebase_loaded = True
+
+
+def default_tablebase() -> Optional[Tablebase]:
+    """
+    Returns the tablebase consulted by tablebase_move, creating it on first use.
+    """
+    if not _default_tablebase_loaded:
+        path = os.environ.get(TABLEBASE_ENV_VARIABLE, DEFAULT_TABLEBASE_PATH)
+        set_tablebase(Tablebase(path if os.path.exists(path) else None))
+    return _default_tablebase
+
+
+def tablebase_move(board: np.ndarray, player: BoardPiece,
+                   time_budget: Optional[float] = TABLEBASE_TIME) -> Optional[int]:
+    """
+    Returns the best move of `player` on `board` if the default tablebase
+    covers it and answers within `time_budget` seconds, otherwise None.
+    """
+    tablebase = default_tablebase()
+    if tablebase is None:
+        return None
+    entry = tablebase.lookup(Position.from_board(board, player), time_budget)
+    return entry[0] if entry is not None else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds an endgame tablebase.')
+    parser.add_argument('output', nargs='?', default=DEFAULT_TABLEBASE_PATH)
+    parser.add_argument('--empty', type=int, default=TABLEBASE_EMPTY_CELLS,
+                        help='largest number of empty cells of the positions')
+    parser.add_argument('--seeds', type=int, default=100, help='number of random seed positions')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+    built = build_tablebase(random_seeds(args.seeds, args.empty, args.seed), args.empty)
+    built.save(args.output)
+    print(f'{len(built.cache)} positions written to {args.output}')
@@ -0,0 +1,148 @@
+"""
+Time management shared by the agents.
+
+A Clock times one search on the monotonic clock. Reading the clock is not free
+in the inner loop of a search, so `expired` reads it only every `stride` calls.
+
+A TimeManager sets the budget of every move of an agent in a game: at most a
+fixed time per move, and, with a game clock, a share of the remaining time.
+The remaining time is split over the moves the agent still has to play,
+weighted by the phase of the game (PHASE_WEIGHTS), so that the middle game,
+where the result is decided, gets more time than the opening and the endgame.
+Agents take a `time_manager` argument and keep it in their saved state for
+the rest of the game; forced moves (see Position.forced_move) are played
+without searching.
+"""
+import math
+import time
+import numpy as np
+from typing import Optional, Tuple
+from agents.common import NO_PLAYER, SavedState
+
+# plies at which the middle game and the endgame start
+PHASE_PLIES = (8, 26)
+PHASE_WEIGHTS = (0.6, 1.5, 0.8)  # opening, middle game, endgame
+RESERVE = 0.05  # fraction of the remaining game time never budgeted
+
+
+class Clock:
+    """
+    Time of one search with a budget of `budget` seconds (None for no limit).
+    """
+
+    def __init__(self, budget: Optional[float] = None, stride: int = 1):
+        self.start = time.monotonic()
+        self.deadline = self.start + budget if budget is not None else math.inf
+        self.stride = stride
+        self.ticks = 0
+        self.now = self.start  # time of the last reading of the clock
+
+    def expired(self) -> bool:
+        """
+        Returns True if the budget is spent, reading the clock every `stride` calls.
+        """
+        self.ticks += 1
+        if self.ticks % self.stride == 0:
+            self.now = time.monotonic()
+        return self.now > self.deadline
+
+    def read(self) -> bool:
+        """
+        Returns True if the last call to expired read the clock.
+        """
+        return self.ticks % self.stride == 0
+
+    def elapsed(self) -> float:
+        """
+        Seconds from the start to the last reading of the clock.
+        """
+        return self.now - self.start
+
+    def remaining(self) -> float:
+        """
+        Seconds left at the last reading of the clock.
+        """
+        return max(0.0, self.deadline - self.now)
+
+
+def phase_weight(ply: int, weights: Tuple[float, float, float] = PHASE_WEIGHTS) -> float:
+    """
+    Returns the weight of the move at `ply` (number of pieces on the board).
+    """
+    return weights[int(np.searchsorted(PHASE_PLIES, ply, side='right'))]
+
+
+class TimeManager:
+    """
+    Budget of the moves of one agent in one game: at most `move_time`
+    seconds per move, and with a game clock of `game_time` seconds, plus
+    `increment` seconds per move played, a share of the remaining time. Call
+    start before and stop after every move, so the game clock is charged.
+    """
+
+    def __init__(self, move_time: Optional[float] = None, game_time: Optional[float] = None,
+                 increment: float = 0.0, weights: Tuple[float, float, float] = PHASE_WEIGHTS):
+        if move_time is None and game_time is None:
+            raise ValueError('a move time or a game time is needed')
+        self.move_time = move_time
+        self.remaining = game_time
+        self.increment = increment
+        self.weights = weights
+        self.started = None
+
+    def budget(self, board: np.ndarray) -> float:
+        """
+        Returns the seconds to spend on the move to play on `board`.
+        """
+        budget = self.move_time if self.move_time is not None else math.inf
+        if self.remaining is not None:
+            empty = int(np.count_nonzero(board == NO_PLAYER))
+            ply = board.size - empty
+            # the agent plays every other ply until the board is full
+            future = sum(phase_weight(p, self.weights) for p in range(ply, board.size, 2))
+            available = self.remaining * (1 - RESERVE)
+            share = available * phase_weight(ply, self.weights) / future + self.increment
+            budget = min(budget, share, available)
+        return budget
+
+    def start(self, board: np.ndarray) -> float:
+        """
+        Starts the move to play on `board` and returns its budget.
+        """
+        self.started = time.monotonic()
+        return self.budget(board)
+
+    def stop(self):
+        """
+        Ends the move started last, charging its time to the game clock.
+        """
+        if self.started is None:
+            return
+        if self.remaining is not None:
+            self.remaining = max(0.0, self.remaining - (time.monotonic() - self.started)) + self.increment
+        self.started = None
+
+
+def move_budget(saved_state: SavedState, board: np.ndarray, time_budget: Optional[float],
+                time_manager: Optional[TimeManager], default: Optional[float]) -> Optional[float]:
+    """
+    Starts the move of an agent on `board` and returns its budget:
+    `time_budget` if given, otherwise the budget set by the time manager of
+    the agent, otherwise `default`. `time_manager`, if given, becomes the time
+    manager of the agent, kept in `saved_state.time_manager` for the next
+    moves. End the move with end_move.
+    """
+    if time_manager is not None:
+        saved_state.time_manager = time_manager
+    budget = default
+    if saved_state.time_manager is not None:
+        budget = saved_state.time_manager.start(board)
+    return time_budget if time_budget is not None else budget
+
+
+def end_move(saved_state: SavedState):
+    """
+    Ends the move started with move_budget, charging the game clock.
+    """
+    if saved_state.time_manager is not None:
+        saved_state.time_manager.stop()
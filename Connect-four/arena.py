@@ -0,0 +1,289 @@
+"""
+Headless arena: plays matches between registered agents in a process pool,
+without printing the boards, and summarizes them.
+
+    python arena.py minimax random --games 1000 --workers 4 --time-limit 0.5 --output results.c4r
+
+The agents alternate colors from game to game and every game seeds the
+global numpy random generator from the match seed, so a match is
+reproducible as long as the agents do not depend on the clock. Agents that
+accept a time budget get the per-move time limit; moves longer than the
+limit are counted (agents are not interrupted). An illegal move loses the
+game.
+"""
+import argparse
+import math
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+from agents.common import GenMove, PLAYER1, PLAYER2, NO_PLAYER, GameState, PlayerAction
+from agents.common import initialize_game_state, check_valid_action, apply_player_action, check_end_state
+from agents.records import RecordWriter, GameRecords, index_path
+
+TIME_LIMIT = 1.0  # default seconds per move
+Z_95 = 1.959964  # two-sided 95% quantile of the normal distribution
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+class Agent:
+    """
+    A registered agent: `generate_move` is called with `args` after the usual
+    arguments, and with the per-move time limit as keyword `budget_keyword`
+    if given.
+    """
+
+    def __init__(self, generate_move: GenMove, budget_keyword: Optional[str] = None, args: tuple = ()):
+        self.generate_move = generate_move
+        self.budget_keyword = budget_keyword
+        self.args = args
+
+    def __call__(self, board: np.ndarray, player, saved_state, time_limit: float):
+        kwargs = {self.budget_keyword: time_limit} if self.budget_keyword is not None else {}
+        return self.generate_move(board, player, saved_state, *self.args, **kwargs)
+
+
+AGENTS = {}
+
+
+def register_agent(name: str, generate_move: GenMove, budget_keyword: Optional[str] = None, args: tuple = ()):
+    """
+    Makes an agent available to the arena under `name`. Only the names of
+    the agents are sent to the worker processes, which look them up in their
+    own AGENTS: agents registered at run time are only found by workers
+    started by fork (the default on Linux), so register them at import time
+    of this module, or of a module it imports, to use another start method.
+    """
+    AGENTS[name] = Agent(generate_move, budget_keyword, args)
+
+
+def generate_move_MCTS_rave(board: np.ndarray, player, saved_state, time_budget: Optional[float] = None):
+    """
+    generate_move_MCTS with RAVE selection (see agents.agent_MCTS.tree.RAVE_EQUIVALENCE).
+    """
+    from agents.agent_MCTS.MCTS import generate_move_MCTS
+    from agents.agent_MCTS.tree import RAVE_EQUIVALENCE
+
+    return generate_move_MCTS(board, player, saved_state, time_budget=time_budget, rave_equivalence=RAVE_EQUIVALENCE)
+
+
+def generate_move_MCTS_win_block(board: np.ndarray, player, saved_state, time_budget: Optional[float] = None):
+    """
+    generate_move_MCTS with rollouts that win or block immediate wins (see
+    agents.agent_MCTS.rollout.win_block_policy).
+    """
+    from agents.agent_MCTS.MCTS import generate_move_MCTS
+    from agents.agent_MCTS.rollout import win_block_policy
+
+    return generate_move_MCTS(board, player, saved_state, time_budget=time_budget, rollout_policy=win_block_policy)
+
+
+def generate_move_MCTS_heuristic(board: np.ndarray, player, saved_state, time_budget: Optional[float] = None):
+    """
+    generate_move_MCTS with epsilon-greedy rollouts on the minimax heuristic
+    (see agents.agent_MCTS.rollout.HeuristicPolicy).
+    """
+    from agents.agent_MCTS.MCTS import generate_move_MCTS
+    from agents.agent_MCTS.rollout import HeuristicPolicy
+
+    return generate_move_MCTS(board, player, saved_state, time_budget=time_budget, rollout_policy=HeuristicPolicy())
+
+
+def _register_default_agents():
+    from agents.agent_random.random import generate_move_random
+    from agents.agent_minimax.minimax import generate_move_minimax
+    from agents.agent_solver.solver import generate_move_solver
+    from agents.agent_MCTS.MCTS import generate_move_MCTS
+
+    register_agent('random', generate_move_random)
+    register_agent('minimax', generate_move_minimax, 'time_budget')
+    register_agent('mcts', generate_move_MCTS, 'time_budget')
+    register_agent('mcts-rave', generate_move_MCTS_rave, 'time_budget')
+    register_agent('mcts-win-block', generate_move_MCTS_win_block, 'time_budget')
+    register_agent('mcts-heuristic', generate_move_MCTS_heuristic, 'time_budget')
+    register_agent('solver', generate_move_solver, 'time_budget')
+
+
+_register_default_agents()
+
+
+class GameRecord:
+    """
+    One game: the moves, the seconds spent on each, and in `winner` the index
+    (0 or 1) of the agent that won, -1 for a draw. `first` is the index of the
+    agent that played PLAYER1 and `forfeit` is True if the game was lost by an
+    illegal move (recorded as -1 if it is not a column).
+    """
+
+    def __init__(self, first: int):
+        self.first = first
+        self.moves = []
+        self.times = []
+        self.winner = -1  # -1 for a draw
+        self.forfeit = False
+
+
+def play_game(names: Tuple[str, str], first: int, seed: int, time_limit: float = TIME_LIMIT) -> GameRecord:
+    """
+    Plays one game between the agents `names`, agent `first` playing PLAYER1.
+    """
+    np.random.seed(seed)
+    record = GameRecord(first)
+    agents = [AGENTS[name] for name in names]
+    order = (first, 1 - first)
+    saved_states = [None, None]
+    board = initialize_game_state()
+    for ply in range(board.size):
+        index = order[ply % 2]
+        player = (PLAYER1, PLAYER2)[ply % 2]
+        start = time.perf_counter()
+        action, saved_states[index] = agents[index](board.copy(), player, saved_states[index], time_limit)
+        record.times.append(time.perf_counter() - start)
+        record.moves.append(int(action) if 0 <= action < board.shape[1] else -1)
+        if not 0 <= action < board.shape[1] or not check_valid_action(board, action):
+            record.winner, record.forfeit = 1 - index, True
+            return record
+        apply_player_action(board, PlayerAction(action), player)
+        end_state = check_end_state(board, player, action)
+        if end_state == GameState.IS_WIN:
+            record.winner = index
+            return record
+        if end_state == GameState.IS_DRAW:
+            return record
+    return record
+
+
+def _play_game(task: tuple) -> GameRecord:
+    return play_game(*task)
+
+
+def run_match(names: Tuple[str, str], n_games: int, n_workers: int = 1, seed: int = 0,
+              time_limit: float = TIME_LIMIT) -> list:
+    """
+    Plays `n_games` games between the agents `names`, alternating who plays
+    first, in `n_workers` processes.
+    :return: the GameRecord of every game, in order
+    """
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(n_games)]
+    tasks = [(tuple(names), game % 2, seeds[game], time_limit) for game in range(n_games)]
+    if n_workers <= 1:
+        return [_play_game(task) for task in tasks]
+    with ProcessPoolExecutor(n_workers) as pool:
+        return list(pool.map(_play_game, tasks, chunksize=max(1, n_games // (4 * n_workers))))
+
+
+def save_records(path: str, names: Tuple[str, str], records: list):
+    """
+    Writes the records to a game record file (see agents.records), replacing
+    it: the result of every game is the player who won, the names of the
+    agents, `first`, `forfeit` and the move times are in its metadata.
+    """
+    for file_path in (path, index_path(path)):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    with RecordWriter(path) as writer:
+        for record in records:
+            if record.winner == -1:
+                result = NO_PLAYER
+            else:
+                result = PLAYER1 if record.winner == record.first else PLAYER2
+            writer.append(record.moves, result, {'names': list(names), 'first': record.first,
+                                                 'forfeit': record.forfeit,
+                                                 'times': record.times})
+
+
+def load_records(path: str) -> Tuple[Tuple[str, str], list]:
+    """
+    Reads records written by save_records.
+    :return: the names of the agents and the GameRecords
+    """
+    names = ('', '')
+    records = []
+    with GameRecords(path) as games:
+        for moves, result, metadata in games:
+            names = tuple(metadata['names'])
+            record = GameRecord(metadata['first'])
+            if result != NO_PLAYER:
+                record.winner = record.first if result == PLAYER1 else 1 - record.first
+            record.forfeit = metadata['forfeit']
+            record.moves = moves.tolist()
+            record.times = metadata['times']
+            records.append(record)
+    return names, records
+
+
+def elo_difference(score: float) -> float:
+    """
+    Returns the Elo difference matching an expected `score` in [0, 1].
+    """
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def summarize(records: list, time_limit: Optional[float] = None) -> dict:
+    """
+    Summarizes a match from the point of view of agent 0: the wins, draws and
+    losses, its score (a draw counts half), the Elo difference with a 95%
+    confidence interval, and per agent the move time percentiles and the
+    number of moves over `time_limit`.
+    :raise ValueError: if there are no records
+    """
+    if not records:
+        raise ValueError('a match of no games cannot be summarized')
+    outcomes = np.array([1.0 if record.winner == 0 else 0.0 if record.winner == 1 else 0.5 for record in records])
+    score = float(outcomes.mean())
+    margin = Z_95 * float(outcomes.std(ddof=1)) / math.sqrt(len(outcomes)) if len(outcomes) > 1 else math.inf
+    summary = {
+        'games': len(records),
+        'wins': int(np.count_nonzero(outcomes == 1)),
+        'draws': int(np.count_nonzero(outcomes == 0.5)),
+        'losses': int(np.count_nonzero(outcomes == 0)),
+        'forfeits': sum(record.forfeit for record in records),
+        'score': score,
+        'elo': elo_difference(score),
+        'elo_interval': (elo_difference(score - margin), elo_difference(score + margin)),
+        'latency': [],
+    }
+    for agent in (0, 1):
+        # agent 0 plays the even plies of the games it starts and the odd ones of the others
+        times = np.array([t for record in records
+                          for t in record.times[int(record.first != agent)::2]])
+        latency = {f'p{p}': float(np.percentile(times, p)) for p in LATENCY_PERCENTILES} if times.size else {}
+        latency['max'] = float(times.max()) if times.size else 0.0
+        latency['over_limit'] = int(np.count_nonzero(times > time_limit)) if time_limit is not None else 0
+        summary['latency'].append(latency)
+    return summary
+
+
+def format_summary(names: Tuple[str, str], summary: dict) -> str:
+    lines = [
+        f"{names[0]} vs {names[1]}: {summary['games']} games, +{summary['wins']} ={summary['draws']} "
+        f"-{summary['losses']} ({summary['forfeits']} forfeits)",
+        f"score {summary['score']:.3f}, Elo {summary['elo']:+.0f} "
+        f"[{summary['elo_interval'][0]:+.0f}, {summary['elo_interval'][1]:+.0f}]",
+    ]
+    for name, latency in zip(names, summary['latency']):
+        percentiles = ' '.join(f'{key} {value * 1000:.1f}ms' for key, value in latency.items()
+                               if key.startswith('p') or key == 'max')
+        lines.append(f"{name}: {percentiles}, {latency['over_limit']} moves over the limit")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plays a match between two agents.')
+    parser.add_argument('agents', nargs=2, choices=sorted(AGENTS))
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--time-limit', type=float, default=TIME_LIMIT, help='seconds per move')
+    parser.add_argument('--output', help='file to write the game records to (see agents.records)')
+    args = parser.parse_args()
+    match_names = tuple(args.agents)
+    match_records = run_match(match_names, args.games, args.workers, args.seed, args.time_limit)
+    if args.output:
+        save_records(args.output, match_names, match_records)
+    print(format_summary(match_names, summarize(match_records, args.time_limit)))
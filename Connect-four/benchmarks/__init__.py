@@ -0,0 +1,8 @@
+"""
+Benchmark suite of the agents, run with
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --compare baseline.json
+
+See benchmarks.suite for the benchmarks and benchmarks.corpus for the positions.
+"""
@@ -0,0 +1,30 @@
+import argparse
+import json
+import sys
+from benchmarks.suite import run_benchmarks, compare, THRESHOLD
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Runs the benchmark suite.')
+    parser.add_argument('--output', help='file to write the results to (JSON)')
+    parser.add_argument('--compare', metavar='BASELINE', help='results (JSON) to compare with')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='relative slowdown reported as a regression')
+    parser.add_argument('--filter', help='only run the benchmarks whose name contains FILTER')
+    parser.add_argument('--quick', action='store_true', help='fewer and shorter runs')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.quick, args.filter)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare is None:
+        for name, entry in results['results'].items():
+            print(f"{name:60} {entry['value']:14.6g} {entry['unit']}")
+        sys.exit(0)
+
+    with open(args.compare) as file:
+        baseline = json.load(file)
+    rows = compare(baseline, results, args.threshold)
+    for name, old, new, change, regression in rows:
+        print(f"{name:60} {old:14.6g} {new:14.6g} {change:+7.1%}{'  REGRESSION' if regression else ''}")
+    sys.exit(1 if any(row[4] for row in rows) else 0)
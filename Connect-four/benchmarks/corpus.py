@@ -0,0 +1,31 @@
+"""
+Fixed positions the benchmarks run on, as the columns played from the empty
+board. None of them is over or has a win in one for the player to move.
+"""
+import numpy as np
+from typing import List, Tuple
+from agents.common import BoardPiece, PLAYER1, PLAYER2, initialize_game_state, apply_player_action
+
+CORPUS = {
+    'opening': ['', '1401', '2265'],
+    'midgame': ['1610214116536205', '0234010014324261', '6040021206300533'],
+    'endgame': ['444155321244111210462032200065', '206146632152220024301003441566',
+                '124151102502512660006106325366'],
+}
+
+
+def board_from_moves(moves: str) -> Tuple[np.ndarray, BoardPiece]:
+    """
+    Returns the board after playing the columns in `moves` and the player to move.
+    """
+    board = initialize_game_state()
+    for ply, column in enumerate(moves):
+        apply_player_action(board, int(column), (PLAYER1, PLAYER2)[ply % 2])
+    return board, (PLAYER1, PLAYER2)[len(moves) % 2]
+
+
+def positions(phase: str) -> List[Tuple[np.ndarray, BoardPiece]]:
+    """
+    Returns the boards of the corpus for `phase` with their player to move.
+    """
+    return [board_from_moves(moves) for moves in CORPUS[phase]]
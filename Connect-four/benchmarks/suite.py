@@ -0,0 +1,227 @@
+"""
+The benchmarks: microbenchmarks of the board primitives and throughput of
+the searches at a fixed depth, iteration count or time, on the positions of
+benchmarks.corpus.
+"""
+import math
+import platform
+import time
+import timeit
+import numpy as np
+from typing import Callable, Dict, Optional, Tuple
+from benchmarks.corpus import CORPUS, positions
+
+REPEAT = 5  # timing runs of a microbenchmark, the fastest is kept
+THRESHOLD = 0.1  # relative slowdown reported as a regression
+
+# a benchmark returns {name: result}, see result
+Benchmark = Callable[[bool], Dict[str, dict]]
+BENCHMARKS = []
+
+
+def benchmark(function: Benchmark) -> Benchmark:
+    """
+    Decorator adding a benchmark to the suite. It is called with `quick`, True
+    for fewer and shorter runs.
+    """
+    BENCHMARKS.append(function)
+    return function
+
+
+def result(value: float, unit: str, higher_is_better: bool) -> dict:
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def seconds_per_call(function: Callable[[], object], quick: bool = False) -> float:
+    """
+    Returns the seconds per call of `function`, the best of REPEAT runs of at
+    least 0.2 seconds each (see timeit.Timer.autorange).
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(2 if quick else REPEAT, number)) / number
+
+
+def _micro(name: str, function: Callable[[], object], quick: bool) -> Dict[str, dict]:
+    return {name: result(seconds_per_call(function, quick) * 1e9, 'ns/call', False)}
+
+
+@benchmark
+def primitives(quick: bool) -> Dict[str, dict]:
+    from agents.common import connected_four, apply_player_action, find_columns, Position, PLAYER1, PLAYER2
+    from agents.agent_minimax.minimax import heuristic
+
+    results = {}
+    for phase in ('opening', 'midgame', 'endgame'):
+        board, player = positions(phase)[-1]
+        last_player = PLAYER2 if player == PLAYER1 else PLAYER1
+        last_action = int(CORPUS[phase][-1][-1])
+        action = find_columns(board)[0]
+        results.update(_micro(f'connected_four/{phase}', lambda: connected_four(board, last_player), quick))
+        results.update(_micro(f'connected_four_last_action/{phase}',
+                              lambda: connected_four(board, last_player, last_action), quick))
+        results.update(_micro(f'apply_player_action/{phase}',
+                              lambda: apply_player_action(board, action, player, True), quick))
+        results.update(_micro(f'heuristic/{phase}', lambda: heuristic(board, player), quick))
+        position = Position.from_board(board, player)
+
+        def play_undo():
+            position.play(action)
+            position.undo()
+        results.update(_micro(f'position_play_undo/{phase}', play_undo, quick))
+    return results
+
+
+@benchmark
+def minimax_fixed_depth(quick: bool) -> Dict[str, dict]:
+    from agents.agent_minimax.minimax import minimax, Search
+
+    depth = 4 if quick else 6
+    results = {}
+    for phase in ('opening', 'midgame'):
+        nodes, elapsed = 0, 0.0
+        for board, player in positions(phase):
+            search = Search()
+            start = time.perf_counter()
+            minimax(board, depth, -math.inf, math.inf, player, True, search=search)
+            elapsed += time.perf_counter() - start
+            nodes += search.nodes
+        results[f'minimax_depth{depth}_nodes_per_second/{phase}'] = result(nodes / elapsed, 'nodes/s', True)
+        results[f'minimax_depth{depth}_seconds/{phase}'] = result(elapsed / len(positions(phase)), 's', False)
+    return results
+
+
+@benchmark
+def minimax_fixed_time(quick: bool) -> Dict[str, dict]:
+    from agents.agent_minimax.minimax import iterative_deepening
+
+    budget = 0.2 if quick else 1.0
+    results = {}
+    for phase in ('opening', 'midgame'):
+        depths = [iterative_deepening(board, player, budget)[2] for board, player in positions(phase)]
+        results[f'minimax_{budget}s_depth/{phase}'] = result(float(np.mean(depths)), 'plies', True)
+    return results
+
+
+def _mcts_search(board: np.ndarray, player, max_iterations: Optional[int],
+                 budget: Optional[float]) -> Tuple[float, int]:
+    """
+    Runs MCTS on a new tree of `board`, without stopping early.
+    :return: the seconds searched and the number of playouts
+    """
+    from agents.agent_MCTS import MCTS as MCTS_module
+    from agents.common import PLAYER1, PLAYER2
+    from agents.time_manager import Clock
+
+    saved = MCTS_module.PLAYER, MCTS_module.OPPONENT
+    MCTS_module.PLAYER, MCTS_module.OPPONENT = player, PLAYER2 if player == PLAYER1 else PLAYER1
+    try:
+        tree = MCTS_module.TreeStore(MCTS_module.OPPONENT, MCTS_module.distinct_moves_mask(board))
+        start = time.perf_counter()
+        MCTS_module.MCTS(board, tree, clock=Clock(budget), max_iterations=max_iterations, early_stop=False)
+        return time.perf_counter() - start, int(tree.visits[MCTS_module.ROOT])
+    finally:
+        MCTS_module.PLAYER, MCTS_module.OPPONENT = saved
+
+
+@benchmark
+def mcts_fixed_iterations(quick: bool) -> Dict[str, dict]:
+    itermax = 50 if quick else 500
+    results = {}
+    for phase in ('opening', 'midgame', 'endgame'):
+        elapsed, playouts = 0.0, 0
+        for board, player in positions(phase):
+            seconds, visits = _mcts_search(board, player, itermax, None)
+            elapsed += seconds
+            playouts += visits
+        results[f'mcts_{itermax}_iterations_playouts_per_second/{phase}'] = result(playouts / elapsed,
+                                                                                   'playouts/s', True)
+    return results
+
+
+@benchmark
+def mcts_fixed_time(quick: bool) -> Dict[str, dict]:
+    budget = 0.2 if quick else 1.0
+    results = {}
+    for phase in ('opening', 'midgame'):
+        visits = [_mcts_search(board, player, None, budget)[1] for board, player in positions(phase)]
+        results[f'mcts_{budget}s_playouts/{phase}'] = result(float(np.mean(visits)), 'playouts', True)
+    return results
+
+
+@benchmark
+def rollout_policies(quick: bool) -> Dict[str, dict]:
+    from agents.agent_MCTS.rollout import batch_rollout, random_policy, win_block_policy, HeuristicPolicy
+    from agents.common import PLAYER1, PLAYER2
+
+    n_games = 32
+    results = {}
+    for name, policy in (('random', random_policy), ('win_block', win_block_policy), ('heuristic', HeuristicPolicy())):
+        for phase in ('opening', 'midgame'):
+            games = [(board, PLAYER2 if player == PLAYER1 else PLAYER1) for board, player in positions(phase)]
+            seconds = seconds_per_call(lambda: [batch_rollout(board, last_player, None, n_games, policy=policy)
+                                                for board, last_player in games], quick)
+            results[f'rollout_{name}_playouts_per_second/{phase}'] = result(n_games * len(games) / seconds,
+                                                                            'playouts/s', True)
+    return results
+
+
+@benchmark
+def solver_endgame(quick: bool) -> Dict[str, dict]:
+    from agents.agent_solver.solver import Solver
+    from agents.common import Position
+
+    nodes, elapsed = 0, 0.0
+    for board, player in positions('endgame'):
+        solver = Solver()
+        start = time.perf_counter()
+        solver.solve(Position.from_board(board, player))
+        elapsed += time.perf_counter() - start
+        nodes += solver.nodes
+    return {
+        'solver_nodes_per_second/endgame': result(nodes / elapsed, 'nodes/s', True),
+        'solver_seconds/endgame': result(elapsed / len(positions('endgame')), 's', False),
+    }
+
+
+def environment() -> dict:
+    from agents.kernels import jit_enabled
+
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'jit': jit_enabled(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def run_benchmarks(quick: bool = False, name_filter: Optional[str] = None) -> dict:
+    """
+    Runs the benchmarks whose function name contains `name_filter` (all if None).
+    :return: {'environment': ..., 'results': {name: result}}, ready for JSON
+    """
+    results = {}
+    for function in BENCHMARKS:
+        if name_filter is None or name_filter in function.__name__:
+            results.update(function(quick))
+    return {'environment': environment(), 'results': results}
+
+
+def compare(baseline: dict, current: dict, threshold: float = THRESHOLD) -> list:
+    """
+    Compares the results present in both runs.
+    :return: (name, baseline value, current value, relative change, is a
+             regression) for every result, the change being positive when
+             the current run is better; a regression is worse by more than `threshold`
+    """
+    rows = []
+    for name, current_result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        old, new = baseline['results'][name]['value'], current_result['value']
+        change = (new - old) / old if old else 0.0
+        if not current_result['higher_is_better']:
+            change = -change
+        rows.append((name, old, new, change, change < -threshold))
+    return rows
@@ -7,6 +7,8 @@ import timeit
 # from agents.agent_minimax.minimax import generate_move_minimax
 # from agents.agent_random.random import generate_move_random
 from agents.agent_MCTS.MCTS import generate_move_MCTS
+from agents.kernels import precompile
+from agents.instrumentation import set_stats_callback, format_stats
 
 
 def user_move(board: np.ndarray, _player: BoardPiece, saved_state: Optional[SavedState]):
@@ -60,7 +62,7 @@ def human_vs_agent(
                 print(f"Move time: {time.time() - t0:.3f}s")
                 board, r_board = apply_player_action(board, action,
                                                      player, True)
-                end_state = check_end_state(board, player)
+                end_state = check_end_state(board, player, action)
                 if end_state != GameState.STILL_PLAYING:
                     print(pretty_print_board(board))
                     if end_state == GameState.IS_DRAW:
@@ -74,6 +76,8 @@ def human_vs_agent(
 
 
 if __name__ == "__main__":
+    precompile()
+    set_stats_callback(lambda agent, stats: print(format_stats(agent, stats)))
     # human_vs_agent(user_move)
     # human_vs_agent(generate_move_random)
     # human_vs_agent(generate_move_minimax)
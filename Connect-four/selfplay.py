@@ -0,0 +1,117 @@
+"""
+Self-play data generation: plays many games at once between two copies of a
+rollout policy (see agents.agent_MCTS.rollout) and writes them to a game
+record file (see agents.records).
+
+    python selfplay.py corpus.c4r --games 1000000 --policy win-block --workers 4
+
+The games of a batch advance in lockstep on an (n_games, 6, 7) board tensor
+and per-player bitboards: every ply the policy picks one column per game,
+the moves are applied in bulk and the wins detected on the bitboards. Every
+batch of `chunk_size` games is appended to the file as soon as it is played,
+so corpora larger than memory are streamed out. Batches are seeded from the
+seed of the run, so a corpus is reproducible.
+"""
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple
+from agents.common import PLAYER1, PLAYER2, NO_PLAYER, initialize_game_state, bitboards_have_four
+from agents.agent_MCTS.rollout import RolloutGames, RolloutPolicy, random_policy, win_block_policy, HeuristicPolicy
+from agents.records import RecordWriter, GameRecords
+
+CHUNK_SIZE = 10000  # games per batch
+POLICIES = {
+    'random': random_policy,
+    'win-block': win_block_policy,
+    'heuristic': HeuristicPolicy(),
+}
+
+
+def play_batch(n_games: int, policy: RolloutPolicy = win_block_policy) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Plays `n_games` games from the empty board, both players using `policy`.
+    :return: the moves (n_games, 42), -1 after the end of a game, the number
+             of moves of every game and its winner (NO_PLAYER for a draw)
+    """
+    board = initialize_game_state()
+    num_rows = board.shape[0]
+    games = RolloutGames(board, n_games, PLAYER1)
+    moves = np.full((n_games, board.size), -1, dtype=np.int8)
+    lengths = np.full(n_games, board.size, dtype=np.int64)
+    winners = np.full(n_games, NO_PLAYER, dtype=np.int8)
+    for ply in range(board.size):
+        games.current = PLAYER1 if ply % 2 == 0 else PLAYER2
+        # the games start together, so no game still being played is full before the last ply
+        legal = games.heights[games.playing] < num_rows
+        cols = policy(games, legal)
+        games.play(cols)
+        moves[games.playing, ply] = cols
+        won = bitboards_have_four(games.pieces[games.current, games.playing])
+        winners[games.playing[won]] = games.current
+        lengths[games.playing[won]] = ply + 1
+        games.playing = games.playing[~won]
+        if games.playing.size == 0:
+            break
+    return moves, lengths, winners
+
+
+def _play_chunk(task: tuple) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    n_games, policy, seed = task
+    np.random.seed(seed)
+    return play_batch(n_games, POLICIES[policy])
+
+
+def generate(path: str, n_games: int, policy: str = 'win-block', chunk_size: int = CHUNK_SIZE,
+             n_workers: int = 1, seed: int = 0):
+    """
+    Plays `n_games` games with the policy named `policy` (see POLICIES) in
+    batches of `chunk_size` games, in `n_workers` processes, appending them
+    in order to the game record file `path`.
+    """
+    sizes = [min(chunk_size, n_games - start) for start in range(0, n_games, chunk_size)]
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(len(sizes))]
+    tasks = [(size, policy, seeds[index]) for index, size in enumerate(sizes)]
+    with RecordWriter(path) as writer:
+        if n_workers <= 1:
+            for task in tasks:
+                writer.append_games(*_play_chunk(task))
+                writer.flush()
+            return
+        with ProcessPoolExecutor(n_workers) as pool:
+            for batch in pool.map(_play_chunk, tasks):
+                writer.append_games(*batch)
+                writer.flush()
+
+
+def summarize(path: str) -> dict:
+    """
+    Returns the number of games, the fraction won by each player and drawn,
+    and the mean number of moves of the games in the record file `path`.
+    """
+    with GameRecords(path) as games:
+        counts = np.bincount(games.results(), minlength=3)
+        total_moves = int(games.lengths().sum())
+    n_games = int(counts.sum())
+    return {
+        'games': n_games,
+        'player1': counts[PLAYER1] / n_games,
+        'player2': counts[PLAYER2] / n_games,
+        'draws': counts[NO_PLAYER] / n_games,
+        'mean_length': total_moves / n_games,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates self-play games.')
+    parser.add_argument('path', help='game record file to append the games to')
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='win-block')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.path, args.games, args.policy, args.chunk_size, args.workers, args.seed)
+    summary = summarize(args.path)
+    print(f"{summary['games']} games: player 1 {summary['player1']:.3f}, player 2 {summary['player2']:.3f}, "
+          f"draws {summary['draws']:.3f}, {summary['mean_length']:.1f} moves on average")
@@ -1,97 +1,395 @@
+import time
+import numpy as np
 from agents.common import (
     PlayerAction,
     PLAYER1,
+    PLAYER2,
     initialize_game_state,
-    connected_four
+    apply_player_action
 )
 
-from agents.agent_MCTS.MCTS import Node
+from agents.agent_MCTS.tree import TreeStore, ROOT, legal_moves_mask, distinct_moves_mask, RAVE_EQUIVALENCE
+from agents.agent_MCTS.rollout import (batch_rollout, connected_through, RolloutGames, random_policy, win_block_policy,
+                                       HeuristicPolicy)
 from agents.agent_MCTS.MCTS import (generate_move_MCTS,
                                     MCTS,
+                                    MCTSState,
+                                    tree_policy,
+                                    backpropagate,
+                                    decided,
                                     PLAYER)
+import agents.agent_MCTS.MCTS as MCTS_module
+from agents.time_manager import Clock, TimeManager
 
-# Nodes Functions
 
+def check_visits(tree: TreeStore, root_rollouts: int = 0, n_rollouts: int = MCTS_module.ROLLOUTS_PER_LEAF):
+    # every expanded node was visited by its own `n_rollouts` rollouts
+    # (`root_rollouts` for the root) and once per rollout below it
+    assert tree.visits[ROOT] == root_rollouts + sum(tree.visits[child] for child in tree.children(ROOT))
+    for node in range(1, tree.size):
+        if tree.first_child[node] >= 0:
+            assert tree.visits[node] == n_rollouts + sum(tree.visits[child] for child in tree.children(node))
+        assert abs(tree.wins[node]) <= tree.visits[node]
 
-def test_getMoves():
+
+def test_generate_move_MCTS():
     board = initialize_game_state()
-    current_node = Node(state=board, player=PLAYER1)
-    assert current_node.getMoves().shape[0] == 7
+    action, _ = generate_move_MCTS(board, PLAYER1, {})
+    assert type(action) == PlayerAction
 
 
-def test_selection():
+def test_tree_policy(monkeypatch):
+    monkeypatch.setattr(MCTS_module, 'PLAYER', PLAYER1)
+    monkeypatch.setattr(MCTS_module, 'OPPONENT', PLAYER2)
     board = initialize_game_state()
-    child_board01 = board.copy()
-    child_board01[0, 0] = PLAYER1
-    child_board02 = board.copy()
-    child_board02[0, 3] = PLAYER1
-    child_node01 = Node(state=child_board01, player=PLAYER1)
-    child_node02 = Node(state=child_board02, player=PLAYER1)
-    current_node = Node(state=board, player=PLAYER1)
-    current_node.visits = 100
-    child_node01.visits = 50
-    child_node02.visits = 40
-    child_node01.wins = 35
-    child_node02.wins = 25
-    children_array = [child_node01, child_node02]
-    current_node.childNodes = children_array
-    assert child_node01.__eq__(current_node.selection())
+    tree = TreeStore(PLAYER2, legal_moves_mask(board))
+
+    # expansion of the root
+    path, leaf_board = tree_policy(tree, board)
+    assert len(path) == 2 and path[0] == ROOT
+    assert np.count_nonzero(leaf_board) == 1
+    assert leaf_board[0, tree.move[path[1]]] == PLAYER1
+    assert np.count_nonzero(board) == 0
 
+    # backpropagate 3 draws, 5 wins of PLAYER1 and 2 of PLAYER2
+    backpropagate(tree, path, np.array([3, 5, 2]))
+    assert tree.visits[ROOT] == 10 and tree.wins[ROOT] == -3
+    assert tree.visits[path[1]] == 10 and tree.wins[path[1]] == 3
 
-def test_expand():
+    # selection goes down the tree once the root is fully expanded
+    for _ in range(6):
+        path, _ = tree_policy(tree, board)
+        backpropagate(tree, path, np.array([0, 0, 1]))
+    path, leaf_board = tree_policy(tree, board)
+    assert len(path) == 3
+    assert np.count_nonzero(leaf_board) == 2
+
+
+def test_batch_rollout():
     board = initialize_game_state()
-    current_node = Node(state=board, player=PLAYER1)
-    current_node.visits = 100
-    current_node.untriedMoves = [0, 5]
-    assert len(current_node.untriedMoves) == 2
-    assert len(current_node.childNodes) == 0
-    child_node = current_node.expand(5)
-    assert len(current_node.untriedMoves) == 1
-    assert len(current_node.childNodes) == 1
-    assert current_node.untriedMoves[0] == 0
-    assert child_node.__eq__(current_node.childNodes[0])
+    np.random.seed(0)
+    counts = batch_rollout(board, PLAYER2, None, 200)
+    assert counts.sum() == 200
+    assert counts[PLAYER1] > 0 and counts[PLAYER2] > 0
+
+    # PLAYER2 has just won
+    board[0:4, 6] = PLAYER2
+    lengths = np.zeros(board.size + 1, dtype=np.int64)
+    assert list(batch_rollout(board, PLAYER2, PlayerAction(6), 10, lengths)) == [0, 0, 10]
+    assert lengths[0] == 10 and lengths.sum() == 10
+
+    # only one cell left, filling it does not connect four
+    board = np.array([[2, 2, 1, 2, 1, 2, 1],
+                      [1, 1, 2, 2, 1, 1, 1],
+                      [2, 2, 1, 1, 2, 1, 2],
+                      [1, 1, 2, 1, 1, 2, 2],
+                      [1, 2, 1, 2, 2, 1, 1],
+                      [0, 2, 2, 1, 1, 2, 2]], dtype=np.int8)
+    lengths = np.zeros(board.size + 1, dtype=np.int64)
+    assert list(batch_rollout(board, PLAYER2, PlayerAction(6), 5, lengths)) == [5, 0, 0]
+    assert lengths[1] == 5 and lengths.sum() == 5
 
 
-def test_update():
+def test_batch_rollout_amaf():
     board = initialize_game_state()
-    current_node = Node(state=board, player=PLAYER1)
-    current_node.update(result=10)
-    assert current_node.wins == 10
-    assert current_node.visits == 1
+    np.random.seed(1)
+    amaf = np.zeros((2, 3, board.shape[1]), dtype=np.int64)
+    counts = batch_rollout(board, PLAYER2, None, 100, amaf=amaf)
+    # every player plays at least one column in every game
+    for player in (PLAYER1, PLAYER2):
+        assert (amaf[0, player] <= 100).all()
+        assert 100 <= amaf[0, player].sum()
+        assert (np.abs(amaf[1, player]) <= amaf[0, player]).all()
+    assert amaf[1, PLAYER1].sum() != 0
 
+    # one empty cell per column of 0 and 1: PLAYER1 plays one of them, PLAYER2 the other
+    board = np.array([[2, 2, 1, 2, 1, 2, 1],
+                      [1, 1, 2, 2, 1, 1, 1],
+                      [2, 2, 1, 1, 2, 1, 2],
+                      [1, 1, 2, 1, 1, 2, 2],
+                      [1, 2, 1, 2, 2, 1, 1],
+                      [0, 0, 2, 1, 1, 2, 2]], dtype=np.int8)
+    amaf = np.zeros((2, 3, board.shape[1]), dtype=np.int64)
+    counts = batch_rollout(board, PLAYER2, PlayerAction(6), 10, amaf=amaf)
+    assert counts.sum() == 10
+    assert amaf[0, PLAYER1, :2].sum() == amaf[0, PLAYER2, :2].sum() == 10
+    assert amaf[0, :, 2:].sum() == 0
 
-def test_generate_move_MCTS():
+
+def test_MCTS_rollouts_run_in_kernel(monkeypatch):
+    import agents.agent_MCTS.rollout as rollout_module
+
+    monkeypatch.setattr(MCTS_module, 'PLAYER', PLAYER1)
+    monkeypatch.setattr(MCTS_module, 'OPPONENT', PLAYER2)
+    calls = []
+
+    def random_rollouts(board, player, n, randoms):
+        calls.append(len(randoms))
+        return kernel(board, player, n, randoms)
+
+    kernel = rollout_module.random_rollouts
+    monkeypatch.setattr(rollout_module, 'random_rollouts', random_rollouts)
+    # the batches of the default search are played by the kernel
+    MCTS(initialize_game_state(), max_iterations=3, early_stop=False)
+    assert calls == [MCTS_module.ROLLOUTS_PER_LEAF] * 3
+
+
+def test_rollout_policies():
+    # PLAYER1 to move can win in column 3, PLAYER2 must block it
     board = initialize_game_state()
-    action, _ = generate_move_MCTS(board, PLAYER1, {})
-    assert type(action) == PlayerAction
+    board[0, 0:3] = PLAYER1
+    board[1, 0:2] = PLAYER2
+    board[0, 6] = PLAYER2
+    np.random.seed(2)
+    for policy in (win_block_policy, HeuristicPolicy(), HeuristicPolicy(epsilon=1.0)):
+        lengths = np.zeros(board.size + 1, dtype=np.int64)
+        assert list(batch_rollout(board, PLAYER2, PlayerAction(6), 20, lengths, policy=policy)) == [0, 20, 0]
+        assert lengths[1] == 20
+    games = RolloutGames(board, 20, PLAYER2)
+    legal = games.heights < board.shape[0]
+    assert (win_block_policy(games, legal) == 3).all()
+    assert (HeuristicPolicy()(games, legal) == 3).all()
+    assert (random_policy(games, legal) != 3).any()
+
+    # greedy on the heuristic, PLAYER1 takes the center
+    board = initialize_game_state()
+    games = RolloutGames(board, 5, PLAYER1)
+    assert (HeuristicPolicy(epsilon=0.0)(games, games.heights < board.shape[0]) == 3).all()
+
+    # the bitboards follow the boards
+    counts = batch_rollout(board, PLAYER2, None, 50, policy=win_block_policy)
+    assert counts.sum() == 50 and counts[PLAYER1] > 0 and counts[PLAYER2] > 0
+    games = RolloutGames(board, 3, PLAYER1)
+    rows = games.play(np.array([3, 3, 0]))
+    assert list(rows) == [0, 0, 0]
+    assert list(games.mask()) == [1 << 21, 1 << 21, 1]
+
+
+def test_connected_through():
+    boards = np.zeros((3, 6, 7), dtype=np.int8)
+    boards[0, 0, 1:5] = PLAYER1  # horizontal
+    boards[1, [0, 1, 2, 3], [3, 2, 1, 0]] = PLAYER1  # diagonal
+    boards[2, 0, [0, 1, 2, 4]] = PLAYER1  # gap
+    won = connected_through(boards, np.array([0, 1, 0]), np.array([4, 2, 4]), PLAYER1)
+    assert list(won) == [True, True, False]
+    assert not connected_through(boards, np.array([0, 1, 0]), np.array([4, 2, 4]), PLAYER2).any()
+
+
+def test_MCTS(monkeypatch):
+    monkeypatch.setattr(MCTS_module, 'PLAYER', PLAYER1)
+    monkeypatch.setattr(MCTS_module, 'OPPONENT', PLAYER2)
+    board = initialize_game_state()
+    board[0, 0:3] = PLAYER1
+    board[1, 0:2] = PLAYER2
+    board[0, 6] = PLAYER2
+
+    tree = TreeStore(PLAYER2, legal_moves_mask(board))
+    assert MCTS(board, tree, clock=Clock(0.3), early_stop=False) == 3
+    check_visits(tree)
+
+    # the search stops as soon as the winning move is found
+    tree = TreeStore(PLAYER2, legal_moves_mask(board))
+    clock = Clock(10.0)
+    assert MCTS(board, tree, clock=clock) == 3
+    assert clock.elapsed() < 5.0
+
+    # a fixed number of iterations
+    tree = TreeStore(PLAYER2, legal_moves_mask(board))
+    MCTS(board, tree, max_iterations=5, early_stop=False)
+    assert tree.visits[ROOT] == 5 * MCTS_module.ROLLOUTS_PER_LEAF
 
+    # a full tree is not expanded any further
+    tree = TreeStore(PLAYER2, legal_moves_mask(board), capacity=20)
+    MCTS(board, tree, clock=Clock(0.3), early_stop=False)
+    assert tree.size <= 20
+    assert tree.visits[ROOT] > 20
 
-def test_MCTS():
-    # Selection
+
+def test_MCTS_rave(monkeypatch):
+    monkeypatch.setattr(MCTS_module, 'PLAYER', PLAYER1)
+    monkeypatch.setattr(MCTS_module, 'OPPONENT', PLAYER2)
     board = initialize_game_state()
-    child_board = initialize_game_state()
-    child_board[0, 0] = PLAYER1
-    current_node = Node(state=board)
-    child_node = Node(state=child_board, parent=current_node)
-    current_node.untriedMoves = [0, 3, 4]
-    current_node.children = [child_node]
-    selected_node = Node.selection(current_node)
-    assert selected_node == current_node
-    # Expand
-    current_node.untriedMoves = [0, 3, 4]
-    explored_node = Node.expand(current_node)
-    assert len(current_node.untriedMoves) == 2
-    assert explored_node != current_node
-    # rollout
-    current_node = Node(state=board, player=PLAYER1)
-    won = connected_four(current_node.state, PLAYER1)
-    assert won
-    #backpropagate
-    Node.update(current_node, result=[-1, 1])
-    assert current_node.visits == 1
+    board[0, 0:3] = PLAYER1
+    board[1, 0:2] = PLAYER2
+    board[0, 6] = PLAYER2
+
+    tree = TreeStore(PLAYER2, legal_moves_mask(board), rave_equivalence=RAVE_EQUIVALENCE)
+    assert MCTS(board, tree, max_iterations=30, early_stop=False) == 3
+    check_visits(tree)
+    children = list(tree.children(ROOT))
+    assert (tree.amaf_visits[children] >= tree.visits[children]).all()
 
-    selectedColumn = MCTS(board)
-    assert selectedColumn
 
+def test_decided(monkeypatch):
+    monkeypatch.setattr(MCTS_module, 'PLAYER', PLAYER1)
+    monkeypatch.setattr(MCTS_module, 'OPPONENT', PLAYER2)
+    board = initialize_game_state()
+    clock = Clock(1.0)
+    clock.now = clock.start + 0.99
+    # the moves not visited yet may still become the move to play
+    tree = TreeStore(PLAYER2, legal_moves_mask(board))
+    tree.update(tree.path_to(tree.expand(ROOT, board.copy(), 3)), 60, PLAYER1, 100)
+    tree.update(tree.path_to(tree.expand(ROOT, board.copy(), 2)), 5, PLAYER1, 10)
+    assert not decided(tree, clock)
+
+    tree = TreeStore(PLAYER2, 0b1100)
+    first = tree.expand(ROOT, board.copy(), 3)
+    second = tree.expand(ROOT, board.copy(), 2)
+    tree.update(tree.path_to(first), 60, PLAYER1, 100)
+    tree.update(tree.path_to(second), 5, PLAYER1, 10)
+    clock.now = clock.start + 0.5  # 110 visits in 0.5s, 110 more to come
+    assert not decided(tree, clock)
+    # about 6 more to come: far fewer than the lead in visits, but enough
+    # for the win rate of the runner-up to overtake
+    clock.now = clock.start + 0.95
+    assert not decided(tree, clock)
+    clock.now = clock.start + 0.99  # about 1 more to come
+    assert decided(tree, clock)
+    # the move to play is the less visited one, with the best win rate
+    tree.update(tree.path_to(second), 10, PLAYER1, 10)
+    assert MCTS_module.select_move(MCTS_module.root_statistics(tree)) == 2
+    assert decided(tree, clock)
+    clock.now = clock.start + 0.9
+    assert not decided(tree, clock)
 
 
+def test_select_move_without_statistics():
+    board = initialize_game_state()
+    assert MCTS_module.select_move([]) == -1
+    assert MCTS_module.select_move([], board) == 3
+    board[:, 3] = PLAYER1
+    assert MCTS_module.select_move([], board) in (2, 4)
+
+
+def test_clock_stride(monkeypatch):
+    # NumPy rollouts take milliseconds, the clock is read after every batch
+    monkeypatch.setattr(MCTS_module, 'jit_enabled', lambda: False)
+    assert MCTS_module.clock_stride(MCTS_module.ROLLOUTS_PER_LEAF) == 1
+    monkeypatch.setattr(MCTS_module, 'jit_enabled', lambda: True)
+    assert MCTS_module.clock_stride(1) == MCTS_module.CLOCK_ROLLOUTS
+    assert MCTS_module.clock_stride(1, win_block_policy) == 1
+
+
+def test_generate_move_MCTS_forced():
+    board = initialize_game_state()
+    board[0, 0:3] = PLAYER1
+    board[1, 0:2] = PLAYER2
+    board[0, 6] = PLAYER2
+    action, saved_state = generate_move_MCTS(board, PLAYER1, None)
+    assert action == 3
+    assert saved_state.stats['source'] == 'forced'
+    assert saved_state.stats['seconds'] < 1.0
+
+
+def test_generate_move_MCTS_rollout_policy():
+    board = initialize_game_state()
+    apply_player_action(board, PlayerAction(3), PLAYER1)
+    apply_player_action(board, PlayerAction(2), PLAYER2)
+    action, saved_state = generate_move_MCTS(board, PLAYER1, None, time_budget=0.2,
+                                             rollout_policy=win_block_policy)
+    assert 0 <= action < board.shape[1]
+    assert saved_state.stats['source'] == 'search' and saved_state.stats['iterations'] > 0
+
+
+def test_generate_move_MCTS_time_manager():
+    board = initialize_game_state()
+    manager = TimeManager(game_time=2.0)
+    action, saved_state = generate_move_MCTS(board, PLAYER1, None, time_manager=manager)
+    assert saved_state.time_manager is manager
+    assert manager.remaining < 2.0
+    assert saved_state.stats['seconds'] <= 2.0 - manager.remaining + 0.01
+
+
+def test_tree_reuse():
+    board = initialize_game_state()
+    action, saved_state = generate_move_MCTS(board, PLAYER1, None, time_budget=0.5)
+    assert isinstance(saved_state, MCTSState)
+    tree = saved_state.tree
+    assert tree.move[ROOT] == action
+    assert tree.parent[ROOT] == -1
+    check_visits(tree, MCTS_module.ROLLOUTS_PER_LEAF)
+    apply_player_action(board, action, PLAYER1)
+
+    # the opponent replies with its most visited move, which is in the tree
+    reply = max(tree.children(ROOT), key=lambda child: tree.visits[child])
+    apply_player_action(board, tree.move[reply], PLAYER2)
+    visits = tree.visits[reply]
+    size = tree.size
+    subtree = saved_state.find_root(board)
+    # the subtree is compacted in place and handed over
+    assert subtree is tree
+    assert saved_state.tree is None
+    assert subtree.visits[ROOT] == visits
+    assert subtree.size < size
+    check_visits(subtree, MCTS_module.ROLLOUTS_PER_LEAF)
+
+    action, next_saved_state = generate_move_MCTS(board, PLAYER1, saved_state, time_budget=0.5)
+    assert next_saved_state is saved_state
+    assert saved_state.tree.move[ROOT] == action
+    assert saved_state.tree.player[ROOT] == PLAYER1
+
+
+def test_find_root_mirrored():
+    board = initialize_game_state()
+    apply_player_action(board, 3, PLAYER1)
+    saved_state = MCTSState(PLAYER1)
+    saved_state.board = board.copy()
+    saved_state.tree = TreeStore(PLAYER1, distinct_moves_mask(board))
+    child = saved_state.tree.expand(ROOT, board.copy(), 1)
+    saved_state.tree.update(saved_state.tree.path_to(child), 1, PLAYER2)
+
+    # only the replies 0 to 3 are in the tree, 5 is found as the mirror of 1
+    apply_player_action(board, 5, PLAYER2)
+    subtree = saved_state.find_root(board)
+    assert subtree.move[ROOT] == 5
+    assert subtree.visits[ROOT] == 1
+    assert subtree.untried[ROOT] == 0b1111111
+
+
+def test_generate_move_MCTS_parallel():
+    board = initialize_game_state()
+    board[0, 0:2] = PLAYER1
+    board[1, 0:2] = PLAYER2
+
+    action, saved_state = generate_move_MCTS(board, PLAYER1, None, n_workers=2, seed=0, time_budget=0.3)
+    assert 0 <= action < board.shape[1]
+    assert saved_state.tree is None
+    assert saved_state.stats['iterations'] > 0
+    # the pool is kept for the next move, whose budget includes getting the tasks to the workers
+    pool = MCTS_module.root_pool(2)
+    generate_move_MCTS(board, PLAYER1, None, n_workers=2, seed=0, time_budget=0.3)
+    assert MCTS_module.root_pool(2) is pool
+    start = time.monotonic()
+    MCTS_module.MCTS_root_parallel(board, 2, 0, budget=0.3)
+    assert time.monotonic() - start < 0.4
+
+    action, saved_state = generate_move_MCTS(board, PLAYER1, None, n_workers=2, seed=0, tree_parallel=True,
+                                             time_budget=0.3)
+    assert saved_state.tree.move[ROOT] == action
+
+
+def test_MCTS_tree_parallel(monkeypatch):
+    monkeypatch.setattr(MCTS_module, 'PLAYER', PLAYER1)
+    monkeypatch.setattr(MCTS_module, 'OPPONENT', PLAYER2)
+    board = initialize_game_state()
+    tree = TreeStore(PLAYER2, legal_moves_mask(board))
+    action = MCTS_module.MCTS_tree_parallel(board, 2, 0, tree, budget=0.3)
+    assert 0 <= action < board.shape[1]
+    # all virtual losses were taken back
+    check_visits(tree)
+
+
+def test_search_stats():
+    board = initialize_game_state()
+    board[0, 3] = PLAYER1
+    board[1, 3] = PLAYER2
+    _, saved_state = generate_move_MCTS(board, PLAYER1, None, time_budget=0.2)
+    stats = saved_state.stats
+    assert stats['source'] == 'search'
+    assert stats['iterations'] > 0
+    assert stats['rollouts'] == stats['iterations'] * MCTS_module.ROLLOUTS_PER_LEAF == sum(stats['rollout_lengths'])
+    assert stats['tree_size'] > 1
+    assert stats['max_depth'] >= 1
+    assert 0 < stats['mean_rollout_length'] <= 40
+    assert set(stats['phase_seconds']) == {'select', 'expand', 'rollout', 'backprop'}
+    assert 0 < sum(stats['phase_seconds'].values()) <= stats['seconds']
@@ -0,0 +1,87 @@
+import math
+import numpy as np
+import pytest
+from arena import (play_game, run_match, save_records, load_records, summarize, elo_difference, format_summary,
+                   register_agent, AGENTS, GameRecord)
+from agents.common import initialize_game_state, apply_player_action, check_end_state, GameState, PLAYER1, PLAYER2
+
+
+def first_column(board: np.ndarray, player, saved_state):
+    return 0, saved_state
+
+
+register_agent('first column', first_column)
+
+
+def test_play_game():
+    record = play_game(('random', 'random'), 0, seed=3)
+    assert len(record.moves) == len(record.times)
+    # replaying the moves gives the recorded result
+    board = initialize_game_state()
+    for ply, move in enumerate(record.moves):
+        player = (PLAYER1, PLAYER2)[ply % 2]
+        apply_player_action(board, move, player)
+        state = check_end_state(board, player, move)
+    if record.winner == -1:
+        assert state == GameState.IS_DRAW
+    else:
+        assert state == GameState.IS_WIN and record.winner == (len(record.moves) - 1) % 2
+
+    # the same seed plays the same game
+    assert play_game(('random', 'random'), 0, seed=3).moves == record.moves
+
+
+def test_play_game_forfeit():
+    # both agents fill column 0, the seventh piece is illegal
+    record = play_game(('first column', 'first column'), 1, seed=0)
+    assert record.forfeit
+    assert record.moves == [0] * 7
+    assert record.winner == 0  # agent 1 played first, and so the seventh move
+
+
+def test_run_match(tmp_path):
+    records = run_match(('random', 'first column'), 4, n_workers=2, seed=1)
+    assert [record.first for record in records] == [0, 1, 0, 1]
+    # the workers play the same games as a single process
+    assert [record.moves for record in records] == [record.moves for record in
+                                                    run_match(('random', 'first column'), 4, seed=1)]
+
+    path = str(tmp_path / 'results.c4r')
+    save_records(path, ('random', 'first column'), records)
+    names, loaded = load_records(path)
+    assert names == ('random', 'first column')
+    for record, loaded_record in zip(records, loaded):
+        assert loaded_record.first == record.first
+        assert loaded_record.winner == record.winner
+        assert loaded_record.moves == record.moves
+        assert np.allclose(loaded_record.times, record.times)
+
+
+def test_elo_difference():
+    assert elo_difference(0.5) == 0
+    assert math.isclose(elo_difference(0.75), 190.85, abs_tol=0.01)
+    assert math.isclose(elo_difference(0.25), -elo_difference(0.75))
+    assert elo_difference(1) == math.inf and elo_difference(0) == -math.inf
+
+
+def test_summarize():
+    records = []
+    for winner, first in ((0, 0), (0, 1), (-1, 0), (1, 1)):
+        record = GameRecord(first)
+        record.winner = winner
+        record.moves = [3, 3, 3]
+        record.times = [0.1, 0.2, 0.3]
+        records.append(record)
+    with pytest.raises(ValueError):
+        summarize([])
+    summary = summarize(records, time_limit=0.25)
+    assert (summary['wins'], summary['draws'], summary['losses']) == (2, 1, 1)
+    assert summary['score'] == 0.625
+    low, high = summary['elo_interval']
+    assert low < summary['elo'] < high
+    # agent 0 played plies 0 and 2 of the games it started and ply 1 of the others
+    assert summary['latency'][0]['max'] == 0.3
+    assert summary['latency'][0]['over_limit'] == 2
+    assert summary['latency'][1]['over_limit'] == 2
+    assert 'Elo' in format_summary(('a', 'b'), summary)
+    assert 'random' in AGENTS
@@ -0,0 +1,34 @@
+from benchmarks.corpus import CORPUS, positions, board_from_moves
+from benchmarks.suite import run_benchmarks, compare, result
+from agents.common import PLAYER1, PLAYER2, GameState, check_end_state, find_columns
+from agents.common import Position
+
+
+def test_corpus():
+    for phase, games in CORPUS.items():
+        for moves, (board, player) in zip(games, positions(phase)):
+            assert player == (PLAYER1, PLAYER2)[len(moves) % 2]
+            assert check_end_state(board, PLAYER1) == GameState.STILL_PLAYING
+            assert check_end_state(board, PLAYER2) == GameState.STILL_PLAYING
+            position = Position.from_board(board, player)
+            assert not any(position.is_winning_move(col) for col in find_columns(board))
+    board, player = board_from_moves('33')
+    assert board[0, 3] == PLAYER1 and board[1, 3] == PLAYER2 and player == PLAYER1
+
+
+def test_run_benchmarks():
+    run = run_benchmarks(quick=True, name_filter='solver')
+    assert set(run['results']) == {'solver_nodes_per_second/endgame', 'solver_seconds/endgame'}
+    assert all(entry['value'] > 0 for entry in run['results'].values())
+    assert 'python' in run['environment']
+
+
+def test_compare():
+    baseline = {'results': {'speed': result(100.0, 'nodes/s', True), 'latency': result(10.0, 's', False),
+                            'removed': result(1.0, 's', False)}}
+    current = {'results': {'speed': result(80.0, 'nodes/s', True), 'latency': result(9.0, 's', False),
+                           'added': result(1.0, 's', False)}}
+    rows = {row[0]: row for row in compare(baseline, current, threshold=0.1)}
+    assert set(rows) == {'speed', 'latency'}
+    assert rows['speed'][3] == -0.2 and rows['speed'][4]
+    assert abs(rows['latency'][3] - 0.1) < 1e-9 and not rows['latency'][4]
@@ -0,0 +1,72 @@
+import pytest
+from agents import book
+from agents.book import OpeningBook, build_book, write_book, minimax_evaluator, book_move, set_book
+from agents.common import PLAYER1, PLAYER2, Position, initialize_game_state, apply_player_action, mirror_move
+
+
+@pytest.fixture
+def restore_book():
+    saved = book._default_book, book._default_book_loaded
+    yield
+    book._default_book, book._default_book_loaded = saved
+
+
+def test_build_book():
+    entries = build_book(3, minimax_evaluator(2))
+    # 1 + 7 + 49 positions, 1 + 4 + 25 up to mirroring, none of them over
+    assert len(entries) == 30
+    assert entries[Position().key()][0] == 3
+    for move, score in entries.values():
+        assert 0 <= move < 7
+
+
+def test_write_and_lookup(tmp_path):
+    entries = {Position().key(): (3, 12)}
+    position = Position()
+    for action in (3, 2, 4):
+        position.play(action)
+        key, mirrored = position.canonical_key()
+        entries[key] = (mirror_move(action, mirrored), -action)
+    path = str(tmp_path / 'book.bin')
+    write_book(path, entries)
+
+    opening_book = OpeningBook(path)
+    assert len(opening_book) == 4
+    assert list(opening_book.keys) == sorted(opening_book.keys)
+    assert opening_book.lookup(Position()) == (3, 12)
+    assert opening_book.lookup(position) == (4, -4)
+    # the mirrored position shares the entry
+    mirrored = Position()
+    for action in (3, 4, 2):
+        mirrored.play(action)
+    assert opening_book.lookup(mirrored) == (2, -4)
+    position.play(0)
+    assert opening_book.lookup(position) is None
+
+
+def test_bad_file(tmp_path):
+    path = tmp_path / 'book.bin'
+    path.write_bytes(b'not a book at all')
+    with pytest.raises(ValueError):
+        OpeningBook(str(path))
+
+
+def test_agents_play_book_moves(tmp_path, restore_book):
+    from agents.agent_minimax.minimax import generate_move_minimax
+    from agents.agent_MCTS.MCTS import generate_move_MCTS
+    from agents.agent_solver.solver import generate_move_solver
+
+    board = initialize_game_state()
+    apply_player_action(board, 3, PLAYER1)
+    # a move no search would pick
+    path = str(tmp_path / 'book.bin')
+    write_book(path, {Position.from_board(board, PLAYER2).canonical_key()[0]: (0, 0)})
+    set_book(OpeningBook(path))
+
+    assert book_move(board, PLAYER2) == 0
+    assert book_move(initialize_game_state(), PLAYER1) is None
+    for generate_move in (generate_move_minimax, generate_move_MCTS, generate_move_solver):
+        assert generate_move(board, PLAYER2, None)[0] == 0
+
+    set_book(None)
+    assert book_move(board, PLAYER2) is None
@@ -289,4 +289,237 @@ def test_check_end_state():
             assert state == GameState.IS_WIN
 
     for player in players:
-        assert check_end_state(draw_state, player) == GameState.IS_DRAW
\ No newline at end of file
+        assert check_end_state(draw_state, player) == GameState.IS_DRAW
+
+
+def test_position_board_round_trip():
+    from agents.common import Position
+
+    for game_state in game_states:
+        position = Position.from_board(game_state)
+        assert (position.to_board() == game_state).all()
+    for end_game_state in end_game_states:
+        for game_state in end_game_state:
+            position = Position.from_board(game_state)
+            assert (position.to_board() == game_state).all()
+
+
+def test_position_play_undo():
+    from agents.common import Position, apply_player_action, find_columns
+
+    board = initialize_game_state()
+    for action, player in zip((3, 3, 4, 2), (PLAYER1, PLAYER2, PLAYER1, PLAYER2)):
+        apply_player_action(board, action, player)
+    position = Position.from_board(board, PLAYER1)
+    assert position.legal_moves() == find_columns(board)
+    pieces = list(position.pieces)
+
+    for action, player in zip((3, 3, 0), (PLAYER1, PLAYER2, PLAYER1)):
+        assert position.player == player
+        position.play(action)
+        board, _ = apply_player_action(board, action, player)
+        assert (position.to_board() == board).all()
+
+    for _ in range(3):
+        position.undo()
+    assert position.pieces == pieces
+    assert position.player == PLAYER1
+
+
+def test_position_legal_mask():
+    from agents.common import Position, HEIGHT, WIDTH
+
+    position = Position()
+    for _ in range(HEIGHT):
+        position.play(2)
+    assert position.column_height(2) == HEIGHT
+    assert position.column_height(3) == 0
+    assert not position.can_play(2)
+    assert 2 not in position.legal_moves()
+    assert bin(position.legal_mask()).count('1') == WIDTH - 1
+
+
+def test_position_is_win():
+    from agents.common import Position, connected_four
+
+    for end_game_state in end_game_states:
+        for index, player in enumerate(players):
+            position = Position.from_board(end_game_state[index])
+            assert position.is_win(player) == connected_four(end_game_state[index], player)
+
+    position = Position()
+    for action in (0, 1, 0, 1, 0, 1):
+        position.play(action)
+    assert position.is_winning_move(0)
+    assert not position.is_winning_move(2)
+    position.play(0)
+    assert position.is_win(PLAYER1)
+    assert not position.is_win(PLAYER2)
+    assert not Position.from_board(draw_state).is_win(PLAYER1)
+    assert Position.from_board(draw_state).is_full()
+
+
+def test_connected_four_last_action():
+    from agents.common import connected_four, check_end_state, apply_player_action, GameState
+
+    board = initialize_game_state()
+    moves = (3, 4, 4, 5, 5, 6, 5, 6, 6, 0, 6)  # PLAYER1 finishes the / diagonal at column 6
+    for turn, action in enumerate(moves):
+        player = players[turn % 2]
+        apply_player_action(board, action, player)
+        for check_player in players:
+            assert connected_four(board, check_player, action) == (
+                check_player == player and connected_four(board, check_player)
+            )
+    assert connected_four(board, PLAYER1, PlayerAction(6))
+    assert not connected_four(board, PLAYER2, PlayerAction(6))
+    assert check_end_state(board, PLAYER1, PlayerAction(6)) == GameState.IS_WIN
+
+    # vertical win through the top piece only
+    board = initialize_game_state()
+    for action, player in zip((0, 1, 0, 1, 0, 1, 0), (PLAYER1, PLAYER2) * 4):
+        apply_player_action(board, action, player)
+    assert connected_four(board, PLAYER1, PlayerAction(0))
+    assert not connected_four(board, PLAYER2, PlayerAction(1))
+
+
+def test_position_hash():
+    from agents.common import Position, apply_player_action
+
+    board = initialize_game_state()
+    position = Position()
+    hashes = [position.hash]
+    for turn, action in enumerate((3, 3, 2, 4, 4)):
+        position.play(action)
+        apply_player_action(board, action, players[turn % 2])
+        assert position.hash == Position.from_board(board).hash
+        assert position.hash not in hashes
+        hashes.append(position.hash)
+
+    for expected in reversed(hashes[:-1]):
+        position.undo()
+        assert position.hash == expected
+
+
+def test_winning_cells():
+    from agents.common import Position, winning_cells
+
+    position = Position()
+    for action in (1, 6, 2, 6, 3):
+        position.play(action)
+    # PLAYER1 holds columns 1 to 3 of the bottom row and wins in column 0 or 4
+    cells = winning_cells(position.pieces[0], position.mask)
+    assert cells == position.legal_mask() & (1 | 1 << 4 * 7)
+    assert winning_cells(position.pieces[1], position.mask) == 0
+
+
+def test_canonical_key():
+    from agents.common import Position, canonical_key, mirror_key, mirror_move
+
+    position, mirrored = Position(), Position()
+    for action in (0, 1, 1, 5):
+        position.play(action)
+        mirrored.play(mirror_move(action, True))
+    assert mirror_key(position.key()) == mirrored.key()
+    assert mirror_key(mirror_key(position.key())) == position.key()
+
+    key, is_mirrored = position.canonical_key()
+    mirrored_key, mirrored_is_mirrored = mirrored.canonical_key()
+    assert key == mirrored_key == min(position.key(), mirrored.key())
+    assert is_mirrored != mirrored_is_mirrored
+    assert canonical_key(position.to_board()) == (key, is_mirrored)
+    assert position.canonical_hash()[0] == mirrored.canonical_hash()[0]
+    assert not position.is_symmetric()
+
+    # a symmetric position is its own mirror
+    symmetric = Position()
+    for action in (3, 3, 2, 0, 4, 6):
+        symmetric.play(action)
+    assert symmetric.is_symmetric()
+    assert symmetric.canonical_key() == (symmetric.key(), False)
+    assert symmetric.hash == symmetric.mirror_hash
+    for _ in range(6):
+        symmetric.undo()
+    assert symmetric.hash == symmetric.mirror_hash == 0
+
+
+def test_forced_move():
+    from agents.common import Position
+
+    position = Position()
+    assert position.forced_move() is None
+    for action in (0, 6, 1, 6, 2):
+        position.play(action)
+    # PLAYER2 must block column 3
+    assert position.forced_move() == 3
+    position.play(5)
+    # PLAYER1 wins in column 3
+    assert position.forced_move() == 3
+
+    # two threats cannot both be blocked, nothing is forced
+    two_threats = Position()
+    for action in (1, 6, 2, 6, 3):
+        two_threats.play(action)
+    assert two_threats.forced_move() is None
+
+    # the only legal move
+    full = Position.from_board(np.array([[1, 2, 1, 2, 1, 2, 1]] * 2 + [[2, 1, 2, 1, 2, 1, 2]] * 2
+                                        + [[1, 2, 1, 2, 1, 2, 1], [2, 1, 2, 1, 2, 1, 0]], dtype=np.int8))
+    assert full.forced_move() == 6
+
+
+def test_bitboards_have_four():
+    from agents.common import bitboards_have_four, bitboard_has_four, Position
+
+    np.random.seed(0)
+    bitboards = np.array([Position.from_board(board).pieces[0] for board in
+                          (np.random.random((50, 6, 7)) < 0.4).astype(np.int8)], dtype=np.int64)
+    assert list(bitboards_have_four(bitboards)) == [bitboard_has_four(int(b)) for b in bitboards]
+    assert bitboards_have_four(bitboards).any() and not bitboards_have_four(bitboards).all()
+
+
+def test_game_config():
+    from agents.common import game_config, board_config, DEFAULT_CONFIG, COLUMN_BITS, BOARD_MASK, ZOBRIST_KEYS
+    import pytest
+
+    assert game_config() is game_config(6, 7, 4) is board_config(initialize_game_state()) is DEFAULT_CONFIG
+    assert DEFAULT_CONFIG.column_bits == COLUMN_BITS and DEFAULT_CONFIG.board_mask == BOARD_MASK
+    assert DEFAULT_CONFIG.zobrist_keys is ZOBRIST_KEYS
+    config = game_config(9, 9, 5)
+    assert initialize_game_state(config).shape == (9, 9)
+    assert not config.fits_int64 and not game_config(7, 8).fits_int64 and game_config(6, 8).fits_int64
+    with pytest.raises(ValueError):
+        game_config(6, 7, 8)
+
+
+def test_generic_configs():
+    from agents.common import (game_config, DEFAULT_CONFIG, bitboard_has_line, line_winning_cells, winning_cells,
+                               check_end_state, GameState, Position, connected_four)
+
+    rng = np.random.default_rng(5)
+    for config in (DEFAULT_CONFIG, game_config(7, 8), game_config(9, 9, 5), game_config(6, 7, 3), game_config(5, 5, 5)):
+        for _ in range(20):
+            position = Position(config=config)
+            board = initialize_game_state(config)
+            while not position.is_full():
+                action = int(rng.choice(position.legal_moves()))
+                player = position.player
+                winning_move = position.is_winning_move(action)
+                row = position.column_height(action)
+                position.play(action)
+                board[row, action] = player
+                state = check_end_state(board, player, PlayerAction(action), config)
+                assert (state == GameState.IS_WIN) == winning_move == position.is_win(player)
+                assert connected_four(board, player, config=config) == winning_move
+                assert (Position.from_board(board, config=config).to_board() == board).all()
+                if winning_move:
+                    break
+                # every empty cell completing a line, by trying them all
+                pieces = position.pieces[position.side]
+                cells = position.config.winning_cells(pieces, position.mask)
+                for bit in range(config.width * config.column_bits):
+                    if 1 << bit & config.board_mask & ~position.mask:
+                        assert bool(cells >> bit & 1) == bitboard_has_line(pieces | 1 << bit, config)
+            if config is DEFAULT_CONFIG:
+                for pieces in position.pieces:
+                    assert line_winning_cells(pieces, position.mask, config) == winning_cells(pieces, position.mask)
@@ -0,0 +1,27 @@
+import pstats
+from agents import instrumentation
+from agents.instrumentation import set_profile_path, profiling, profiling_enabled, format_stats
+
+
+def test_profiling(tmp_path):
+    path = str(tmp_path / 'profile.out')
+    saved = instrumentation._profile_path
+    set_profile_path(path)
+    try:
+        assert profiling_enabled()
+        with profiling():
+            with profiling():  # nested blocks are profiled once
+                sorted(range(1000))
+        with profiling():
+            sorted(range(10))
+    finally:
+        set_profile_path(saved)
+    calls = [stats[0] for function, stats in pstats.Stats(path).stats.items()
+             if function[2] == '<built-in method builtins.sorted>']
+    assert calls == [2]
+
+
+def test_format_stats():
+    line = format_stats('mcts', {'source': 'search', 'seconds': 0.25, 'rollout_lengths': [0, 1],
+                                 'phase_seconds': {'select': 0.1}})
+    assert line == 'mcts: source search, seconds 0.250, phase_seconds.select 0.100'
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from agents import kernels
+from agents.common import PLAYER1, PLAYER2, CONNECT_N, initialize_game_state, apply_player_action, find_columns
+
+
+def random_board(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    board = initialize_game_state()
+    for turn in range(rng.integers(0, 40)):
+        columns = find_columns(board)
+        if not columns:
+            break
+        apply_player_action(board, rng.choice(columns), (PLAYER1, PLAYER2)[turn % 2])
+    return board
+
+
+@pytest.fixture(params=[False, True], ids=['python', 'jit'])
+def jit(request):
+    if request.param:
+        pytest.importorskip('numba')
+    enabled = kernels.jit_enabled()
+    kernels.set_jit(request.param)
+    yield request.param
+    kernels.set_jit(enabled)
+
+
+def test_drop_row(jit):
+    board = initialize_game_state()
+    assert kernels.drop_row(board, 2) == 0
+    board[0:3, 2] = PLAYER1
+    assert kernels.drop_row(board, 2) == 3
+    board[:, 2] = PLAYER2
+    assert kernels.drop_row(board, 2) == -1
+
+
+def test_legal_columns(jit):
+    for seed in range(20):
+        board = random_board(seed)
+        expected = kernels.legal_columns.fallback(board)
+        assert list(kernels.legal_columns(board)) == list(expected)
+        assert list(kernels.legal_columns.source(board)) == list(expected)
+
+
+def test_connected_at(jit):
+    board = initialize_game_state()
+    board[0, 1:5] = PLAYER1
+    assert kernels.connected_at(board, 0, 4, PLAYER1, CONNECT_N)
+    assert not kernels.connected_at(board, 0, 4, PLAYER2, CONNECT_N)
+    board[0, 2] = PLAYER2
+    assert not kernels.connected_at(board, 0, 4, PLAYER1, CONNECT_N)
+
+
+def test_window_heuristic(jit):
+    from agents.agent_minimax.minimax import CELL_CODES, WINDOWS, WINDOW_SCORES
+
+    for seed in range(20):
+        board = random_board(seed)
+        for player in (PLAYER1, PLAYER2):
+            args = (board, CELL_CODES[player], WINDOWS, WINDOW_SCORES)
+            expected = kernels.window_heuristic.fallback(*args)
+            assert kernels.window_heuristic(*args) == expected
+            assert kernels.window_heuristic.source(*args) == expected
+
+
+def test_random_rollout(jit):
+    for seed in range(20):
+        board = random_board(seed)
+        randoms = np.random.default_rng(seed).random(board.size)
+        python_board = board.copy()
+        winner = kernels.random_rollout(board, PLAYER2, -1, 0, CONNECT_N, randoms)
+        assert winner == kernels.random_rollout.source(python_board, PLAYER2, -1, 0, CONNECT_N, randoms)
+        assert (board == python_board).all()
+
+
+def test_random_rollouts(jit):
+    for seed in range(20):
+        board = random_board(seed)
+        randoms = np.random.default_rng(seed).random((16, np.count_nonzero(board == 0)))
+        expected = kernels.random_rollouts.fallback(board, PLAYER2, CONNECT_N, randoms)
+        for result in (kernels.random_rollouts(board, PLAYER2, CONNECT_N, randoms),
+                       kernels.random_rollouts.source(board, PLAYER2, CONNECT_N, randoms)):
+            for array, expected_array in zip(result, expected):
+                assert (array == expected_array).all()
+        # every game is the game of random_rollout with the same random numbers
+        winners, lengths, played = expected
+        for game in range(len(randoms)):
+            game_board = board.copy()
+            assert winners[game] == kernels.random_rollout.source(game_board, PLAYER2, -1, 0, CONNECT_N,
+                                                                  randoms[game])
+            assert lengths[game] == np.count_nonzero(game_board) - np.count_nonzero(board)
+            for player in (PLAYER1, PLAYER2):
+                assert (played[game, player] == ((game_board != board) & (game_board == player)).any(axis=0)).all()
+
+
+def test_precompile(jit):
+    kernels.precompile()
+    assert kernels.jit_enabled() == jit
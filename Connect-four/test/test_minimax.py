@@ -4,16 +4,35 @@ import math
 from agents.agent_minimax.minimax import (
     minimax,
     heuristic,
+    heuristic_batch,
+    IncrementalHeuristic,
     Score_func,
-    generate_move_minimax
+    generate_move_minimax,
+    iterative_deepening,
+    ordered_moves,
+    center_first,
+    killers_first,
+    Search,
+    MinimaxState,
+    DEPTH
 )
-from agents.common import BoardPiece, PLAYER2, PLAYER1, NO_PLAYER, GameState, initialize_game_state
+from agents.agent_minimax.transposition import TranspositionTable
+from agents.common import (BoardPiece, PLAYER2, PLAYER1, NO_PLAYER, GameState, initialize_game_state, Position,
+                           apply_player_action, find_columns, check_end_state)
 
 
 def test_generate_move_minimax():
     board = initialize_game_state()
-    ret = generate_move_minimax(board, PLAYER1, board)
-    assert ret == (3, board)
+    action, saved_state = generate_move_minimax(board, PLAYER1, None)
+    assert action == 3
+    assert isinstance(saved_state, MinimaxState)
+
+    # the transposition table is kept for the next move
+    board[0, 3] = PLAYER1
+    board[1, 3] = PLAYER2
+    action, next_saved_state = generate_move_minimax(board, PLAYER1, saved_state)
+    assert next_saved_state is saved_state
+    assert board[board.shape[0] - 1, action] == NO_PLAYER
 
 
 def test_Score_func():
@@ -81,8 +100,230 @@ def test_heuristic():
     assert score == ret
 
 
+def loop_heuristic(board: np.ndarray, player: BoardPiece, n: int = 4) -> int:
+    # window by window scoring, as heuristic used to do it
+    num_rows, num_columns = board.shape
+    score = 3 * list(board[:, num_columns // 2]).count(player)
+    for row in range(num_rows):
+        for col in range(num_columns - n + 1):
+            score += Score_func(list(board[row, col:col + n]), player)
+    for col in range(num_columns):
+        for row in range(num_rows - n + 1):
+            score += Score_func(list(board[row:row + n, col]), player)
+    for row in range(num_rows - n + 1):
+        for col in range(num_columns - n + 1):
+            score += Score_func([board[row + i, col + i] for i in range(n)], player)
+            score += Score_func([board[row + n - 1 - i, col + i] for i in range(n)], player)
+    return score
+
+
+def random_boards(n_boards: int, seed: int = 0) -> List[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    boards = []
+    for _ in range(n_boards):
+        board = initialize_game_state()
+        for turn in range(rng.integers(0, 30)):
+            player = (PLAYER1, PLAYER2)[turn % 2]
+            action = rng.choice(find_columns(board))
+            apply_player_action(board, action, player)
+            if check_end_state(board, player, action) != GameState.STILL_PLAYING:
+                break
+        boards.append(board)
+    return boards
+
+
+def test_heuristic_matches_window_loop():
+    for board in random_boards(50):
+        for player in (PLAYER1, PLAYER2):
+            assert heuristic(board, player) == loop_heuristic(board, player)
+
+
+def test_heuristic_batch():
+    boards = random_boards(20, seed=1)
+    for player in (PLAYER1, PLAYER2):
+        scores = heuristic_batch(np.stack(boards), player)
+        assert scores.shape == (20,)
+        assert list(scores) == [heuristic(board, player) for board in boards]
+
+
+def test_incremental_heuristic():
+    rng = np.random.default_rng(2)
+    for board in random_boards(10, seed=3):
+        for player in (PLAYER1, PLAYER2):
+            board = board.copy()
+            evaluator = IncrementalHeuristic(board, player)
+            assert evaluator.score == loop_heuristic(board, player)
+            position = Position.from_board(board)
+            played = []
+            for _ in range(8):
+                moves = position.legal_moves()
+                if not moves:
+                    break
+                column = int(rng.choice(moves))
+                row = position.column_height(column)
+                evaluator.play(row, column, position.player)
+                board[row, column] = position.player
+                position.play(column)
+                played.append((row, column))
+                assert evaluator.score == heuristic(board, player) == loop_heuristic(board, player)
+            for row, column in reversed(played):
+                position.undo()
+                evaluator.undo(row, column, position.player)
+                board[row, column] = NO_PLAYER
+                assert evaluator.score == heuristic(board, player)
+
+
 def test_minimax():
     board = initialize_game_state()
 
     # center column 3 = first move
     assert minimax(board, 4, -math.inf, math.inf, PLAYER1, True) == (3, 6)
+
+
+def test_minimax_transposition_table():
+    board = initialize_game_state()
+    board[0, 2] = PLAYER1
+    board[0, 3] = PLAYER2
+    board[1, 3] = PLAYER1
+    board[0, 4] = PLAYER2
+    table = TranspositionTable(12)
+
+    expected = minimax(board, 4, -math.inf, math.inf, PLAYER1, True)
+    assert minimax(board, 4, -math.inf, math.inf, PLAYER1, True, table) == expected
+    # second search is answered from the table
+    hits = table.hits
+    assert minimax(board, 4, -math.inf, math.inf, PLAYER1, True, table) == expected
+    assert table.hits > hits
+
+
+def test_minimax_transposition_table_mirrored():
+    board = initialize_game_state()
+    board[0, 2] = PLAYER1
+    board[0, 3] = PLAYER2
+    board[1, 3] = PLAYER1
+    board[0, 5] = PLAYER2
+    table = TranspositionTable(12)
+    action, score = minimax(board, 4, -math.inf, math.inf, PLAYER1, True, table)
+
+    # the mirrored board is answered from the same entries, with mirrored moves
+    hits = table.hits
+    assert minimax(board[:, ::-1], 4, -math.inf, math.inf, PLAYER1, True, table) == (6 - action, score)
+    assert table.hits > hits
+
+
+def test_iterative_deepening():
+    import time
+
+    board = initialize_game_state()
+    start = time.monotonic()
+    action, score, depth = iterative_deepening(board, PLAYER1, 0.5)
+    assert time.monotonic() - start < 1.5
+    assert depth >= 4
+    assert board[board.shape[0] - 1, action] == NO_PLAYER
+
+    # a forced win stops the deepening
+    board[0, 0:3] = PLAYER1
+    board[1, 0:2] = PLAYER2
+    board[0, 5] = PLAYER2
+    action, score, depth = iterative_deepening(board, PLAYER1, 5.0)
+    assert action == 3
+    assert score == 10000000
+
+
+def test_generate_move_minimax_time_budget():
+    board = initialize_game_state()
+    action, saved_state = generate_move_minimax(board, PLAYER1, None, 0.2)
+    assert action == 3
+    assert isinstance(saved_state, MinimaxState)
+
+
+def test_ordered_moves():
+    position = Position()
+    search = Search(ordering=(center_first,))
+    assert ordered_moves(position, search) == [3, 2, 4, 1, 5, 0, 6]
+
+    search = Search()
+    search.killers[0] = [6, 0]
+    assert ordered_moves(position, search, 5)[:3] == [5, 6, 0]
+    search.pv = [1, 2]
+    assert ordered_moves(position, search, 5)[:4] == [1, 5, 6, 0]
+    search.ordering = (center_first, killers_first)
+    assert ordered_moves(position, search) == [6, 0, 3, 2, 4, 1, 5]
+
+
+def test_move_ordering_counters():
+    board = initialize_game_state()
+    unordered = Search(ordering=())
+    ordered = Search()
+    expected = minimax(board, 5, -math.inf, math.inf, PLAYER1, True, search=unordered)
+    assert minimax(board, 5, -math.inf, math.inf, PLAYER1, True, search=ordered) == expected
+    assert 0 < ordered.nodes < unordered.nodes
+    assert 0 < ordered.first_move_cutoffs <= ordered.cutoffs
+
+
+def test_search_stats():
+    from agents.instrumentation import set_stats_callback
+
+    board = initialize_game_state()
+    for ply, col in enumerate((3, 3, 2, 4, 2, 1, 5, 0)):
+        apply_player_action(board, col, (PLAYER1, PLAYER2)[ply % 2])
+    reported = []
+    set_stats_callback(lambda agent, stats: reported.append((agent, stats)))
+    try:
+        _, saved_state = generate_move_minimax(board, PLAYER1, None)
+    finally:
+        set_stats_callback(None)
+    stats = saved_state.stats
+    assert reported == [('minimax', stats)]
+    assert stats['source'] == 'search' and stats['depth'] == DEPTH
+    assert stats['nodes'] == saved_state.search.nodes
+    assert 0 < stats['leaf_evals'] < stats['nodes']
+    assert 0 < stats['first_move_cutoffs'] <= stats['cutoffs']
+    # the table was cleared of the hits of previous moves by new_search
+    assert 0 < stats['tt_hits'] == saved_state.table.hits
+    assert stats['seconds'] > 0
+
+    _, _, depth = iterative_deepening(board, PLAYER1, 0.2, search=saved_state.search)
+    assert saved_state.search.depth == depth
+
+
+def test_generate_move_minimax_time_manager():
+    from agents.time_manager import TimeManager
+
+    board = initialize_game_state()
+    manager = TimeManager(move_time=0.2, game_time=10.0)
+    action, saved_state = generate_move_minimax(board, PLAYER1, None, time_manager=manager)
+    assert saved_state.time_manager is manager
+    assert saved_state.stats['depth'] > DEPTH
+    assert 9.5 < manager.remaining < 10.0
+
+    # a forced move is played without searching
+    board[0, 0:3] = PLAYER2
+    board[1, 0:3] = PLAYER1
+    action, saved_state = generate_move_minimax(board, PLAYER1, saved_state)
+    assert action == 3
+    assert saved_state.stats['source'] == 'forced'
+
+
+def test_generate_move_minimax_config():
+    from agents.common import game_config, PlayerAction
+
+    config = game_config(9, 9, 5)
+    board = initialize_game_state(config)
+    for col in (2, 3, 4, 5):
+        apply_player_action(board, PlayerAction(col), PLAYER1)
+        apply_player_action(board, PlayerAction(col), PLAYER2)
+    # PLAYER1 connects five in the bottom row, on either side
+    assert generate_move_minimax(board, PLAYER1, None, config=config)[0] in (1, 6)
+    assert heuristic(board, PLAYER1, config) == loop_heuristic(board, PLAYER1, 5)
+
+    # connect five on 7x8, the depth-4 search sees the open four
+    config = game_config(7, 8, 5)
+    board = initialize_game_state(config)
+    for col in (2, 3, 4):
+        apply_player_action(board, PlayerAction(col), PLAYER1)
+    apply_player_action(board, PlayerAction(0), PLAYER2)
+    apply_player_action(board, PlayerAction(0), PLAYER2)
+    action, saved_state = generate_move_minimax(board, PLAYER2, None, config=config)
+    assert action in (1, 5)
+    assert saved_state.stats['source'] == 'search'
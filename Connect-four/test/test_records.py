@@ -0,0 +1,117 @@
+import os
+import struct
+import numpy as np
+import pytest
+from agents.records import (RecordWriter, GameRecords, pack_moves, unpack_moves, build_index, index_path,
+                            HEADER, RECORD)
+from agents.common import PLAYER1, PLAYER2, NO_PLAYER
+
+
+def test_pack_moves():
+    np.random.seed(0)
+    for n_moves in (0, 1, 7, 8, 42):
+        moves = np.random.randint(-1, 7, n_moves).astype(np.int8)
+        packed = pack_moves(moves)
+        assert len(packed) == (3 * n_moves + 7) // 8
+        assert (unpack_moves(packed, n_moves) == moves).all()
+
+
+def test_write_and_read(tmp_path):
+    path = str(tmp_path / 'games.c4r')
+    games = [([3, 3, 4], PLAYER1, None), ([], NO_PLAYER, {'names': ['a', 'b']}), ([6] * 41 + [-1], PLAYER2, None)]
+    with RecordWriter(path) as writer:
+        for moves, result, metadata in games[:2]:
+            writer.append(moves, result, metadata)
+    # reopening appends
+    with RecordWriter(path) as writer:
+        writer.append(*games[2])
+    assert os.path.getsize(path) == HEADER.size + 3 * RECORD.size + 2 + len('{"names":["a","b"]}') + 16
+
+    with GameRecords(path) as records:
+        assert len(records) == 3
+        for (moves, result, metadata), (expected_moves, expected_result, expected_metadata) in zip(records, games):
+            assert moves.tolist() == expected_moves
+            assert result == expected_result and metadata == expected_metadata
+        assert records[-1][0][-1] == -1
+        assert records.results().tolist() == [PLAYER1, NO_PLAYER, PLAYER2]
+        assert records.lengths().tolist() == [3, 0, 42]
+        assert (build_index(path) == records.offsets).all()
+
+    # without the index, the records are scanned
+    os.remove(index_path(path))
+    with GameRecords(path) as records:
+        assert records.results().tolist() == [PLAYER1, NO_PLAYER, PLAYER2]
+
+
+def test_append_games(tmp_path):
+    np.random.seed(1)
+    lengths = np.random.randint(0, 43, 100)
+    moves = np.random.randint(-1, 7, (100, 42)).astype(np.int8)
+    results = np.random.randint(0, 3, 100).astype(np.int8)
+    # the same file as appending the games one at a time
+    with RecordWriter(str(tmp_path / 'batch.c4r')) as writer:
+        writer.append_games(moves, lengths, results)
+    with RecordWriter(str(tmp_path / 'single.c4r')) as writer:
+        for game_moves, length, result in zip(moves, lengths, results):
+            writer.append(game_moves[:length], result)
+    for name in ('batch.c4r', 'batch.c4r.idx'):
+        with open(tmp_path / name, 'rb') as batch, open(tmp_path / name.replace('batch', 'single'), 'rb') as single:
+            assert batch.read() == single.read()
+
+
+def test_interrupted_writer(tmp_path):
+    path = str(tmp_path / 'games.c4r')
+    with RecordWriter(path) as writer:
+        writer.append([1, 2, 3], PLAYER1)
+        writer.append([4, 5], PLAYER2)
+    # the last record is cut, its offset was written
+    with open(path, 'r+b') as file:
+        file.truncate(os.path.getsize(path) - 1)
+    with GameRecords(path) as records:
+        assert len(records) == 1
+
+    # the next writer drops the cut record
+    with RecordWriter(path) as writer:
+        writer.append([0], NO_PLAYER)
+    with GameRecords(path) as records:
+        assert [moves.tolist() for moves, _, _ in records] == [[1, 2, 3], [0]]
+
+
+def test_failed_append(tmp_path):
+    path = str(tmp_path / 'games.c4r')
+    with RecordWriter(path) as writer:
+        writer.append([1, 2, 3], PLAYER1)
+        # the metadata does not fit in a record: neither the record nor its offset is written
+        with pytest.raises(struct.error):
+            writer.append([0], PLAYER2, {'comment': 'x' * 70000})
+        writer.append([4, 5], PLAYER2)
+    with GameRecords(path) as records:
+        assert [(moves.tolist(), result) for moves, result, _ in records] == [([1, 2, 3], PLAYER1),
+                                                                              ([4, 5], PLAYER2)]
+
+
+def test_reopen_header_only(tmp_path):
+    path = str(tmp_path / 'games.c4r')
+    RecordWriter(path).close()
+    os.remove(index_path(path))
+    with RecordWriter(path) as writer:
+        writer.append([4, 5], PLAYER2)
+    with GameRecords(path) as records:
+        assert len(records) == 1 and records[0][0].tolist() == [4, 5]
+    # an offset cut in the index
+    with open(index_path(path), 'ab') as index:
+        index.write(b'\0\0\0')
+    with RecordWriter(path) as writer:
+        writer.append([6], PLAYER1)
+    with GameRecords(path) as records:
+        assert [moves.tolist() for moves, _, _ in records] == [[4, 5], [6]]
+
+
+def test_not_a_record_file(tmp_path):
+    path = str(tmp_path / 'games.c4r')
+    with open(path, 'wb') as file:
+        file.write(b'not records')
+    with pytest.raises(ValueError):
+        GameRecords(path)
+    with pytest.raises(ValueError):
+        RecordWriter(path)
@@ -0,0 +1,52 @@
+import numpy as np
+from selfplay import play_batch, generate, summarize
+from agents.records import GameRecords
+from agents.common import (initialize_game_state, apply_player_action, check_end_state, GameState, PLAYER1, PLAYER2,
+                           NO_PLAYER, PlayerAction)
+from agents.agent_MCTS.rollout import random_policy, win_block_policy
+
+
+def replay(moves: np.ndarray, length: int):
+    # returns the winner of the game, NO_PLAYER for a draw
+    board = initialize_game_state()
+    for ply in range(length):
+        player = (PLAYER1, PLAYER2)[ply % 2]
+        apply_player_action(board, PlayerAction(moves[ply]), player)
+        state = check_end_state(board, player, PlayerAction(moves[ply]))
+        if state == GameState.IS_WIN:
+            assert ply == length - 1
+            return player
+    assert state == GameState.IS_DRAW or length < board.size
+    return NO_PLAYER
+
+
+def test_play_batch():
+    np.random.seed(0)
+    for policy in (random_policy, win_block_policy):
+        moves, lengths, winners = play_batch(200, policy)
+        assert moves.shape == (200, 42)
+        for game in range(200):
+            assert (moves[game, lengths[game]:] == -1).all()
+            assert replay(moves[game], lengths[game]) == winners[game]
+        assert (winners == PLAYER1).any() and (winners == PLAYER2).any()
+
+
+def test_generate(tmp_path):
+    path = str(tmp_path / 'games.c4r')
+    generate(path, 25, chunk_size=10, seed=3)
+    summary = summarize(path)
+    assert summary['games'] == 25
+    assert summary['player1'] + summary['player2'] + summary['draws'] == 1
+    with GameRecords(path) as games:
+        for moves, result, metadata in games:
+            assert replay(moves, len(moves)) == result and metadata is None
+        results = games.results()
+
+    # the same seed plays the same games, also in worker processes
+    other = str(tmp_path / 'other.c4r')
+    generate(other, 25, chunk_size=10, n_workers=2, seed=3)
+    with GameRecords(other) as games:
+        assert (games.results() == results).all()
+    # games are appended
+    generate(other, 5, seed=4)
+    assert summarize(other)['games'] == 30
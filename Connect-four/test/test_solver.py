@@ -0,0 +1,121 @@
+import time
+from typing import List
+import numpy as np
+import pytest
+from agents.agent_solver.solver import (
+    Solver,
+    SolverState,
+    generate_move_solver,
+    solve,
+    win_distance,
+    CELLS,
+    MIN_SCORE,
+    MAX_SCORE
+)
+from agents.agent_minimax.minimax import SearchTimeout
+from agents.common import PLAYER1, PLAYER2, NO_PLAYER, Position, initialize_game_state
+
+
+def exhaustive_score(position: Position, n_moves: int) -> int:
+    """
+    Score of `position` for the player to move by plain negamax, see MIN_SCORE.
+    """
+    moves = position.legal_moves()
+    if any(position.is_winning_move(col) for col in moves):
+        return (CELLS + 1 - n_moves) // 2
+    if not moves:
+        return 0
+    best = -CELLS
+    for col in moves:
+        position.play(col)
+        best = max(best, -exhaustive_score(position, n_moves + 1))
+        position.undo()
+    return best
+
+
+def random_endgames(n_positions: int, n_moves: int, seed: int = 0) -> List[Position]:
+    """
+    Positions with `n_moves` pieces reached by random moves that do not win.
+    """
+    rng = np.random.default_rng(seed)
+    positions = []
+    while len(positions) < n_positions:
+        position = Position()
+        for _ in range(n_moves):
+            moves = [col for col in position.legal_moves() if not position.is_winning_move(col)]
+            if not moves:
+                break
+            position.play(int(rng.choice(moves)))
+        else:
+            positions.append(Position.from_board(position.to_board()))
+    return positions
+
+
+def test_solve_matches_exhaustive_search():
+    for position in random_endgames(20, 32):
+        expected = exhaustive_score(position.copy(), 32)
+        move, lower, upper = Solver().solve(position)
+        assert lower == upper == expected
+        assert Solver().analyze(position)[move] == expected
+
+
+def test_solve_immediate_win():
+    board = initialize_game_state()
+    board[0:3, 2] = PLAYER1
+    board[0:2, 5] = PLAYER2
+    board[0, 6] = PLAYER2
+    assert solve(board, PLAYER1) == (2, (CELLS + 1 - 6) // 2)
+
+
+def test_analyze():
+    for position in random_endgames(5, 34, seed=1):
+        scores = Solver().analyze(position)
+        assert sorted(scores) == position.legal_moves()
+        for col, score in scores.items():
+            if position.is_winning_move(col):
+                assert score == (CELLS + 1 - 34) // 2
+            else:
+                position.play(col)
+                assert score == -exhaustive_score(position, 35)
+                position.undo()
+
+
+def test_win_distance():
+    assert win_distance(0, 10) is None
+    assert win_distance((CELLS + 1 - 30) // 2, 30) == 1
+    assert win_distance(-((CELLS - 30) // 2), 30) == 2
+    # the first player wins with the last piece but one
+    assert win_distance(1, 0) == CELLS - 1
+
+
+def test_solve_timeout():
+    with pytest.raises(SearchTimeout):
+        solve(initialize_game_state(), PLAYER1, time_budget=0.05)
+
+
+def test_generate_move_solver():
+    board = initialize_game_state()
+    board[0:3, 2] = PLAYER1
+    board[0:3, 4] = PLAYER2
+    action, saved_state = generate_move_solver(board, PLAYER1, None)
+    assert action == 2
+    assert isinstance(saved_state, SolverState)
+
+    # falls back to a legal move when the position cannot be solved in time
+    action, next_saved_state = generate_move_solver(initialize_game_state(), PLAYER1, saved_state, 0.05)
+    assert next_saved_state is saved_state
+    assert 0 <= action < 7 and board[board.shape[0] - 1, action] == NO_PLAYER
+
+    # the fallback search stays within the budget of the move
+    start = time.monotonic()
+    generate_move_solver(initialize_game_state(), PLAYER1, saved_state, 0.3)
+    assert time.monotonic() - start < 0.45
+
+
+def test_score_bounds():
+    # the bounds of an unsolved position never exceed the fastest wins of both players
+    _, lower, upper = Solver(deadline=time.monotonic()).solve(Position())
+    assert MIN_SCORE <= lower <= upper <= MAX_SCORE
+    for position in random_endgames(5, 32, seed=2):
+        _, lower, upper = Solver().solve(position)
+        assert MIN_SCORE <= lower == upper <= MAX_SCORE
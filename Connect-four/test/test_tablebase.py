@@ -0,0 +1,92 @@
+import pytest
+from agents import tablebase as tablebase_module
+from agents.tablebase import Tablebase, CELLS, build_tablebase, random_seeds, tablebase_move, set_tablebase
+from agents.agent_solver.solver import Solver
+from agents.common import Position, PLAYER1, initialize_game_state, mirror_move
+
+
+@pytest.fixture
+def restore_tablebase():
+    saved = tablebase_module._default_tablebase, tablebase_module._default_tablebase_loaded
+    yield
+    tablebase_module._default_tablebase, tablebase_module._default_tablebase_loaded = saved
+
+
+def mirrored(position: Position) -> Position:
+    """
+    Returns the left-right mirror of `position`, built by mirroring its moves.
+    """
+    moves = list(position.moves)
+    mirror = Position()
+    for action in moves:
+        mirror.play(mirror_move(action, True))
+    return mirror
+
+
+def test_lookup():
+    tablebase = Tablebase(max_empty=10)
+    for position in random_seeds(10, 10, seed=0):
+        move, score = tablebase.lookup(position)
+        assert Solver().analyze(position)[move] == score == Solver().solve(position)[1]
+        # the mirrored position is answered from the cache
+        assert tablebase.lookup(mirrored(position)) == (mirror_move(move, True), score)
+    assert len(tablebase.cache) == 10
+
+    assert tablebase.lookup(Position()) is None
+    assert tablebase.lookup(random_seeds(1, 11, seed=0)[0]) is None
+
+
+def test_build_and_save(tmp_path):
+    seeds = random_seeds(3, 6, seed=1)
+    built = build_tablebase(seeds, 6)
+    assert all(seed.canonical_key()[0] in built.cache for seed in seeds)
+    assert len(built.cache) > len(seeds)
+
+    path = str(tmp_path / 'tablebase.bin')
+    built.save(path)
+    loaded = Tablebase(path, max_empty=6)
+    assert len(loaded.file) == len(built.cache)
+    for seed in seeds:
+        assert loaded.lookup(seed) == built.lookup(seed)
+    assert not loaded.cache
+
+
+def test_agents_play_tablebase_moves(restore_tablebase):
+    from agents.agent_minimax.minimax import generate_move_minimax
+    from agents.agent_MCTS.MCTS import generate_move_MCTS
+
+    tablebase = Tablebase(max_empty=10)
+    set_tablebase(tablebase)
+    for position in random_seeds(3, 10, seed=2):
+        board = position.to_board()
+        player = position.player
+        expected = tablebase.lookup(position)[0]
+        assert tablebase_move(board, player) == expected
+        assert generate_move_minimax(board, player, None)[0] == expected
+        assert generate_move_MCTS(board, player, None)[0] == expected
+
+    assert tablebase_move(initialize_game_state(), PLAYER1) is None
+    set_tablebase(None)
+    assert tablebase_move(random_seeds(1, 10, seed=2)[0].to_board(), PLAYER1) is None
+
+
+def test_lookup_time_budget():
+    tablebase = Tablebase(max_empty=CELLS)
+    # not solved in time: no answer, and nothing cached
+    assert tablebase.lookup(Position(), time_budget=0.0) is None
+    assert not tablebase.cache
+    position = random_seeds(1, 10, seed=3)[0]
+    assert tablebase.lookup(position, time_budget=10.0) is not None
+
+
+def test_cache_size():
+    tablebase = Tablebase(max_empty=10, cache_size=3)
+    positions = random_seeds(5, 10, seed=4)
+    for position in positions[:3]:
+        tablebase.lookup(position)
+    # the first position is used again, so the second one leaves the cache first
+    tablebase.lookup(positions[0])
+    tablebase.lookup(positions[3])
+    assert len(tablebase.cache) == 3
+    assert positions[0].canonical_key()[0] in tablebase.cache
+    assert positions[1].canonical_key()[0] not in tablebase.cache
@@ -0,0 +1,80 @@
+import math
+import time
+import pytest
+from agents.common import initialize_game_state, SavedState, PLAYER1, PLAYER2
+from agents.time_manager import Clock, TimeManager, move_budget, end_move, phase_weight, PHASE_WEIGHTS, RESERVE
+
+
+def test_clock():
+    clock = Clock(0.05, stride=3)
+    time.sleep(0.06)
+    # the clock is read on every third call only
+    assert not clock.expired() and not clock.read()
+    assert not clock.expired()
+    assert clock.expired() and clock.read()
+    assert clock.elapsed() >= 0.05 and clock.remaining() == 0
+
+    clock = Clock()
+    assert not clock.expired() and clock.remaining() == math.inf
+
+
+def test_phase_weight():
+    assert phase_weight(0) == PHASE_WEIGHTS[0]
+    assert phase_weight(20) == PHASE_WEIGHTS[1]
+    assert phase_weight(40) == PHASE_WEIGHTS[2]
+
+
+def test_time_manager_budget():
+    board = initialize_game_state()
+    assert TimeManager(move_time=2.0).budget(board) == 2.0
+    with pytest.raises(ValueError):
+        TimeManager()
+
+    manager = TimeManager(game_time=60.0)
+    opening = manager.budget(board)
+    middle = initialize_game_state()
+    middle.flat[:20] = PLAYER1
+    assert manager.budget(middle) > opening
+
+    # spending every budget of a game never runs out of time
+    budgets = []
+    for ply in range(0, board.size, 2):
+        budgets.append(manager.budget(board))
+        # the reserve of the remaining time is never budgeted
+        assert budgets[-1] <= manager.remaining * (1 - RESERVE)
+        manager.remaining -= budgets[-1]
+        board.flat[ply:ply + 2] = (PLAYER1, PLAYER2)
+    assert manager.remaining > 0 and sum(budgets) < 60.0
+    assert max(budgets[:4]) < min(budgets[4:13])
+    assert TimeManager(move_time=0.5, game_time=60.0).budget(middle) == 0.5
+    # the increment does not eat into the reserve either
+    manager = TimeManager(game_time=1.0, increment=5.0)
+    assert manager.budget(middle) == pytest.approx(1.0 - RESERVE)
+
+
+def test_time_manager_charges_game_clock():
+    manager = TimeManager(game_time=10.0, increment=1.0)
+    board = initialize_game_state()
+    manager.start(board)
+    time.sleep(0.05)
+    manager.stop()
+    assert 10.9 < manager.remaining < 10.96
+    manager.stop()  # no move started
+    assert manager.remaining < 10.96
+
+
+def test_move_budget():
+    saved_state = SavedState()
+    saved_state.time_manager = None
+    board = initialize_game_state()
+    assert move_budget(saved_state, board, None, None, 3.0) == 3.0
+    assert move_budget(saved_state, board, 0.5, None, 3.0) == 0.5
+
+    manager = TimeManager(move_time=1.0, game_time=100.0)
+    assert move_budget(saved_state, board, None, manager, 3.0) == 1.0
+    end_move(saved_state)
+    # the time manager is kept for the next moves
+    assert saved_state.time_manager is manager
+    assert move_budget(saved_state, board, None, None, 3.0) == 1.0
+    end_move(saved_state)
+    assert manager.remaining < 100.0
@@ -0,0 +1,42 @@
+from agents.agent_minimax.transposition import (
+    TranspositionTable,
+    EXACT,
+    LOWER_BOUND,
+    UPPER_BOUND
+)
+
+
+def test_store_lookup():
+    table = TranspositionTable(4)
+    assert table.lookup(12345) is None
+
+    table.store(12345, 3, -42, LOWER_BOUND, 2)
+    assert table.lookup(12345) == (3, -42, LOWER_BOUND, 2)
+    assert table.hits == 1
+    table.new_search()
+    assert table.hits == 0
+
+    # same slot, different key
+    assert table.lookup(12345 + table.size) is None
+
+
+def test_replacement():
+    table = TranspositionTable(4)
+    key = 7
+    other_key = key + table.size
+
+    # a shallower result of the same search does not replace a deeper one
+    table.store(key, 5, 10, EXACT, 3)
+    table.store(other_key, 2, 20, UPPER_BOUND, 1)
+    assert table.lookup(key) == (5, 10, EXACT, 3)
+    assert table.lookup(other_key) is None
+
+    # entries of an older search are replaced
+    table.new_search()
+    assert table.lookup(key) == (5, 10, EXACT, 3)
+    table.store(other_key, 2, 20, UPPER_BOUND, 1)
+    assert table.lookup(other_key) == (2, 20, UPPER_BOUND, 1)
+    assert table.lookup(key) is None
+
+    table.clear()
+    assert table.lookup(other_key) is None
@@ -0,0 +1,158 @@
+import numpy as np
+from agents.common import PLAYER1, PLAYER2, WIDTH, initialize_game_state
+from agents.agent_MCTS.tree import TreeStore, ROOT, legal_moves_mask, distinct_moves_mask
+
+
+def test_legal_moves_mask():
+    board = initialize_game_state()
+    assert legal_moves_mask(board) == 0b1111111
+    board[:, 2] = PLAYER1
+    assert legal_moves_mask(board) == 0b1111011
+
+
+def test_distinct_moves_mask():
+    board = initialize_game_state()
+    assert distinct_moves_mask(board) == 0b0001111
+    board[0, 3] = PLAYER1
+    assert distinct_moves_mask(board) == 0b0001111
+    board[0, 2] = PLAYER2
+    assert distinct_moves_mask(board) == 0b1111111
+
+
+def test_expand():
+    board = initialize_game_state()
+    tree = TreeStore(PLAYER2, 0b100001)
+    assert tree.n_children[ROOT] == 0
+    child = tree.expand(ROOT, board, 5)
+    assert tree.n_children[ROOT] == 2
+    assert tree.untried[ROOT] == 0b000001
+    assert tree.move[child] == 5
+    assert tree.player[child] == PLAYER1
+    assert tree.parent[child] == ROOT
+    assert board[0, 5] == PLAYER1
+    assert tree.untried[child] == 0b1111111
+
+
+def test_expand_winning_move():
+    board = initialize_game_state()
+    board[0:3, 0] = PLAYER1
+    tree = TreeStore(PLAYER2, legal_moves_mask(board))
+    child = tree.expand(ROOT, board, 0)
+    assert tree.is_win[child]
+    assert tree.untried[child] == 0
+
+
+def test_selection():
+    board = initialize_game_state()
+    tree = TreeStore(PLAYER2, 0b1001)
+    first = tree.expand(ROOT, board.copy(), 0)
+    second = tree.expand(ROOT, board.copy(), 3)
+    tree.visits[ROOT] = 100
+    tree.visits[first], tree.wins[first] = 50, 35
+    tree.visits[second], tree.wins[second] = 40, 25
+    assert tree.selection(ROOT) == first
+
+
+def test_selection_rave():
+    board = initialize_game_state()
+    tree = TreeStore(PLAYER2, 0b1001, rave_equivalence=300)
+    first = tree.expand(ROOT, board.copy(), 0)
+    second = tree.expand(ROOT, board.copy(), 3)
+    tree.visits[ROOT] = 100
+    tree.visits[first], tree.wins[first] = 50, 35
+    tree.visits[second], tree.wins[second] = 40, 25
+    # the AMAF value of `second` outweighs the difference of the UCT values
+    tree.amaf_visits[first], tree.amaf_wins[first] = 200, 0
+    tree.amaf_visits[second], tree.amaf_wins[second] = 200, 180
+    assert tree.selection(ROOT) == second
+    tree.rave_equivalence = 0
+    assert tree.selection(ROOT) == first
+
+
+def test_update_amaf():
+    board = initialize_game_state()
+    tree = TreeStore(PLAYER2, legal_moves_mask(board))
+    child = tree.expand(ROOT, board, 3)
+    grandchild = tree.expand(child, board, 2)
+    # in the rollouts PLAYER1 played column 0 in 4 games (3 wins, 1 loss),
+    # PLAYER2 column 3 in 2 games (1 win), out of 8 games: 5 won by PLAYER1
+    amaf = np.zeros((2, 3, 7), dtype=np.int64)
+    amaf[:, PLAYER1, 0] = 4, 2
+    amaf[:, PLAYER2, 3] = 2, 1
+    counts = np.array([1, 5, 2])
+    tree.update_amaf(tree.path_to(grandchild), amaf, counts)
+
+    # children of the root, moved into by PLAYER1: column 3 was played in the path
+    root_children = {int(tree.move[c]): c for c in tree.children(ROOT)}
+    assert tree.amaf_visits[root_children[3]] == 8 and tree.amaf_wins[root_children[3]] == 3
+    assert tree.amaf_visits[root_children[0]] == 4 and tree.amaf_wins[root_children[0]] == 2
+    assert tree.amaf_visits[root_children[1]] == 0
+    # children of `child`, moved into by PLAYER2: column 2 was played in the path
+    children = {int(tree.move[c]): c for c in tree.children(child)}
+    assert tree.amaf_visits[children[2]] == 8 and tree.amaf_wins[children[2]] == -3
+    assert tree.amaf_visits[children[3]] == 2 and tree.amaf_wins[children[3]] == 1
+    assert tree.amaf_visits[children[0]] == 0
+
+
+def test_update():
+    board = initialize_game_state()
+    tree = TreeStore(PLAYER2, legal_moves_mask(board))
+    child = tree.expand(ROOT, board, 3)
+    tree.update(tree.path_to(child), 1, PLAYER1)
+    assert tree.visits[ROOT] == 1 and tree.visits[child] == 1
+    assert tree.wins[ROOT] == -1 and tree.wins[child] == 1
+
+    tree.add_virtual_loss([ROOT, child], 2)
+    assert tree.visits[child] == 3 and tree.wins[child] == -1
+    tree.add_virtual_loss([ROOT, child], -2)
+    assert tree.visits[child] == 1 and tree.wins[child] == 1
+
+
+def test_compact():
+    board = initialize_game_state()
+    tree = TreeStore(PLAYER2, legal_moves_mask(board))
+    other = tree.expand(ROOT, board.copy(), 0)
+    tree.expand(other, board.copy(), 0)
+    child_board = board.copy()
+    child = tree.expand(ROOT, child_board, 3)
+    # the board is symmetric, so only the moves 0 to 3 are in the tree
+    assert tree.untried[child] == 0b0001111
+    grandchild = tree.expand(child, child_board.copy(), 2)
+    tree.update(tree.path_to(grandchild), 1, PLAYER1)
+    great_grandchild = tree.expand(grandchild, child_board.copy(), 1)
+    untried = tree.untried[child]
+    grandchild_untried = tree.untried[grandchild]
+    n_children = tree.n_children[child]
+    size = tree.size
+    visits = tree.visits
+
+    tree.compact(child)
+    # the arrays are reused, the subtree is moved to their first slots
+    assert tree.visits is visits
+    assert tree.size == 1 + n_children + WIDTH
+    assert tree.move[ROOT] == 3
+    assert tree.parent[ROOT] == -1
+    assert tree.untried[ROOT] == untried
+    new_grandchild = next(c for c in tree.children(ROOT) if tree.move[c] == 2)
+    assert tree.parent[new_grandchild] == ROOT
+    assert tree.visits[new_grandchild] == 1
+    assert tree.wins[new_grandchild] == -1
+    assert tree.first_child[new_grandchild] == 1 + n_children
+    new_great_grandchild = next(c for c in tree.children(new_grandchild) if tree.move[c] == 1)
+    assert tree.path_to(new_great_grandchild) == [ROOT, new_grandchild, new_great_grandchild]
+    assert tree.untried[new_grandchild] == grandchild_untried
+    # the slots of the rest of the tree are free again
+    assert size > tree.size
+    assert (tree.visits[tree.size:size] == 0).all() and (tree.first_child[tree.size:size] == -1).all()
+    assert (tree.move[tree.size:size] == -1).all() and (tree.n_children[tree.size:size] == 0).all()
+
+
+def test_mirror():
+    board = initialize_game_state()
+    tree = TreeStore(PLAYER2, 0b0000011)
+    child = tree.expand(ROOT, board, 1)
+    tree.mirror()
+    assert tree.move[child] == 5
+    assert tree.move[ROOT] == -1
+    assert tree.untried[ROOT] == 0b1000000
+    assert tree.untried[child] == 0b1111111